@@ -1,24 +1,48 @@
 # Funcionamiento: El archivo principal de la aplicación.
 # 1. Crea la instancia de la aplicación Flask ('app').
 # 2. Configura claves secretas y la seguridad de las cookies.
-# 3. Establece cabeceras (headers) para evitar la caché.
-# 4. Llama a init_db() para conectar (y poblar) la BD.
+# 3. Establece cabeceras (headers) de caché: 'no-store' por defecto (respuestas con sesión o datos del usuario);
+#    las respuestas públicas (catálogo con ETag, imágenes, estáticos con huella) definen su propio caché.
+#    Si una respuesta usó datos antiguos porque Supabase no respondió, sale con 'X-Modo-Degradado' y sin caché.
+# 4. Llama a init_db() para conectar (y poblar) la BD, y a iniciar_invalidacion() para enterarse de los
+#    cambios hechos por otros procesos (ver persistencia/invalidacion.py).
 # 5. Importa todos los controladores (vistas/APIs) para que sus rutas queden registradas en la app.
 # 6. Corre el servidor en modo 'debug' si se ejecuta este archivo directamente.
 
 import os
 from flask import Flask
-from persistencia.base_datos import init_db
+from persistencia.base_datos import init_db, iniciar_invalidacion
+from persistencia.cache import modo_degradado, reiniciar_modo_degradado
+from utils.estaticos import registrar_estaticos
 
 
 app = Flask(__name__)
 app.secret_key = os.environ.get('SECRET_KEY', 'dev-secret-key')
 app.config.setdefault('SESSION_COOKIE_HTTPONLY', True)
 app.config.setdefault('SESSION_COOKIE_SAMESITE', 'Lax')
+# Tamaño máximo de una petición (subidas de imágenes incluidas); sobre esto Flask responde 413
+app.config['MAX_CONTENT_LENGTH'] = int(os.environ.get('MAX_CONTENT_LENGTH', 10 * 1024 * 1024))
+# Archivos estáticos con huella en la URL (caché de un año) y gzip precalculado (ver utils/estaticos.py)
+registrar_estaticos(app)
+
+
+@app.before_request
+def reset_degraded_mode():
+    reiniciar_modo_degradado()
 
 
 @app.after_request
 def harden_cache_headers(response):
+    # Respuesta armada con la última copia buena (o con datos/*.json) porque Supabase no respondió:
+    # se avisa con una cabecera y no se guarda en ningún caché
+    modo = modo_degradado()
+    if modo:
+        response.headers['X-Modo-Degradado'] = modo
+        response.cache_control.public = False
+    # Las respuestas marcadas como públicas (ej. imágenes de propiedades, catálogo con ETag,
+    # archivos estáticos) definen su propio caché
+    if response.cache_control.public:
+        return response
     response.headers['Cache-Control'] = 'no-store, no-cache, must-revalidate, max-age=0'
     response.headers['Pragma'] = 'no-cache'
     response.headers['Expires'] = '0'
@@ -30,9 +54,11 @@ from controladores import (
     auth_controller,
     usuario_controller,
     propiedad_controller,
-    vista_controller
+    vista_controller,
+    evento_controller
 )
 
 if __name__ == '__main__':
     init_db()
+    iniciar_invalidacion()
     app.run(debug=True)
@@ -105,8 +105,8 @@ def login():
     password = data.get('password', '').strip()
     tipo_enviado = (data.get('tipo_usuario') or '').strip().lower()
 
-    # Obtener usuario desde Supabase
-    user = obtener_usuario_por_email(email)
+    # Obtener usuario desde Supabase (solo las columnas necesarias para autenticar)
+    user = obtener_usuario_por_email(email, perfil="auth")
     if not user:
         return jsonify({"error": "Correo no encontrado."}), 400
 
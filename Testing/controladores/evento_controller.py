@@ -0,0 +1,26 @@
+from flask import request, jsonify, session, Response
+from app import app
+from servicios.eventos_service import abrir_flujo_eventos, REINTENTO_MS
+
+
+# Funcionamiento: Flujo de eventos del catálogo (Server-Sent Events) para los paneles y el mapa del comprador.
+# Cada escritura de propiedades (o de un usuario, que cambia el nombre del dueño) envía un evento 'cambios'
+# con los IDs actualizados y eliminados; con el 'id' del evento (versión del catálogo) el navegador se
+# reconecta con 'Last-Event-ID' sin perder cambios. 'desde' (parámetro) sirve para empezar desde la versión
+# con que se cargó la página. Compradores y visitantes solo ven propiedades activas, con un cupo de conexiones
+# propio y conexiones más cortas (cada una ocupa un worker mientras dura, ver servicios/eventos_service.py).
+# Retorna 503 (con Retry-After) si este proceso ya tiene el máximo de conexiones abiertas.
+@app.route('/api/eventos', methods=['GET'])
+def get_eventos():
+    desde = request.headers.get('Last-Event-ID') or request.args.get('desde') or None
+    flujo = abrir_flujo_eventos(session.get('user_role') if session.get('user_id') else None, desde)
+    if flujo is None:
+        response = jsonify({"error": "Demasiadas conexiones de eventos abiertas. Intenta más tarde."})
+        response.status_code = 503
+        response.headers['Retry-After'] = str(REINTENTO_MS // 1000)
+        return response
+
+    response = Response(flujo, mimetype='text/event-stream')
+    # Sin buffer en proxies (nginx) para que cada evento llegue apenas se envía
+    response.headers['X-Accel-Buffering'] = 'no'
+    return response
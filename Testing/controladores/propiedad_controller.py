@@ -1,34 +1,86 @@
-from flask import request, jsonify, session
+from flask import request, jsonify, session, redirect, Response
 from app import app
 from utils.decoradores import login_required
+from utils.cache_http import respuesta_catalogo
 from persistencia.base_datos import (
-    obtener_propiedades, obtener_propiedad_por_id,
+    obtener_propiedades, obtener_propiedad_por_id, version_catalogo,
     crear_propiedad, actualizar_propiedad as actualizar_propiedad_db,
     eliminar_propiedad as eliminar_propiedad_db
 )
 from servicios.propiedad_service import (
-    leer_propiedades, _validar_y_normalizar_propiedad, _es_admin
+    leer_pagina_propiedades, leer_cambios_propiedades, leer_marcadores_mapa, _validar_y_normalizar_propiedad,
+    _es_admin
 )
-from servicios.usuario_service import leer_usuarios
+from servicios.imagen_service import (
+    fuentes_imagenes, es_externa, huella_fuente, decodificar_imagen, guardar_imagen_subida, leer_variante
+)
+from servicios.derivados_service import VARIANTES, encolar_variantes
 from httpx import TimeoutException
+from werkzeug.exceptions import RequestEntityTooLarge
 
-# Funcionamiento: Obtiene todas las propiedades y usuarios.
-# Crea un mapa de IDs de usuario a nombres completos.
-# "Enriquece" cada propiedad agregando el nombre del propietario ('propietario_nombre').
-# Retorna la lista de propiedades enriquecidas en JSON.
+# Funcionamiento: Obtiene una página de propiedades (campos del perfil 'card', sin la imagen), ordenadas por ID.
+# Acepta los mismos filtros del catálogo como parámetros (q, tipo, estado, propietario, min_/max_..., y
+# lat/lng con radio_km y orden=distancia; en ese caso cada propiedad trae 'distancia_km').
+# Paginación por cursor: 'limit' (por defecto 50, máximo 200), 'cursor' (el 'next_cursor' de la página anterior)
+# y 'fields' para pedir solo algunos campos (ej. fields=nombre,precio,propietario_nombre).
+# Retorna {"propiedades": [...], "total": n, "limit": l, "next_cursor": ..., "version": ...} en JSON,
+# con ETag (304 si el cliente ya tiene esta versión). Si un parámetro no es válido retorna 400.
 @app.route('/api/propiedades', methods=['GET'])
 def get_propiedades():
-    propiedades = leer_propiedades()
-    usuarios = leer_usuarios()
-    nombres = {u.get('id'): f"{u.get('nombre','').strip()} {u.get('apellido','').strip()}".strip() for u in usuarios}
-    propiedades_enriquecidas = []
-    for p in propiedades:
-        copia = p.copy()
-        prop_id = copia.get('propietario')
-        nombre = nombres.get(prop_id)
-        copia['propietario_nombre'] = nombre if nombre else None
-        propiedades_enriquecidas.append(copia)
-    return jsonify(propiedades_enriquecidas)
+    return respuesta_catalogo(_pagina_propiedades)
+
+
+# Funcionamiento: Función interna (helper) de get_propiedades: arma la respuesta (o el error 400/504).
+def _pagina_propiedades():
+    try:
+        return jsonify(leer_pagina_propiedades(request.args))
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    except TimeoutException:
+        print(f"ERROR: Timeout en la ruta {request.path}")
+        return jsonify({"error": "La base de datos tardó demasiado en responder (Timeout)."}), 504
+
+
+# Funcionamiento: Cambios del catálogo (sincronización incremental de los paneles).
+# Recibe 'desde' = la versión que el cliente ya tiene (campo 'version' de GET /api/propiedades o de una escritura).
+# Retorna {"version", "reiniciar", "propiedades", "eliminadas"}: solo las propiedades creadas/editadas
+# desde esa versión (mismos campos que GET /api/propiedades) y los IDs eliminados; con "reiniciar": True
+# el cliente debe volver a cargar la lista. Responde con ETag (304 si no hubo cambios desde la última consulta).
+@app.route('/api/propiedades/cambios', methods=['GET'])
+def get_cambios_propiedades():
+    return respuesta_catalogo(_cambios_propiedades)
+
+
+# Funcionamiento: Función interna (helper) de get_cambios_propiedades: arma la respuesta (o el error 504).
+def _cambios_propiedades():
+    try:
+        return jsonify(leer_cambios_propiedades(request.args))
+    except TimeoutException:
+        print(f"ERROR: Timeout en la ruta {request.path}")
+        return jsonify({"error": "La base de datos tardó demasiado en responder (Timeout)."}), 504
+
+
+# Funcionamiento: Ruta pública para los mapas (Leaflet).
+# Recibe 'bbox=minLat,minLng,maxLat,maxLng' (la vista actual del mapa), 'zoom' y, opcionalmente,
+# los mismos filtros del catálogo (q, tipo, estado, min_/max_...).
+# Retorna solo los marcadores de propiedades activas dentro de la vista (id, nombre, precio, lat, lng, ...),
+# resueltos con el índice espacial en memoria. Con zoom alejado agrupa las cercanas en 'clusters'
+# (cantidad, centroide, precio mínimo/máximo). Si 'bbox' o 'zoom' no son válidos retorna 400.
+# Responde con ETag (304 si el cliente ya tiene esta vista en esta versión del catálogo).
+@app.route('/api/propiedades/mapa', methods=['GET'])
+def get_mapa_propiedades():
+    return respuesta_catalogo(_mapa_propiedades)
+
+
+# Funcionamiento: Función interna (helper) de get_mapa_propiedades: arma la respuesta (o el error 400/504).
+def _mapa_propiedades():
+    try:
+        return jsonify(leer_marcadores_mapa(request.args))
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    except TimeoutException:
+        print(f"ERROR: Timeout en la ruta {request.path}")
+        return jsonify({"error": "La base de datos tardó demasiado en responder (Timeout)."}), 504
 
 
 # Funcionamiento: Protegido (vendedor/admin).
@@ -36,16 +88,13 @@ def get_propiedades():
 # Valida todos los campos (modo 'parcial=False'). Si falla (ej. campo obligatorio falta), retorna 400.
 # Revisa si el admin envió un 'propietario' desde el dropdown.
 # Si no se envió (o si el que crea es un vendedor), asigna la propiedad al usuario logueado.
+# Retorna 201 con la propiedad creada y la nueva versión del catálogo (no la lista completa).
 @app.route('/api/propiedades', methods=['POST'])
 @login_required('vendedor', 'administrador', 'admin')
 def add_propiedad():
     data = request.get_json(silent=True) or {}
     try:
-        campos = _validar_y_normalizar_propiedad(
-            data,
-            parcial=False,
-            propiedades_existentes=leer_propiedades()
-        )
+        campos = _validar_y_normalizar_propiedad(data, parcial=False)
         user_id = session.get('user_id')
         if user_id is None:
             return jsonify({"error": "Autenticación requerida para crear propiedades."}), 401
@@ -60,8 +109,9 @@ def add_propiedad():
             campos['propietario'] = user_id
 
         nueva = crear_propiedad(campos)
-        propiedades = leer_propiedades()
-        
+        # Las variantes (thumb/card/full) se generan en segundo plano; la respuesta no las espera
+        encolar_variantes(nueva.get('galeria') or nueva.get('img'))
+
         # Quitamos la imagen de la respuesta para una API limpia
         nueva_sin_img = nueva.copy()
         nueva_sin_img.pop('img', None)
@@ -69,7 +119,7 @@ def add_propiedad():
         return jsonify({
             "message": "Propiedad ingresada con éxito.",
             "propiedad": nueva_sin_img,
-            "propiedades": propiedades
+            "version": version_catalogo()["version"]
         }), 201
 
     except ValueError as error:
@@ -100,7 +150,7 @@ def update_propiedad(propiedad_id):
     data_log = data.copy()
     data_log.pop('img', None)
 
-    propiedad_actual = obtener_propiedad_por_id(propiedad_id)
+    propiedad_actual = obtener_propiedad_por_id(propiedad_id, perfil="owner")
     if not propiedad_actual:
         return jsonify({"error": "Propiedad no encontrada."}), 404
 
@@ -109,7 +159,6 @@ def update_propiedad(propiedad_id):
         campos_actualizados = _validar_y_normalizar_propiedad(
             data,
             parcial=True,
-            propiedades_existentes=leer_propiedades(),
             propiedad_actual=propiedad_actual
         )
         
@@ -138,13 +187,16 @@ def update_propiedad(propiedad_id):
         
         if not propiedad_actualizada:
             return jsonify({"error": "Propiedad no encontrada."}), 404
+        if 'img' in campos_actualizados:
+            encolar_variantes(propiedad_actualizada.get('galeria') or propiedad_actualizada.get('img'))
 
         respuesta_json = propiedad_actualizada.copy()
         respuesta_json.pop('img', None)
 
         return jsonify({
             "message": "Propiedad actualizada con éxito.", 
-            "propiedad": respuesta_json
+            "propiedad": respuesta_json,
+            "version": version_catalogo()["version"]
         })
 
     except ValueError as error:
@@ -161,11 +213,11 @@ def update_propiedad(propiedad_id):
 # Verifica que la propiedad exista.
 # Verifica permisos (solo Admin o el propietario).
 # Llama a la BD para eliminar la propiedad.
-# Retorna un mensaje de éxito en JSON.
+# Retorna un mensaje de éxito y la nueva versión del catálogo en JSON.
 @app.route('/api/propiedades/<int:propiedad_id>', methods=['DELETE'])
 @login_required('vendedor', 'administrador', 'admin')
 def delete_propiedad(propiedad_id):
-    propiedad_actual = obtener_propiedad_por_id(propiedad_id)
+    propiedad_actual = obtener_propiedad_por_id(propiedad_id, perfil="owner")
     if not propiedad_actual:
         return jsonify({"error": "Propiedad no encontrada."}), 404
 
@@ -178,18 +230,18 @@ def delete_propiedad(propiedad_id):
     if not eliminado:
         return jsonify({"error": "Propiedad no encontrada."}), 404
 
-    return jsonify({"message": "Propiedad eliminada con éxito."})
+    return jsonify({"message": "Propiedad eliminada con éxito.", "version": version_catalogo()["version"]})
 
 
 # Funcionamiento: Ruta POST para eliminar (alternativa a DELETE).
 # Verifica que la propiedad exista.
 # Verifica permisos (solo Admin o el propietario).
 # Llama a la BD para eliminar la propiedad.
-# Retorna un mensaje de éxito en JSON.
+# Retorna un mensaje de éxito y la nueva versión del catálogo en JSON.
 @app.route('/api/propiedades/eliminar/<int:propiedad_id>', methods=['POST'])
 @login_required('vendedor', 'administrador', 'admin')
 def eliminar_propiedad(propiedad_id):
-    propiedad = obtener_propiedad_por_id(propiedad_id)
+    propiedad = obtener_propiedad_por_id(propiedad_id, perfil="owner")
     if not propiedad:
         return jsonify({"error": "Propiedad no encontrada."}), 404
 
@@ -203,7 +255,7 @@ def eliminar_propiedad(propiedad_id):
         eliminado = eliminar_propiedad_db(propiedad_id)
         if not eliminado:
             return jsonify({"error": "Propiedad no encontrada."}), 404
-        return jsonify({"message": "Propiedad eliminada correctamente."}), 200
+        return jsonify({"message": "Propiedad eliminada correctamente.", "version": version_catalogo()["version"]}), 200
         # Captura el error de Timeout ANTES del 'Exception' genérico.
     except TimeoutException:
         # Imprime un log en el servidor
@@ -213,4 +265,79 @@ def eliminar_propiedad(propiedad_id):
         return jsonify({"error": f"Error al eliminar propiedad: {str(e)}"}), 500
 
 
+# Funcionamiento: Sirve la imagen número <indice> de una propiedad como bytes (no como data: URI).
+# Usa la huella del contenido como ETag y responde 304 si el navegador ya la tiene (If-None-Match).
+# Soporta peticiones parciales (Range).
+# Si la URL trae '?v=' igual a la huella, la respuesta es inmutable y se guarda en caché por un año;
+# sin versión, el navegador debe revalidar (barato gracias al ETag).
+# '?variante=thumb|card|full' entrega la versión reducida ya generada, o el original si aún no existe.
+# Si la imagen es una URL externa, redirige a ella.
+@app.route('/api/propiedades/<int:propiedad_id>/imagenes/<int:indice>', methods=['GET'])
+def imagen_propiedad(propiedad_id, indice):
+    try:
+        propiedad = obtener_propiedad_por_id(propiedad_id, perfil="image", obsoleto=True)
+    except TimeoutException:
+        print(f"ERROR: Timeout en la ruta {request.path}")
+        return jsonify({"error": "La base de datos tardó demasiado en responder (Timeout)."}), 504
+    if not propiedad:
+        return jsonify({"error": "Propiedad no encontrada."}), 404
+
+    fuentes = fuentes_imagenes(propiedad)
+    if indice >= len(fuentes):
+        return jsonify({"error": "Imagen no encontrada."}), 404
+    fuente = fuentes[indice]
+    if es_externa(fuente):
+        return redirect(fuente)
+
+    version = huella_fuente(fuente)
+    etag = version
+    variante = request.args.get('variante')
+    imagen = leer_variante(fuente, variante) if variante in VARIANTES else None
+    if imagen:
+        etag = f"{version}-{variante}"
+    else:
+        # Sin variante (o todavía no generada): se entrega el original
+        variante = None
+        imagen = decodificar_imagen(fuente)
+    if not imagen:
+        return jsonify({"error": "Imagen no encontrada."}), 404
+    datos, mimetype = imagen
+
+    response = Response(datos, mimetype=mimetype)
+    response.set_etag(etag)
+    response.cache_control.public = True
+    # Si se pidió una variante que aún no existe, el original no se fija en caché bajo esa URL
+    if request.args.get('v') == version and request.args.get('variante') == variante:
+        response.cache_control.max_age = 31536000
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response.make_conditional(request, accept_ranges=True, complete_length=len(datos))
+
+
+# Funcionamiento: Protegido (vendedor/admin).
+# Recibe una imagen como multipart/form-data (campo 'imagen') y la guarda en el almacén de blobs.
+# Werkzeug deja las partes grandes en un temporal en disco y el almacén las copia por bloques,
+# así la memoria por subida queda acotada. El tamaño máximo lo define MAX_CONTENT_LENGTH (413 si se supera).
+# Retorna 201 con la referencia ("blob:<sha256>") que se envía como 'img' al crear/actualizar la propiedad.
+@app.route('/api/imagenes', methods=['POST'])
+@login_required('vendedor', 'administrador', 'admin')
+def subir_imagen():
+    archivo = request.files.get('imagen')
+    if not archivo or not archivo.filename:
+        return jsonify({"error": "Debes adjuntar una imagen en el campo 'imagen'."}), 400
+    try:
+        referencia = guardar_imagen_subida(archivo.stream)
+    except ValueError as error:
+        return jsonify({"error": str(error)}), 400
+    except Exception as e:
+        print(f"ERROR INESPERADO en subir_imagen: {e}")
+        return jsonify({"error": f"Error al guardar la imagen: {str(e)}"}), 500
+    return jsonify({"referencia": referencia}), 201
+
 
+# Funcionamiento: Respuesta JSON cuando la petición supera MAX_CONTENT_LENGTH.
+@app.errorhandler(RequestEntityTooLarge)
+def peticion_demasiado_grande(error):
+    limite_mb = (app.config.get('MAX_CONTENT_LENGTH') or 0) / (1024 * 1024)
+    return jsonify({"error": f"El archivo supera el tamaño máximo permitido ({limite_mb:.0f} MB)."}), 413
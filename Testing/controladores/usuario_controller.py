@@ -5,6 +5,7 @@ from persistencia.base_datos import (
     obtener_usuario_por_email,
     actualizar_usuario as actualizar_usuario_db,
     eliminar_usuario as eliminar_usuario_db,
+    estadisticas_cache,
 )
 from servicios.usuario_service import validar_email, TIPOS_USUARIO_PERMITIDOS, rol_legible
 from servicios.propiedad_service import _validar_y_normalizar_propiedad
@@ -23,7 +24,7 @@ usuario_bp = Blueprint('usuario', __name__)
 @login_required('admin', 'administrador')
 def api_usuarios():
     try:
-        usuarios = obtener_usuarios()
+        usuarios = obtener_usuarios("public")
         respuesta = []
         for usuario in usuarios:
             usuario_copy = usuario.copy()
@@ -47,7 +48,7 @@ def api_usuarios():
 @login_required('admin', 'administrador')
 def actualizar_usuario(user_id):
     data = request.get_json(silent=True) or {}
-    usuario = obtener_usuario_por_id(user_id)
+    usuario = obtener_usuario_por_id(user_id, perfil="public")
     if not usuario:
         return jsonify({"error": "Usuario no encontrado."}), 404
     try:
@@ -59,7 +60,7 @@ def actualizar_usuario(user_id):
             if not validar_email(email):
                 return jsonify({"error": "Correo inválido (mínimo 2 caracteres antes del @)."}), 400
             email_normalizado = email.lower()
-            existente = obtener_usuario_por_email(email_normalizado)
+            existente = obtener_usuario_por_email(email_normalizado, perfil="auth")
             if existente and existente.get("id") != user_id:
                 return jsonify({"error": "El correo ya está registrado."}), 400
             cambios["email"] = email
@@ -129,12 +130,12 @@ def eliminar_usuario(user_id):
     if current_user_id == user_id:
         return jsonify({"error": "No puedes eliminar tu propia cuenta."}), 400
 
-    usuario = obtener_usuario_por_id(user_id)
+    usuario = obtener_usuario_por_id(user_id, perfil="owner-name")
     if not usuario:
         return jsonify({"error": "Usuario no encontrado."}), 404
 
     try:
-        propiedades = obtener_propiedades()
+        propiedades = obtener_propiedades("owner")
         propiedades_usuario = [p for p in propiedades if p.get('propietario') == user_id]
         if propiedades_usuario:
             return jsonify({
@@ -151,5 +152,13 @@ def eliminar_usuario(user_id):
     except Exception as e:
         return jsonify({"error": f"Error al eliminar usuario: {str(e)}"}), 500
 
+
+# Funcionamiento: Contadores de los cachés de lectura (propiedades y usuarios) para monitoreo:
+# aciertos/fallos, consultas hechas a Supabase, lecturas coalescidas, respuestas obsoletas y respaldos usados.
+@usuario_bp.get("/api/admin/cache")
+@login_required('admin', 'administrador')
+def api_estadisticas_cache():
+    return jsonify(estadisticas_cache())
+
 from app import app  # noqa: E402
 app.register_blueprint(usuario_bp)
@@ -1,14 +1,18 @@
-import json
-import re
 from flask import render_template, jsonify, session, redirect, url_for, request, abort
 from utils.helpers import _prefers_json
 from app import app
 from utils.decoradores import login_required
-from persistencia.base_datos import obtener_usuario_por_id, obtener_propiedad_por_id
+from persistencia.base_datos import (
+    obtener_usuario_por_id, obtener_propiedad_por_id, obtener_ids_con_imagen, version_catalogo
+)
+from persistencia.indice_geo import parsear_coordenadas
+from servicios.imagen_service import fuentes_imagenes, es_externa, huella_fuente
+from servicios.derivados_service import VARIANTES
 from servicios.usuario_service import leer_usuarios, rol_legible
 from servicios.propiedad_service import leer_propiedades
 from httpx import TimeoutException
 from utils.helpers import obtener_valor_uf_actual
+from utils.cache_http import respuesta_catalogo
 
 IMAGENES_ESPECIALES = {
     1: "https://images.homify.com/v1492435533/p/photo/image/1958308/_FV_0284.jpg",
@@ -27,79 +31,83 @@ def _imagen_especial(propiedad):
         return None
     return IMAGENES_ESPECIALES.get(prop_id)
 
-_BASE64_RE = re.compile(r'^[A-Za-z0-9+/=\n\r]+$')
-_IMAGE_PATH_RE = re.compile(r'/[^/]+\.(jpe?g|png|webp|gif)(\?.*)?$', re.IGNORECASE)
-
-def _parece_base64(cadena: str) -> bool:
-    """Heurística simple para diferenciar base64 crudo de rutas absolutas."""
-    texto = (cadena or "").strip()
-    if len(texto) < 50:
-        return False
-    return bool(_BASE64_RE.match(texto))
-
-def _resolver_imagen_src(valor):
+# Funcionamiento: Arma las URLs de las variantes (thumb/card/full) de una imagen servida por
+# /api/propiedades/<id>/imagenes/<n>. Si la variante aún no existe, el endpoint entrega el original.
+# Retorna {"src", "srcset", "miniatura"}: 'srcset' deja que el navegador elija el tamaño más chico adecuado.
+def _imagen_con_variantes(propiedad_id, indice, version=None):
+    urls = {
+        nombre: url_for('imagen_propiedad', propiedad_id=propiedad_id, indice=indice, v=version, variante=nombre)
+        for nombre in VARIANTES
+    }
+    return {
+        "src": urls["card"],
+        "srcset": ", ".join(f"{urls[nombre]} {ancho}w" for nombre, ancho in VARIANTES.items()),
+        "miniatura": urls["thumb"],
+    }
+
+
+# Funcionamiento: Convierte una imagen guardada en la propiedad en un diccionario para el HTML
+# ({"src", "srcset", "miniatura"}).
+# Las URLs externas y rutas estáticas se usan tal cual (sin variantes). Las imágenes guardadas
+# se sirven desde /api/propiedades/<id>/imagenes/<n> (con '?v=' = huella del contenido),
+# en vez de incrustarlas en la página como data: URI.
+def _resolver_imagen_src(valor, propiedad_id, indice):
     if not valor:
         return None
     dato = str(valor).strip()
     if not dato:
         return None
-    if dato.startswith(("http://", "https://", "data:")):
-        return dato
-    if dato.startswith("/") and _IMAGE_PATH_RE.search(dato):
-        return dato
-    if _parece_base64(dato):
-        return f"data:image/jpeg;base64,{dato}"
-    return f"data:image/jpeg;base64,{dato}"
+    if es_externa(dato):
+        return {"src": dato, "srcset": None, "miniatura": dato}
+    return _imagen_con_variantes(propiedad_id, indice, huella_fuente(dato))
 
 
+# Funcionamiento: Arma la galería del detalle a partir de la lista canónica de imágenes
+# (ya normalizada y sin repetidos al escribir la propiedad).
 def _galeria_para_propiedad(propiedad):
     if not propiedad:
         return []
-    posibles = (
-        propiedad.get("galeria")
-        or propiedad.get("fotos")
-        or propiedad.get("imagenes")
-        or propiedad.get("imagenes_urls")
-    )
-    imagenes = []
-    if isinstance(posibles, list):
-        imagenes = posibles
-    elif isinstance(posibles, dict):
-        imagenes = list(posibles.values())
-    elif isinstance(posibles, str):
-        cadena = posibles.strip()
-        if cadena:
-            try:
-                parsed = json.loads(cadena)
-                if isinstance(parsed, list):
-                    imagenes = parsed
-                elif isinstance(parsed, str):
-                    imagenes = [parsed]
-            except json.JSONDecodeError:
-                separadores = ["|", ";", ","]
-                partes = [cadena]
-                for separador in separadores:
-                    if separador in cadena:
-                        partes = [p.strip() for p in cadena.split(separador)]
-                        break
-                imagenes = [p for p in partes if p]
-    if not imagenes and propiedad.get("img"):
-        imagenes = [propiedad.get("img")]
-
     resultado = []
-    for imagen in imagenes:
-        src = _resolver_imagen_src(imagen)
-        if src and src not in resultado:
+    for indice, imagen in enumerate(fuentes_imagenes(propiedad)):
+        src = _resolver_imagen_src(imagen, propiedad.get("id"), indice)
+        if src:
             resultado.append(src)
     especial = _imagen_especial(propiedad)
     if especial:
-        resultado = [especial] + [img for img in resultado if img != especial]
+        resultado = [{"src": especial, "srcset": None, "miniatura": especial}] + [
+            img for img in resultado if img["src"] != especial
+        ]
     return resultado
 
 
-def _imagen_portada(propiedad):
-    galeria = _galeria_para_propiedad(propiedad)
-    return galeria[0] if galeria else None
+# Funcionamiento: Las listas del catálogo se piden con el perfil 'card-cover' (sin la columna 'img', con 'galeria':
+# solo referencias "blob:<sha256>" o URLs, nunca base64). La portada es la primera de la galería y apunta
+# al endpoint de imágenes con '?v=' = su huella, así el navegador la guarda en caché sin revalidar.
+# Solo para las filas antiguas sin 'galeria' se pregunta a Supabase cuáles tienen imagen (sin '?v=').
+# Cada portada trae 'imagen_portada_srcset' para las tarjetas; 'galeria' se quita de la propiedad.
+def _asignar_portadas(propiedades):
+    con_imagen = obtener_ids_con_imagen([p.get('id') for p in propiedades if not isinstance(p.get('galeria'), list)])
+    for propiedad in propiedades:
+        galeria = propiedad.pop('galeria', None)
+        portada = _imagen_especial(propiedad)
+        imagen = {"src": portada, "srcset": None}
+        if not portada and galeria:
+            imagen = _resolver_imagen_src(galeria[0], propiedad.get('id'), 0) or imagen
+        elif not portada and propiedad.get('id') in con_imagen:
+            imagen = _imagen_con_variantes(propiedad.get('id'), 0)
+        propiedad['imagen_portada'] = imagen["src"]
+        propiedad['imagen_portada_srcset'] = imagen["srcset"]
+    return propiedades
+
+
+# Funcionamiento: Agrega 'lat' y 'lng' (floats) a cada propiedad con 'coordenadas' válidas,
+# para que el mapa no tenga que interpretar el texto en el navegador.
+def _asignar_coordenadas(propiedades):
+    for propiedad in propiedades:
+        punto = parsear_coordenadas(propiedad.get('coordenadas'))
+        if punto:
+            propiedad['lat'], propiedad['lng'] = punto
+    return propiedades
 
 ## TESTING DE MANEJO DE ERRORES !
 
@@ -206,7 +214,9 @@ def comprador_dashboard_view():
         except ValueError: page = 1
 
         # Llamamos al servicio PIDIENDO paginación explícitamente
-        resultado = leer_propiedades(filtros=request.args, pagina=page, por_pagina=9)
+        resultado = leer_propiedades(
+            filtros=request.args, pagina=page, por_pagina=9, perfil="card-cover", con_propietario=True
+        )
         
         # Desempaquetamos el diccionario
         propiedades_data = resultado['propiedades']
@@ -216,23 +226,19 @@ def comprador_dashboard_view():
             'actual': resultado['actual']
         }
 
-        usuarios = leer_usuarios()
-        nombres = {u.get('id'): f"{u.get('nombre','').strip()} {u.get('apellido','').strip()}".strip() for u in usuarios}
-        
         propiedades_filtradas = []
         for p in propiedades_data:
             if not p.get('activo', True): continue
             
             copia = p.copy()
-            prop_id = copia.get('propietario')
-            copia['propietario_nombre'] = nombres.get(prop_id) if nombres.get(prop_id) else None
-            copia['imagen_portada'] = _imagen_portada(copia)
             
             # URL de detalle para el mapa y botones
             if copia.get('id'):
                 copia['detalle_url'] = url_for('comprador_propiedad_detalle', propiedad_id=copia.get('id'))
                 
             propiedades_filtradas.append(copia)
+        _asignar_portadas(propiedades_filtradas)
+        _asignar_coordenadas(propiedades_filtradas)
         
         # Preparamos los filtros para mantener en la paginación
         filtros_limpios = request.args.copy()
@@ -258,12 +264,12 @@ def comprador_dashboard_view():
 @login_required('comprador', 'administrador', 'admin', 'vendedor')
 def comprador_propiedad_detalle(propiedad_id):
     try:
-        propiedad = obtener_propiedad_por_id(propiedad_id)
+        propiedad = obtener_propiedad_por_id(propiedad_id, obsoleto=True)
         if not propiedad or not propiedad.get('activo', True):
             return render_template("error.html", message="La propiedad no está disponible o fue inhabilitada."), 404
 
-        usuarios = leer_usuarios()
-        propietario = next((u for u in usuarios if u.get('id') == propiedad.get('propietario')), None)
+        propietario_id = propiedad.get('propietario')
+        propietario = obtener_usuario_por_id(propietario_id, perfil="contact") if propietario_id is not None else None
         galeria = _galeria_para_propiedad(propiedad)
         valor_uf_actual = obtener_valor_uf_actual()
 
@@ -287,7 +293,8 @@ def comprador_propiedad_detalle(propiedad_id):
 # Obtiene TODAS las propiedades y TODOS los usuarios.
 # Asocia nombres de propietario a propiedades y roles legibles a usuarios.
 # A diferencia del comprador, muestra propiedades activas e inactivas.
-# Renderiza el panel de admin con ambas listas completas.
+# Renderiza el panel de admin con ambas listas completas y la versión del catálogo con que se leyeron
+# (el panel la usa para pedir después solo los cambios a /api/propiedades/cambios).
 @app.get("/admin")
 @login_required('admin', 'administrador')
 def admin_dashboard_view():
@@ -295,8 +302,9 @@ def admin_dashboard_view():
     try:
         valor_uf_actual = obtener_valor_uf_actual()
         #raise TimeoutException("Forzando demo de Timeout")
-        propiedades = leer_propiedades()
-        usuarios = leer_usuarios()
+        version = version_catalogo()["version"]
+        propiedades = leer_propiedades(perfil="admin-row")
+        usuarios = leer_usuarios("admin-row")
         vendedores = [u for u in usuarios if str(u.get('tipo_usuario')).strip().lower() == 'vendedor']
         nombres = {
             u.get('id'): f"{u.get('nombre','').strip()} {u.get('apellido','').strip()}".strip()
@@ -315,7 +323,8 @@ def admin_dashboard_view():
             propiedades=propiedades_total,
             usuarios=usuarios,
             valor_uf=valor_uf_actual,
-            vendedores=vendedores
+            vendedores=vendedores,
+            version_catalogo=version
         )
         
     # Bloque para capturar el Timeout (devuelve HTML)
@@ -356,7 +365,7 @@ def api_me():
         if not user_id:
             return jsonify({"error": "No autenticado."}), 401
 
-        user = obtener_usuario_por_id(user_id)
+        user = obtener_usuario_por_id(user_id, perfil="public")
         if not user:
             return jsonify({"error": "Usuario no encontrado."}), 404
 
@@ -375,22 +384,31 @@ def api_me():
 
 
 # Funcionamiento: Ruta pública para el catálogo de ventas.
-# Obtiene el valor UF y prepara filtros (forzando estado='venta').
+# Es la misma para todos los visitantes, así que responde con GET condicional: el ETag depende
+# de la versión del catálogo, la URL (filtros/página) y el valor UF. Si el navegador ya tiene
+# esa versión recibe un 304 y la página no se vuelve a armar.
+@app.get("/ventas")
+def ventas_view():
+    valor_uf_actual = obtener_valor_uf_actual()
+    return respuesta_catalogo(lambda: _render_ventas(valor_uf_actual), valor_uf_actual)
+
+
+# Funcionamiento: Función interna (helper) de ventas_view.
+# Prepara filtros (forzando estado='venta').
 # Gestiona la paginación (página actual) y llama al servicio para obtener datos recortados.
 # Enriquece las propiedades (nombres, imágenes de portada, URLs de detalle).
 # Limpia los filtros (quita 'page') para generar correctamente los enlaces de paginación.
-@app.get("/ventas")
-def ventas_view():
+def _render_ventas(valor_uf_actual):
     try:
-        valor_uf_actual = obtener_valor_uf_actual()
-        
         filtros_publicos = request.args.copy()
         
         try: page = int(request.args.get('page', 1))
         except ValueError: page = 1
             
         # Llamada con paginacion
-        resultado = leer_propiedades(filtros=filtros_publicos, pagina=page, por_pagina=9)
+        resultado = leer_propiedades(
+            filtros=filtros_publicos, pagina=page, por_pagina=9, perfil="card-cover", con_propietario=True
+        )
         
         propiedades_data = resultado['propiedades']
         paginacion = {
@@ -399,21 +417,17 @@ def ventas_view():
             'actual': resultado['actual']
         }
         
-        usuarios = leer_usuarios() 
-        nombres = {u.get('id'): f"{u.get('nombre','').strip()} {u.get('apellido','').strip()}".strip() for u in usuarios}
-        
         propiedades_venta = []
         for p in propiedades_data:
             if not p.get('activo', True): continue
             
             copia = p.copy()
-            prop_id = copia.get('propietario')
-            copia['propietario_nombre'] = nombres.get(prop_id) if nombres.get(prop_id) else None
-            copia['imagen_portada'] = _imagen_portada(copia)
             if copia.get('id'):
                 copia['detalle_url'] = url_for('comprador_propiedad_detalle', propiedad_id=copia.get('id'))
             
             propiedades_venta.append(copia)
+        _asignar_portadas(propiedades_venta)
+        _asignar_coordenadas(propiedades_venta)
 
         # Preparar filtros limpios para paginación
         filtros_limpios = request.args.copy()
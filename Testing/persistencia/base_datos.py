@@ -1,8 +1,18 @@
 import json
 import os
-from typing import Any, Dict, List, Optional
+import threading
+from datetime import datetime
+from typing import Any, Dict, Iterable, List, Optional, Tuple
+import httpx
 from dotenv import load_dotenv
 from pathlib import Path
+from postgrest.exceptions import APIError
+from persistencia.cache import CacheTTL, marcar_modo_degradado
+from persistencia.blobs import CLAVES_GALERIA, extraer_imagenes, lista_imagenes
+from persistencia.indice_catalogo import IndiceCatalogo
+from persistencia.indice_geo import ZOOM_CLUSTER_MAXIMO
+from persistencia.invalidacion import FuenteRealtime, InvalidadorCache
+from persistencia.registro_cambios import RegistroCambios
 
 # CARGA DEL ARCHIVO .env DE FORMA FIABLE
 
@@ -29,7 +39,7 @@ else:
 # IMPORTACIÓN DE SUPABASE
 
 try:
-    from supabase import create_client, Client
+    from supabase import create_client, Client, ClientOptions
 except ImportError as exc:
     raise RuntimeError(
         "No se pudo importar la librería 'supabase'. "
@@ -56,6 +66,7 @@ PROPIEDADES_JSON = BASE_DIR / "propiedades.json"
 
 USERS_TABLE = os.getenv("SUPABASE_USERS_TABLE", "users")
 PROPIEDADES_TABLE = os.getenv("SUPABASE_PROPIEDADES_TABLE", "propiedades")
+CAMBIOS_TABLE = os.getenv("SUPABASE_CAMBIOS_TABLE", "propiedades_cambios")
 
 # CLIENTE SUPABASE
 
@@ -75,6 +86,175 @@ def _get_client() -> "Client":
         print(f"Conectado a Supabase. Timeout configurado a 10s.")
     return _client
 
+
+# Funcionamiento: Cliente para las lecturas que tienen con qué responder si Supabase no contesta (copia del caché
+# o archivos locales, ver CACHÉ DE LECTURAS). Usa un timeout más corto (SUPABASE_TIMEOUT_LECTURA segundos)
+# para pasar antes al respaldo en vez de esperar los 10s. Las escrituras y las demás lecturas usan _get_client.
+SUPABASE_TIMEOUT_LECTURA = float(os.getenv("SUPABASE_TIMEOUT_LECTURA", "3"))
+
+_client_lectura: Optional["Client"] = None
+
+
+def _get_client_lectura() -> "Client":
+    global _client_lectura
+    if _client_lectura is None:
+        opciones = ClientOptions(postgrest_client_timeout=SUPABASE_TIMEOUT_LECTURA)
+        _client_lectura = create_client(SUPABASE_URL, SUPABASE_KEY, options=opciones)
+    return _client_lectura
+
+
+# CACHÉ DE LECTURAS
+
+# Funcionamiento: Un caché por colección, con TTL y tamaño máximo configurables desde el .env.
+# Las lecturas de propiedades/usuarios pasan por aquí; las escrituras del mismo módulo los invalidan
+# y las de otros procesos descartan solo lo afectado (ver aplicar_cambio_externo).
+# Si muchas peticiones piden a la vez algo que no está en el caché (ej. obtener_propiedades() en un pico
+# de visitas a /ventas), se hace una sola consulta a Supabase y todas reciben su resultado.
+# Las lecturas del catálogo (propiedades y nombres de dueños) no esperan a Supabase si tienen algo que mostrar:
+# hasta CACHE_VENTANA_OBSOLETA_SEGUNDOS después del TTL responden con lo anterior mientras se refresca en
+# segundo plano, y si Supabase no responde (ERRORES_UPSTREAM) usan la última copia buena o, si nunca la hubo,
+# los archivos locales datos/*.json. Esas respuestas salen con la cabecera 'X-Modo-Degradado' (ver app.py).
+CACHE_TTL_SEGUNDOS = float(os.getenv("CACHE_TTL_SEGUNDOS", "60"))
+CACHE_MAX_ENTRADAS = int(os.getenv("CACHE_MAX_ENTRADAS", "256"))
+CACHE_VENTANA_OBSOLETA_SEGUNDOS = float(os.getenv("CACHE_VENTANA_OBSOLETA_SEGUNDOS", "300"))
+ERRORES_UPSTREAM = (httpx.TimeoutException, httpx.NetworkError)
+
+_cache_propiedades = CacheTTL(CACHE_TTL_SEGUNDOS, CACHE_MAX_ENTRADAS, CACHE_VENTANA_OBSOLETA_SEGUNDOS, ERRORES_UPSTREAM)
+_cache_usuarios = CacheTTL(CACHE_TTL_SEGUNDOS, CACHE_MAX_ENTRADAS, CACHE_VENTANA_OBSOLETA_SEGUNDOS, ERRORES_UPSTREAM)
+
+
+# Funcionamiento: Retorna los contadores de ambos cachés (para monitoreo): aciertos/fallos,
+# consultas hechas a Supabase ('cargas') y lecturas que esperaron una consulta idéntica en curso ('coalescidas').
+def estadisticas_cache() -> Dict[str, Dict[str, Any]]:
+    return {
+        "propiedades": _cache_propiedades.estadisticas(),
+        "usuarios": _cache_usuarios.estadisticas(),
+    }
+
+
+# ÍNDICE DEL CATÁLOGO EN MEMORIA
+
+# Funcionamiento: Las búsquedas filtradas del catálogo se resuelven con un índice en memoria
+# (ver persistencia/indice_catalogo.py) y a Supabase solo se le piden las filas de la página.
+# Las escrituras de este módulo (y las de otros procesos, ver aplicar_cambio_externo) lo actualizan al tiro;
+# cada INDICE_TTL_SEGUNDOS se recarga completo por si algún cambio no llegó.
+# Si Supabase no responde al recargarlo, se sigue usando el índice anterior (o el de datos/propiedades.json
+# si nunca se cargó) y se reintenta cada INDICE_REINTENTO_SEGUNDOS; mientras tanto las consultas van degradadas.
+INDICE_TTL_SEGUNDOS = float(os.getenv("INDICE_TTL_SEGUNDOS", "300"))
+INDICE_REINTENTO_SEGUNDOS = 30.0
+
+_indice_catalogo = IndiceCatalogo(INDICE_TTL_SEGUNDOS)
+_indice_lock = threading.Lock()
+_indice_degradado: Optional[str] = None
+
+# VERSIÓN DEL CATÁLOGO
+
+# Funcionamiento: Número que sube cada vez que cambia una propiedad (o el nombre de su dueño, que muestran
+# las listas), junto con qué propiedades cambió cada escritura (ver persistencia/registro_cambios.py):
+# los paneles piden solo los cambios desde su versión (cambios_propiedades).
+# La versión sale de la tabla de cambios (CAMBIOS_TABLE, ver docs/migraciones.sql), que llenan triggers
+# de la base de datos: es la misma en todos los procesos y solo sube cuando cambian los datos.
+# Este proceso la lee al iniciar (iniciar_invalidacion), después de sus escrituras y cuando se entera
+# de cambios de otros procesos (sincronizar_cambios). Si la tabla no existe, o mientras no se ha podido leer,
+# cada proceso lleva su propia versión ("<token>.<número>"), que sube con sus escrituras y con los cambios
+# que ve al recargar el índice o por el canal Realtime.
+CAMBIOS_CAPACIDAD = int(os.getenv("CAMBIOS_CAPACIDAD", "2000"))
+
+_registro_cambios = RegistroCambios(CAMBIOS_CAPACIDAD)
+_cambios_lock = threading.Lock()
+_cambios_compartidos: Optional[bool] = None   # None = aún no se pudo leer la tabla; False = no existe
+
+
+# Funcionamiento: Función interna (helper). Anota en el registro una escritura de propiedades:
+# con la tabla de cambios, la lee (ahí ya están las filas del trigger); si no, sube la versión del proceso
+# con las propiedades 'actualizadas' y 'eliminadas'. Retorna la versión actual.
+def _nueva_version_catalogo(actualizadas: Iterable[int] = (), eliminadas: Iterable[int] = ()) -> str:
+    actualizadas = [i for i in actualizadas if i is not None]
+    eliminadas = [i for i in eliminadas if i is not None]
+    if not _cambios_compartidos:
+        return _registro_cambios.registrar(actualizadas, eliminadas)
+    try:
+        return sincronizar_cambios(propias=actualizadas + eliminadas)
+    except (*ERRORES_UPSTREAM, APIError) as e:
+        # La escritura ya se hizo; la próxima sincronización la anota
+        print(f"ADVERTENCIA: No se pudo leer la tabla de cambios tras una escritura: {e}")
+        return _registro_cambios.version()["version"]
+
+
+# Funcionamiento: Retorna {"version": "<numero>" (o "<token>.<numero>"), "modificado": <epoch de la última escritura>,
+# "compartida": True si es la versión de la tabla de cambios, igual en todos los procesos}.
+def version_catalogo() -> Dict[str, Any]:
+    return _registro_cambios.version()
+
+
+# Funcionamiento: Función interna (helper). Cambios del registro desde la versión 'desde' (ver RegistroCambios.cambios_desde).
+# Si 'desde' es una versión compartida más nueva que la de este proceso (la dio otro proceso que ya leyó
+# cambios que este aún no), primero lee la tabla de cambios.
+def _cambios_desde(desde: Optional[str]) -> Optional[Tuple[List[int], List[int], str]]:
+    cambios = _registro_cambios.cambios_desde(desde)
+    numero = _registro_cambios.numero_de(desde)
+    if cambios is None and _cambios_compartidos and numero is not None and numero > _registro_cambios.numero:
+        try:
+            sincronizar_cambios()
+        except (*ERRORES_UPSTREAM, APIError) as e:
+            print(f"ADVERTENCIA: No se pudo leer la tabla de cambios: {e}")
+        cambios = _registro_cambios.cambios_desde(desde)
+    return cambios
+
+
+# PERFILES DE PROYECCIÓN (columnas a pedir en cada SELECT)
+
+# Funcionamiento: Cada lectura elige explícitamente qué columnas necesita.
+# Así las listas (catálogo, tablas del admin, login, validaciones de dueño) no arrastran
+# la columna 'img' (base64) ni el hash de la contraseña cuando no hacen falta.
+PERFILES_PROPIEDAD = {
+    "full": "*",
+    "card": "id,nombre,descripcion,precio,localizacion,dormitorios,baños,area,tipo,estado,activo,coordenadas,propietario",
+    "card-cover": "id,nombre,descripcion,precio,localizacion,dormitorios,baños,area,tipo,estado,activo,coordenadas,propietario,galeria",
+    "admin-row": "id,nombre,precio,localizacion,activo,propietario",
+    "owner": "id,propietario,activo",
+    "image": "id,img,galeria",
+    "indice": "id,nombre,localizacion,descripcion,tipo,estado,precio,dormitorios,baños,area,activo,coordenadas,propietario",
+}
+
+# Campos calculados (no son columnas) que la API del catálogo puede incluir con 'fields='
+CAMPOS_CALCULADOS = ("propietario_nombre", "distancia_km")
+
+PERFILES_USUARIO = {
+    "full": "*",
+    "auth": "id,email,password,tipo_usuario",
+    "public": "id,email,nombre,apellido,telefono,rut,direccion,ciudad,tipo_usuario,fecha_registro",
+    "contact": "id,nombre,apellido,email,telefono,ciudad",
+    "admin-row": "id,nombre,apellido,email,tipo_usuario",
+    "owner-name": "id,nombre,apellido",
+}
+
+# Perfiles de usuario que no pasan por el caché: 'auth' trae el hash de la contraseña, y un cambio de
+# contraseña hecho en otro proceso no debe seguir aceptando la anterior hasta que venza el TTL.
+PERFILES_USUARIO_SIN_CACHE = ("auth",)
+
+
+# Cantidad máxima de IDs por cada filtro 'in' (mantiene acotado el largo de la URL).
+_TAMANO_LOTE_IDS = 200
+
+
+# Funcionamiento: Función interna (helper).
+# Traduce el nombre de un perfil a la lista de columnas para 'select'.
+# Falla (ValueError) si el perfil no existe, para no caer silenciosamente en 'SELECT *'.
+def _columnas(perfiles: Dict[str, str], perfil: str) -> str:
+    try:
+        return perfiles[perfil]
+    except KeyError:
+        raise ValueError(f"Perfil de proyección desconocido: '{perfil}'.") from None
+
+
+# Quita 'galeria' de las columnas si la tabla todavía no la tiene (ver _hay_columna_galeria).
+def _columnas_existentes(columnas: str) -> str:
+    lista = columnas.split(",")
+    if "galeria" not in lista or _hay_columna_galeria():
+        return columnas
+    return ",".join(columna for columna in lista if columna != "galeria")
+
 # UTILIDADES INTERNAS
 
 def _handle_response(response: Any) -> List[Dict[str, Any]]:
@@ -97,6 +277,38 @@ def _cargar_json(ruta: Path) -> List[Dict[str, Any]]:
         print(f"Error al leer {ruta.name}: {e}")
         return []
 
+
+# RESPALDO LOCAL (último recurso si Supabase no responde y no hay copia en caché)
+
+_datos_locales: Dict[Path, List[Dict[str, Any]]] = {}
+_catalogo_local: Optional[IndiceCatalogo] = None
+
+
+# Funcionamiento: Función interna (helper). Filas del archivo local 'ruta' (users.json o propiedades.json),
+# leídas una sola vez, con solo las 'columnas' pedidas ("*" = todas) y, si se pasan 'ids', solo esas (en ese orden).
+def _filas_locales(ruta: Path, columnas: str, ids: Optional[Iterable[int]] = None) -> List[Dict[str, Any]]:
+    if ruta not in _datos_locales:
+        _datos_locales[ruta] = _cargar_json(ruta)
+    filas = _datos_locales[ruta]
+    if ids is not None:
+        por_id = {fila.get("id"): fila for fila in filas}
+        filas = [por_id[i] for i in ids if i in por_id]
+    if columnas == "*":
+        return [dict(fila) for fila in filas]
+    nombres = columnas.split(",")
+    return [{columna: fila.get(columna) for columna in nombres if columna in fila} for fila in filas]
+
+
+# Funcionamiento: Función interna (helper). Índice del catálogo armado con datos/propiedades.json
+# y la función para leer sus filas, para repetir una consulta del catálogo sin Supabase.
+def _respaldo_catalogo() -> Tuple[IndiceCatalogo, Any]:
+    global _catalogo_local
+    if _catalogo_local is None:
+        indice = IndiceCatalogo(ttl=float("inf"))
+        indice.cargar(_filas_locales(PROPIEDADES_JSON, _columnas(PERFILES_PROPIEDAD, "indice")))
+        _catalogo_local = indice
+    return _catalogo_local, lambda ids, columnas: _filas_locales(PROPIEDADES_JSON, columnas, ids)
+
 # MIGRACIÓN DE DATOS
 
 # Funcionamiento: Inicializa la base de datos (seeding).
@@ -114,10 +326,17 @@ def init_db(seed_from_files: bool = True) -> None:
             client.table(USERS_TABLE).upsert(usuarios, on_conflict="id").execute()
             print(f"{len(usuarios)} usuarios migrados.")
         if propiedades:
+            # Las imágenes del archivo van al almacén de blobs; a la tabla solo sube la galería normalizada
+            propiedades = [_normalizar_imagenes(p) for p in propiedades]
             client.table(PROPIEDADES_TABLE).upsert(propiedades, on_conflict="id").execute()
             print(f"{len(propiedades)} propiedades migradas.")
     except Exception as e:
         print(f"Error en la migración: {e}")
+    finally:
+        _cache_usuarios.invalidar()
+        _cache_propiedades.invalidar()
+        _indice_catalogo.invalidar()
+        _nueva_version_catalogo()
 
 # CRUD DE USUARIOS (Crear, Obtener, Actualizar, Eliminar)
 
@@ -128,50 +347,112 @@ def crear_usuario(usuario: Dict[str, Any]) -> Dict[str, Any]:
     client = _get_client()
     payload = usuario.copy()
     response = client.table(USERS_TABLE).insert(payload).execute()
+    _cache_usuarios.invalidar()
     data = _handle_response(response)
     return data[0] if data else payload
 
 
-# Funcionamiento: Realiza un 'SELECT *' a la tabla de usuarios en Supabase.
+# Funcionamiento: Realiza un SELECT a la tabla de usuarios en Supabase (o lo toma del caché).
+# Solo pide las columnas del 'perfil' indicado (ver PERFILES_USUARIO).
 # Retorna una lista con todos los usuarios, ordenados por su ID.
-def obtener_usuarios() -> List[Dict[str, Any]]:
-    client = _get_client()
-    response = client.table(USERS_TABLE).select("*").order("id").execute()
-    return _handle_response(response)
+def obtener_usuarios(perfil: str = "full") -> List[Dict[str, Any]]:
+    columnas = _columnas(PERFILES_USUARIO, perfil)
+
+    def cargar():
+        client = _get_client()
+        response = client.table(USERS_TABLE).select(columnas).order("id").execute()
+        return _handle_response(response)
+    if perfil in PERFILES_USUARIO_SIN_CACHE:
+        return cargar()
+    return _cache_usuarios.obtener_o_cargar(("todos", perfil), cargar)
 
 
 # Funcionamiento: Busca en Supabase un usuario donde el 'id' coincida con el 'user_id' recibido.
 # Retorna el diccionario del usuario si lo encuentra, o None si no existe.
-def obtener_usuario_por_id(user_id: int) -> Optional[Dict[str, Any]]:
-    client = _get_client()
-    response = (
-        client.table(USERS_TABLE)
-        .select("*")
-        .eq("id", user_id)
-        .limit(1)
-        .execute()
-    )
-    data = _handle_response(response)
-    return data[0] if data else None
+def obtener_usuario_por_id(user_id: int, perfil: str = "full") -> Optional[Dict[str, Any]]:
+    columnas = _columnas(PERFILES_USUARIO, perfil)
+
+    def cargar():
+        client = _get_client()
+        response = (
+            client.table(USERS_TABLE)
+            .select(columnas)
+            .eq("id", user_id)
+            .limit(1)
+            .execute()
+        )
+        data = _handle_response(response)
+        return data[0] if data else None
+    if perfil in PERFILES_USUARIO_SIN_CACHE:
+        return cargar()
+    return _cache_usuarios.obtener_o_cargar(("id", user_id, perfil), cargar)
 
 
 # Funcionamiento: Normaliza el email (minúsculas, sin espacios).
 # Busca en Supabase un usuario donde el 'email' coincida.
 # Retorna el diccionario del usuario si lo encuentra, o None si no existe.
-def obtener_usuario_por_email(email: str) -> Optional[Dict[str, Any]]:
+def obtener_usuario_por_email(email: str, perfil: str = "full") -> Optional[Dict[str, Any]]:
     email = (email or "").strip().lower()
     if not email:
         return None
-    client = _get_client()
-    response = (
-        client.table(USERS_TABLE)
-        .select("*")
-        .eq("email", email)
-        .limit(1)
-        .execute()
-    )
-    data = _handle_response(response)
-    return data[0] if data else None
+    columnas = _columnas(PERFILES_USUARIO, perfil)
+
+    def cargar():
+        client = _get_client()
+        response = (
+            client.table(USERS_TABLE)
+            .select(columnas)
+            .eq("email", email)
+            .limit(1)
+            .execute()
+        )
+        data = _handle_response(response)
+        return data[0] if data else None
+    if perfil in PERFILES_USUARIO_SIN_CACHE:
+        return cargar()
+    return _cache_usuarios.obtener_o_cargar(("email", email, perfil), cargar)
+
+
+# Funcionamiento: Recibe una lista de IDs de usuarios.
+# Los pide a Supabase en lotes con 'in' (para no armar URLs gigantes), solo con las columnas del 'perfil'.
+# Retorna un diccionario {id: usuario} con los usuarios encontrados.
+def obtener_usuarios_por_ids(ids: List[int], perfil: str = "owner-name") -> Dict[int, Dict[str, Any]]:
+    columnas = _columnas(PERFILES_USUARIO, perfil)
+    ids = sorted({i for i in ids if i is not None})
+    usuarios: Dict[int, Dict[str, Any]] = {}
+    for desde in range(0, len(ids), _TAMANO_LOTE_IDS):
+        lote = tuple(ids[desde:desde + _TAMANO_LOTE_IDS])
+
+        def cargar(lote=lote):
+            client = _get_client_lectura()
+            response = client.table(USERS_TABLE).select(columnas).in_("id", list(lote)).execute()
+            return _handle_response(response)
+
+        def respaldo(lote=lote):
+            return _filas_locales(USERS_JSON, columnas, lote)
+        for usuario in _cache_usuarios.obtener_o_cargar(("ids", lote, perfil), cargar, obsoleto=True, ultimo_recurso=respaldo):
+            usuarios[usuario.get("id")] = usuario
+    return usuarios
+
+
+# Funcionamiento: Función interna (helper).
+# Arma el nombre completo "Nombre Apellido" de un usuario (o None si no tiene).
+def _nombre_completo(usuario: Optional[Dict[str, Any]]) -> Optional[str]:
+    if not usuario:
+        return None
+    nombre = f"{(usuario.get('nombre') or '').strip()} {(usuario.get('apellido') or '').strip()}".strip()
+    return nombre or None
+
+
+# Funcionamiento: Recibe una lista de propiedades y les agrega 'propietario_nombre'.
+# Solo consulta a los dueños que aparecen en esa lista (obtener_usuarios_por_ids),
+# así el costo depende del tamaño de la página y no del total de usuarios.
+# Modifica y retorna la misma lista.
+def adjuntar_nombre_propietario(propiedades: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    duenos = obtener_usuarios_por_ids([p.get("propietario") for p in propiedades])
+    for propiedad in propiedades:
+        propiedad["propietario_nombre"] = _nombre_completo(duenos.get(propiedad.get("propietario")))
+    return propiedades
 
 
 # Funcionamiento: Recibe el 'user_id' y un diccionario con los 'cambios' a aplicar.
@@ -188,6 +469,8 @@ def actualizar_usuario(user_id: int, cambios: Dict[str, Any]) -> Optional[Dict[s
         .eq("id", user_id)
         .execute()
     )
+    _cache_usuarios.invalidar()
+    _nueva_version_catalogo(_propiedades_de(user_id))
     data = _handle_response(response)
     return data[0] if data else obtener_usuario_por_id(user_id)
 
@@ -197,71 +480,680 @@ def actualizar_usuario(user_id: int, cambios: Dict[str, Any]) -> Optional[Dict[s
 def eliminar_usuario(user_id: int) -> bool: 
     client = _get_client()
     response = client.table(USERS_TABLE).delete().eq("id", user_id).execute()
+    _cache_usuarios.invalidar()
+    _nueva_version_catalogo(_propiedades_de(user_id))
     _handle_response(response)
     return True
 
+
+# Funcionamiento: Función interna (helper).
+# IDs de las propiedades del usuario según el índice (su 'propietario_nombre' cambia si cambia el usuario).
+def _propiedades_de(user_id: int) -> List[int]:
+    return _obtener_indice().consultar({"propietario": str(user_id)})
+
+
 # CRUD DE PROPIEDADES (Crear, Obtener, Actualizar, Eliminar)
 
+# Mismo mensaje para el chequeo con el índice y para el choque con la restricción única de la BD
+# (índice 'propiedades_coordenadas_key' sobre las coordenadas normalizadas, ver docs/migraciones.sql).
+MENSAJE_COORDENADAS_DUPLICADAS = "Las coordenadas ya existen en otra propiedad."
+
+# Funcionamiento: Indica si otra propiedad (distinta de 'excluir_id') ya usa estas 'coordenadas'.
+# Se responde con el índice en memoria (diccionario de coordenadas normalizadas), sin leer la tabla;
+# si otro proceso las acaba de usar, la restricción única de la BD lo detecta al escribir.
+def coordenadas_en_uso(coordenadas: Any, excluir_id: Optional[int] = None) -> bool:
+    ids = _obtener_indice().ids_con_coordenadas(coordenadas)
+    ids.discard(excluir_id)
+    return bool(ids)
+
+
+# Funcionamiento: Función interna (helper).
+# Ejecuta un insert/update de propiedades. Si Supabase lo rechaza por la restricción única
+# de 'coordenadas' (código 23505 de PostgreSQL), falla con ValueError y el mismo mensaje del validador.
+def _ejecutar_escritura_propiedad(consulta: Any) -> Any:
+    try:
+        return consulta.execute()
+    except APIError as error:
+        texto = f"{error.message or ''} {error.details or ''}"
+        if error.code == "23505" and "coordenadas" in texto:
+            raise ValueError(MENSAJE_COORDENADAS_DUPLICADAS) from error
+        raise
+
+
 # Funcionamiento: Recibe un diccionario (propiedad).
-# Inserta ese diccionario como un nuevo registro en la tabla de propiedades de Supabase.
+# Guarda sus imágenes en el almacén de blobs y normaliza la galería (ver extraer_imagenes):
+# la fila solo lleva referencias "blob:<sha256>". Luego inserta el registro en la tabla de propiedades de Supabase.
 # Retorna el objeto de la propiedad recién creada.
 def crear_propiedad(propiedad: Dict[str, Any]) -> Dict[str, Any]:
     client = _get_client()
-    payload = propiedad.copy()
-    response = client.table(PROPIEDADES_TABLE).insert(payload).execute()
+    payload = _normalizar_imagenes(propiedad)
+    response = _ejecutar_escritura_propiedad(client.table(PROPIEDADES_TABLE).insert(payload))
+    _cache_propiedades.invalidar()
     data = _handle_response(response)
+    _actualizar_indice(data)
+    _nueva_version_catalogo([fila.get("id") for fila in data])
     return data[0] if data else payload
 
 
-# Funcionamiento: Realiza un 'SELECT *' a la tabla de propiedades en Supabase.
+# Funcionamiento: Realiza un SELECT a la tabla de propiedades en Supabase (o lo toma del caché).
+# Solo pide las columnas del 'perfil' indicado (ver PERFILES_PROPIEDAD).
+# Si 'con_propietario' es True, cada propiedad trae además 'propietario_nombre'.
 # Retorna una lista con todas las propiedades, ordenadas por su ID.
-def obtener_propiedades() -> List[Dict[str, Any]]:
-    client = _get_client()
-    response = client.table(PROPIEDADES_TABLE).select("*").order("id").execute()
-    return _handle_response(response)
+def obtener_propiedades(perfil: str = "full", con_propietario: bool = False) -> List[Dict[str, Any]]:
+    columnas = _columnas(PERFILES_PROPIEDAD, perfil)
+
+    def cargar():
+        client = _get_client_lectura()
+        response = client.table(PROPIEDADES_TABLE).select(_columnas_existentes(columnas)).order("id").execute()
+        return _handle_response(response)
+    propiedades = _cache_propiedades.obtener_o_cargar(
+        ("todas", perfil), cargar, obsoleto=True, ultimo_recurso=lambda: _filas_locales(PROPIEDADES_JSON, columnas)
+    )
+    return adjuntar_nombre_propietario(propiedades) if con_propietario else propiedades
+
+
+# Funcionamiento: Recibe una lista de IDs de propiedades.
+# Pregunta a Supabase cuáles de ellas tienen imagen ('img' no nulo), pidiendo solo la columna 'id'
+# (un único SELECT con 'in'; el base64 no viaja por la red).
+# Retorna el conjunto de IDs con imagen (se usa para las portadas de una página del catálogo).
+def obtener_ids_con_imagen(ids: List[int]) -> set:
+    ids = sorted({i for i in ids if i is not None})
+    if not ids:
+        return set()
+
+    def cargar():
+        client = _get_client_lectura()
+        response = (
+            client.table(PROPIEDADES_TABLE)
+            .select("id")
+            .in_("id", ids)
+            .not_.is_("img", "null")
+            .neq("img", "")
+            .execute()
+        )
+        return _handle_response(response)
+    filas = _cache_propiedades.obtener_o_cargar(
+        ("con_imagen", tuple(ids)), cargar, obsoleto=True,
+        ultimo_recurso=lambda: [fila for fila in _filas_locales(PROPIEDADES_JSON, "id,img", ids) if fila.get("img")],
+    )
+    return {fila.get("id") for fila in filas}
+
+
+# Funcionamiento: Consulta filtrada (y opcionalmente paginada) del catálogo.
+# Recibe los filtros ya normalizados (q, tipo, estado, min_/max_ de precio, dormitorios, baños y area,
+# y lat/lng con radio_km y orden='distancia').
+# El índice en memoria calcula los IDs que cumplen y el total; a Supabase solo se le piden (con 'in')
+# las filas del rango 'inicio'..'fin' (ambos incluidos) o todas las coincidencias si no se pasa rango.
+# Si los filtros traen lat/lng, cada propiedad trae además 'distancia_km' desde ese punto.
+# Retorna un diccionario {"propiedades": [...], "total": n}. El resultado de cada combinación
+# de filtros y rango queda en el caché de propiedades.
+# Si 'con_propietario' es True, las propiedades de la página traen 'propietario_nombre'.
+def consultar_propiedades(
+    filtros: Dict[str, Any],
+    inicio: Optional[int] = None,
+    fin: Optional[int] = None,
+    perfil: str = "full",
+    con_propietario: bool = False,
+) -> Dict[str, Any]:
+    columnas = _columnas(PERFILES_PROPIEDAD, perfil)
+
+    # Sin argumentos consulta a Supabase; con el respaldo local (_respaldo_catalogo) repite la consulta sin él
+    def cargar(indice=None, leer_filas=_obtener_propiedades_en_orden):
+        indice = indice or _obtener_indice()
+        if inicio is None or fin is None:
+            pagina = indice.consultar(filtros)
+            total = len(pagina)
+        else:
+            pagina = indice.consultar(filtros, limite=fin + 1)[inicio:]
+            total = indice.contar(filtros)
+        propiedades = leer_filas(pagina, columnas)
+        _agregar_distancias(indice, propiedades, filtros)
+        return {"propiedades": propiedades, "total": total}
+    clave = ("consulta", tuple(sorted(filtros.items())), inicio, fin, perfil)
+    resultado = _cache_propiedades.obtener_o_cargar(
+        clave, cargar, obsoleto=True, ultimo_recurso=lambda: cargar(*_respaldo_catalogo())
+    )
+    if con_propietario:
+        adjuntar_nombre_propietario(resultado["propiedades"])
+    return resultado
+
+
+# Funcionamiento: Página de la API del catálogo con paginación por cursor (keyset sobre el ID).
+# Retorna hasta 'limite' propiedades que cumplen los 'filtros' (ya normalizados) con ID mayor que 'despues_de'
+# (None = primera página), ordenadas por ID. Con orden=distancia (y lat/lng) retorna las 'limite' más cercanas
+# y no hay página siguiente (no se puede seguir con un cursor por ID).
+# 'campos' = los campos pedidos (fields=) entre las columnas del perfil 'card' y CAMPOS_CALCULADOS;
+# None = todos. 'id' viene siempre. Falla (ValueError) si se pide un campo desconocido.
+# Retorna {"propiedades": [...], "total": n, "siguiente": ID del último o None si no hay más}.
+# 'total' sale del índice en memoria (no cuenta filas en Supabase); con 'limite' 0 no se piden filas.
+def consultar_pagina_propiedades(
+    filtros: Dict[str, Any],
+    despues_de: Optional[int],
+    limite: int,
+    campos: Optional[List[str]] = None,
+) -> Dict[str, Any]:
+    columnas_card = PERFILES_PROPIEDAD["card"].split(",")
+    if campos is None:
+        campos = columnas_card + list(CAMPOS_CALCULADOS)
+    desconocidos = [campo for campo in campos if campo not in columnas_card and campo not in CAMPOS_CALCULADOS]
+    if desconocidos:
+        raise ValueError(f"Campos desconocidos en 'fields': {', '.join(desconocidos)}.")
+    con_propietario = "propietario_nombre" in campos
+    columnas = ["id"] + [
+        columna for columna in columnas_card
+        if columna != "id" and (columna in campos or (columna == "propietario" and con_propietario))
+    ]
+
+    indice = _obtener_indice()
+    total = indice.contar(filtros)
+    if limite <= 0:
+        return {"propiedades": [], "total": total, "siguiente": None}
+
+    def cargar(indice=indice, leer_filas=_obtener_propiedades_en_orden):
+        if filtros.get("orden") == "distancia" and filtros.get("lat") is not None and filtros.get("lng") is not None:
+            ids, hay_mas = indice.consultar(filtros, limite=limite), False
+        else:
+            # Se pide uno de más para saber si hay una página siguiente
+            ids = indice.consultar_despues_de(filtros, despues_de, limite + 1)
+            ids, hay_mas = ids[:limite], len(ids) > limite
+        propiedades = leer_filas(ids, ",".join(columnas))
+        if "distancia_km" in campos:
+            _agregar_distancias(indice, propiedades, filtros)
+        return {"propiedades": propiedades, "siguiente": ids[-1] if hay_mas else None}
+    clave = ("cursor", tuple(sorted(filtros.items())), despues_de, limite, tuple(columnas), "distancia_km" in campos)
+    resultado = _cache_propiedades.obtener_o_cargar(
+        clave, cargar, obsoleto=True, ultimo_recurso=lambda: cargar(*_respaldo_catalogo())
+    )
+    if con_propietario:
+        adjuntar_nombre_propietario(resultado["propiedades"])
+    # Copias con solo los campos pedidos (las filas del caché no se modifican)
+    propiedades = [
+        {campo: valor for campo, valor in fila.items() if campo == "id" or campo in campos}
+        for fila in resultado["propiedades"]
+    ]
+    return {"propiedades": propiedades, "total": total, "siguiente": resultado["siguiente"]}
+
+
+# Funcionamiento: Cambios del catálogo desde la versión 'desde' (la que el cliente recibió junto con sus datos).
+# Retorna {"version": actual, "reiniciar": False, "propiedades": [...], "eliminadas": [IDs]}: las propiedades
+# creadas o editadas después de 'desde' (columnas del perfil 'card', con 'propietario_nombre') y los IDs
+# de las eliminadas. Si 'desde' no se puede continuar (vacía, de otro proceso o demasiado antigua) o si cambiaron
+# más de 'maximo' propiedades, retorna "reiniciar": True y el cliente debe volver a cargar la lista completa.
+def cambios_propiedades(desde: Optional[str], maximo: int = 200) -> Dict[str, Any]:
+    _obtener_indice()  # si venció se recarga (sin tabla de cambios, así entran los cambios de otros procesos)
+    cambios = _cambios_desde(desde)
+    if cambios is None or len(cambios[0]) > maximo:
+        return {"version": version_catalogo()["version"], "reiniciar": True, "propiedades": [], "eliminadas": []}
+
+    actualizadas, eliminadas, version = cambios
+    propiedades = _obtener_propiedades_en_orden(actualizadas, _columnas(PERFILES_PROPIEDAD, "card"), _get_client())
+    adjuntar_nombre_propietario(propiedades)
+    # Si una propiedad ya no está (se eliminó mientras tanto) va como eliminada
+    encontradas = {propiedad.get("id") for propiedad in propiedades}
+    eliminadas = sorted(set(eliminadas) | (set(actualizadas) - encontradas))
+    return {"version": version, "reiniciar": False, "propiedades": propiedades, "eliminadas": eliminadas}
+
+
+# Funcionamiento: Espera hasta 'espera' segundos a que el catálogo tenga una versión posterior a 'desde'
+# (para el flujo de eventos). Antes recarga el índice si venció (ver cambios_propiedades).
+# Retorna True si hay cambios (o si 'desde' no se puede continuar), False si se cumplió el plazo.
+def esperar_cambios_catalogo(desde: Optional[str], espera: float) -> bool:
+    _obtener_indice()
+    return _registro_cambios.esperar(desde, espera)
+
+
+# Funcionamiento: IDs de las propiedades cambiadas desde la versión 'desde', sin pedir filas a Supabase.
+# Retorna (IDs actualizados, IDs eliminados, versión actual), o None si 'desde' no se puede continuar.
+def ids_cambiados_desde(desde: Optional[str]) -> Optional[Tuple[List[int], List[int], str]]:
+    return _cambios_desde(desde)
+
+
+# Funcionamiento: De los 'ids' recibidos, retorna los de propiedades activas según el índice en memoria.
+def ids_activos(ids: Iterable[int]) -> set:
+    indice = _obtener_indice()
+    activos = set()
+    for propiedad_id in ids:
+        documento = indice.documento(propiedad_id)
+        if documento is not None and documento.get("activo") is not False:
+            activos.add(propiedad_id)
+    return activos
+
+
+# Funcionamiento: Función interna (helper).
+# Si los 'filtros' traen lat/lng, agrega a cada propiedad su 'distancia_km' (3 decimales; None sin coordenadas).
+def _agregar_distancias(indice: IndiceCatalogo, propiedades: List[Dict[str, Any]], filtros: Dict[str, Any]) -> None:
+    if filtros.get("lat") is None or filtros.get("lng") is None:
+        return
+    distancias = indice.distancias_km([p.get("id") for p in propiedades], filtros["lat"], filtros["lng"])
+    for propiedad in propiedades:
+        distancia = distancias.get(propiedad.get("id"))
+        propiedad["distancia_km"] = None if distancia is None else round(distancia, 3)
+
+
+# Funcionamiento: Marcadores del mapa dentro del rectángulo visible.
+# 'caja' = (min_lat, min_lng, max_lat, max_lng); 'filtros' = los mismos del catálogo, ya normalizados.
+# Se resuelve completo con el índice en memoria (grilla espacial), sin pedir filas a Supabase.
+# Con un 'zoom' alejado (hasta ZOOM_CLUSTER_MAXIMO) las propiedades cercanas vienen agrupadas en 'clusters'
+# y solo las que quedan solas vienen como marcadores; sin zoom o con zoom cercano, 'clusters' va vacío.
+# Retorna {"clusters": [...], "marcadores": [...], "total": n}; si se pasa 'limite', solo se retornan
+# los primeros 'limite' marcadores (por ID) y 'total' sigue contando todas las propiedades.
+# 'con_propietario' agrega 'propietario_nombre' a los marcadores retornados.
+def consultar_mapa(
+    caja: Tuple[float, float, float, float],
+    filtros: Optional[Dict[str, Any]] = None,
+    limite: Optional[int] = None,
+    con_propietario: bool = False,
+    zoom: Optional[int] = None,
+) -> Dict[str, Any]:
+    indice = _obtener_indice()
+    if zoom is not None and zoom <= ZOOM_CLUSTER_MAXIMO:
+        clusters, marcadores = indice.clusters(caja, zoom, filtros)
+    else:
+        clusters, marcadores = [], indice.marcadores(caja, filtros)
+    total = len(marcadores) + sum(cluster["cantidad"] for cluster in clusters)
+    if limite is not None:
+        marcadores = marcadores[:limite]
+    if con_propietario:
+        adjuntar_nombre_propietario(marcadores)
+    return {"clusters": clusters, "marcadores": marcadores, "total": total}
+
+
+# Funcionamiento: Función interna (helper).
+# Pide a Supabase las propiedades de 'ids' (en lotes con 'in') y las retorna en ese mismo orden.
+# Sin 'client' usa el de lecturas con respaldo (las consultas del catálogo).
+def _obtener_propiedades_en_orden(ids: List[int], columnas: str, client: Any = None) -> List[Dict[str, Any]]:
+    client = client or _get_client_lectura()
+    por_id: Dict[int, Dict[str, Any]] = {}
+    for desde in range(0, len(ids), _TAMANO_LOTE_IDS):
+        lote = ids[desde:desde + _TAMANO_LOTE_IDS]
+        response = client.table(PROPIEDADES_TABLE).select(_columnas_existentes(columnas)).in_("id", lote).execute()
+        for fila in _handle_response(response):
+            por_id[fila.get("id")] = fila
+    return [por_id[i] for i in ids if i in por_id]
 
 
 # Funcionamiento: Busca en Supabase una propiedad donde el 'id' coincida con el 'propiedad_id' recibido.
 # Retorna el diccionario de la propiedad si la encuentra, o None si no existe.
-def obtener_propiedad_por_id(propiedad_id: int) -> Optional[Dict[str, Any]]:
-    client = _get_client()
-    response = (
-        client.table(PROPIEDADES_TABLE)
-        .select("*")
-        .eq("id", propiedad_id)
-        .limit(1)
-        .execute()
+# 'obsoleto' = True solo para lecturas públicas (detalle, imágenes): si Supabase no responde pueden usar la copia
+# anterior o datos/propiedades.json. Las validaciones de dueño antes de escribir usan el valor por defecto (False):
+# datos vigentes o el error de Supabase.
+def obtener_propiedad_por_id(propiedad_id: int, perfil: str = "full", obsoleto: bool = False) -> Optional[Dict[str, Any]]:
+    columnas = _columnas(PERFILES_PROPIEDAD, perfil)
+
+    def cargar():
+        client = _get_client_lectura() if obsoleto else _get_client()
+        response = (
+            client.table(PROPIEDADES_TABLE)
+            .select(_columnas_existentes(columnas))
+            .eq("id", propiedad_id)
+            .limit(1)
+            .execute()
+        )
+        data = _handle_response(response)
+        return data[0] if data else None
+    if not obsoleto:
+        return _cache_propiedades.obtener_o_cargar(("id", propiedad_id, perfil), cargar)
+    return _cache_propiedades.obtener_o_cargar(
+        ("id", propiedad_id, perfil), cargar, obsoleto=True,
+        ultimo_recurso=lambda: next(iter(_filas_locales(PROPIEDADES_JSON, columnas, [propiedad_id])), None),
     )
-    data = _handle_response(response)
-    return data[0] if data else None
 
 
 # Funcionamiento: Recibe el 'propiedad_id' y un diccionario con los 'cambios' a aplicar.
+# Si los cambios traen imágenes nuevas, se guardan en el almacén de blobs y la galería se normaliza.
+# Si solo traen 'img', cambia la portada y se conservan las demás imágenes de la galería.
 # Ejecuta un 'update' en Supabase para actualizar solo esos campos en la propiedad correspondiente.
 # Retorna el objeto de la propiedad ya actualizada.
 def actualizar_propiedad(propiedad_id: int, cambios: Dict[str, Any]) -> Optional[Dict[str, Any]]:
     client = _get_client()
     if not cambios:
         return obtener_propiedad_por_id(propiedad_id)
+    if "img" in cambios and not any(clave in cambios for clave in CLAVES_GALERIA):
+        cambios = {**cambios, "galeria": _galeria_con_portada(propiedad_id, cambios["img"])}
+    cambios = _normalizar_imagenes(cambios)
 
-    response = (
+    response = _ejecutar_escritura_propiedad(
         client.table(PROPIEDADES_TABLE)
         .update(cambios)
         .eq("id", propiedad_id)
-        .execute()
     )
+    _cache_propiedades.invalidar()
     data = _handle_response(response)
+    _actualizar_indice(data)
+    _nueva_version_catalogo([propiedad_id])
     return data[0] if data else obtener_propiedad_por_id(propiedad_id)
 
 
+# Funcionamiento: Función interna (helper) de actualizar_propiedad.
+# Galería actual de la propiedad con 'portada' en lugar de la portada anterior (primera imagen).
+def _galeria_con_portada(propiedad_id: int, portada: Any) -> List[Any]:
+    actual = obtener_propiedad_por_id(propiedad_id, perfil="image") or {}
+    galeria = lista_imagenes(actual)
+    if galeria and galeria[0] == actual.get("img"):
+        galeria = galeria[1:]
+    return ([portada] if portada else []) + galeria
+
+
+# Funcionamiento: Función interna (helper). Normaliza las imágenes de una fila que se va a escribir
+# (ver extraer_imagenes). Si la tabla aún no tiene la columna 'galeria', la fila lleva solo 'img' (la portada).
+def _normalizar_imagenes(payload: Dict[str, Any]) -> Dict[str, Any]:
+    payload = extraer_imagenes(payload)
+    if "galeria" in payload and not _hay_columna_galeria():
+        del payload["galeria"]
+    return payload
+
+
+_columna_galeria: Optional[bool] = None
+
+
+# Funcionamiento: Función interna (helper). Indica si la tabla de propiedades tiene la columna 'galeria'
+# (se crea con docs/migraciones.sql). Se pregunta a Supabase una sola vez por proceso.
+def _hay_columna_galeria() -> bool:
+    global _columna_galeria
+    if _columna_galeria is None:
+        try:
+            _get_client().table(PROPIEDADES_TABLE).select("galeria").limit(1).execute()
+            _columna_galeria = True
+        except APIError as e:
+            print(f"ADVERTENCIA: La tabla '{PROPIEDADES_TABLE}' no tiene la columna 'galeria' ({e.message}); "
+                  "solo se guardará la portada. Aplica docs/migraciones.sql.")
+            _columna_galeria = False
+    return _columna_galeria
+
+
 # Funcionamiento: Ejecuta un 'delete' en Supabase para eliminar la propiedad que coincida con el 'propiedad_id' especificado.
 # Retorna True si la operación se completó.
 def eliminar_propiedad(propiedad_id: int) -> bool:
     client = _get_client()
     response = client.table(PROPIEDADES_TABLE).delete().eq("id", propiedad_id).execute()
+    _cache_propiedades.invalidar()
+    _indice_catalogo.eliminar(propiedad_id)
+    _nueva_version_catalogo(eliminadas=[propiedad_id])
     _handle_response(response)
     return True
 
+
+# Funcionamiento: Función interna (helper).
+# Pasa al índice del catálogo las filas que Supabase retornó tras un insert/update.
+# Si no retornó nada (no se sabe cómo quedó la fila), el índice se marca para recargarse.
+def _actualizar_indice(filas: List[Dict[str, Any]]) -> None:
+    if not filas:
+        _indice_catalogo.invalidar()
+    for fila in filas:
+        _indice_catalogo.guardar(fila)
+
+
+# Funcionamiento: Función interna (helper).
+# Retorna el índice del catálogo, cargándolo desde Supabase (solo columnas del perfil 'indice')
+# si nunca se cargó o si venció. Un solo hilo lo recarga a la vez.
+def _obtener_indice() -> IndiceCatalogo:
+    if _indice_catalogo.vencido():
+        with _indice_lock:
+            if _indice_catalogo.vencido():
+                _cargar_indice_o_degradar()
+    if _indice_degradado:
+        marcar_modo_degradado(_indice_degradado)
+    return _indice_catalogo
+
+
+# Funcionamiento: Función interna (helper) de _obtener_indice. Recarga el índice. Sin tabla de cambios, lo que
+# cambió respecto del índice anterior (ej. escrito por otro proceso) entra al registro; la primera carga no
+# (no cambió nada, solo se leyó). Si Supabase no responde, deja el índice que había (o carga el del respaldo
+# local si estaba vacío) hasta el próximo reintento.
+def _cargar_indice_o_degradar() -> None:
+    global _indice_degradado
+    try:
+        habia_indice = _indice_catalogo.contar({}) > 0
+        actualizadas, eliminadas = _recargar_indice()
+        if habia_indice and not _cambios_compartidos and (actualizadas or eliminadas):
+            _nueva_version_catalogo(actualizadas, eliminadas)
+        _indice_degradado = None
+    except ERRORES_UPSTREAM as e:
+        print(f"ADVERTENCIA: No se pudo recargar el índice del catálogo ({type(e).__name__}); se sigue con el anterior o con el respaldo local.")
+        if _indice_degradado is None and _indice_catalogo.contar({}) > 0:
+            _indice_degradado = "cache"
+        elif _indice_degradado is None:
+            _indice_catalogo.cargar(_filas_locales(PROPIEDADES_JSON, _columnas(PERFILES_PROPIEDAD, "indice")))
+            _indice_degradado = "archivo"
+        _indice_catalogo.aplazar_recarga(INDICE_REINTENTO_SEGUNDOS)
+
+
+# Funcionamiento: Función interna (helper). Vuelve a cargar el índice completo desde Supabase.
+# Retorna (IDs actualizados, IDs eliminados) respecto del índice anterior. Se llama con '_indice_lock' tomado.
+def _recargar_indice() -> Tuple[List[int], List[int]]:
+    client = _get_client()
+    response = (
+        client.table(PROPIEDADES_TABLE)
+        .select(_columnas(PERFILES_PROPIEDAD, "indice"))
+        .order("id")
+        .execute()
+    )
+    return _indice_catalogo.cargar(_handle_response(response))
+
+
+# CAMBIOS HECHOS POR OTROS PROCESOS (ver persistencia/invalidacion.py)
+
+# Funcionamiento: Aplica un cambio de Postgres hecho fuera de este proceso (evento del canal Realtime):
+# - Propiedades: descarta del caché esa propiedad y las listas y la actualiza o quita del índice.
+# - Usuarios: descarta del caché solo las entradas de ese usuario.
+# Luego lee la tabla de cambios para que la versión quede al día. Sin tabla de cambios, anota en el registro
+# del proceso la propiedad si su fila del índice cambió, o las del usuario si cambió su nombre (el evento
+# trae el nombre anterior solo con 'replica identity full').
+# Si el evento no trae el id (o la fila nueva), se invalida todo lo de esa tabla. Las escrituras de este mismo
+# proceso también llegan como evento: se vuelven a aplicar sin efecto (ni versión nueva).
+def aplicar_cambio_externo(evento: Dict[str, Any]) -> None:
+    nuevo, anterior = evento.get("nuevo"), evento.get("anterior")
+    registro_id = (nuevo or anterior or {}).get("id")
+    eliminado = evento.get("tipo") == "DELETE"
+
+    if evento.get("tabla") == PROPIEDADES_TABLE:
+        if registro_id is None:
+            _cache_propiedades.invalidar()
+            _indice_catalogo.invalidar()
+            return
+        _cache_propiedades.descartar(lambda clave: clave[0] != "id" or clave[1] == registro_id)
+        antes = _indice_catalogo.documento(registro_id)
+        if eliminado:
+            _indice_catalogo.eliminar(registro_id)
+            cambio = antes is not None
+        elif nuevo:
+            _indice_catalogo.guardar(nuevo)
+            cambio = _indice_catalogo.documento(registro_id) != antes
+        else:
+            _indice_catalogo.invalidar()
+            cambio = True
+        if cambio or _cambios_compartidos:
+            _nueva_version_catalogo(*(([], [registro_id]) if eliminado else ([registro_id], [])))
+
+    elif evento.get("tabla") == USERS_TABLE:
+        if registro_id is None:
+            _cache_usuarios.invalidar()
+            return
+        emails = {(fila.get("email") or "").strip().lower() for fila in (nuevo, anterior) if fila and fila.get("email")}
+
+        def afectada(clave):
+            if clave[0] == "email":
+                return not emails or clave[1] in emails
+            return clave[0] == "todos" or (clave[0] == "id" and clave[1] == registro_id) \
+                or (clave[0] == "ids" and registro_id in clave[1])
+        _cache_usuarios.descartar(afectada)
+        if _cambios_compartidos:
+            sincronizar_cambios()
+        elif eliminado or (anterior and "nombre" in anterior and nuevo
+                           and any(anterior.get(c) != nuevo.get(c) for c in ("nombre", "apellido"))):
+            _nueva_version_catalogo(_propiedades_de(registro_id))
+
+
+# Funcionamiento: Modo de sondeo (mientras el canal Realtime no está conectado). Con tabla de cambios solo se
+# leen sus filas nuevas (sincronizar_cambios, una consulta barata que refresca solo las propiedades cambiadas).
+# Sin ella se recarga el índice y las propiedades que cambiaron se descartan del caché y se anotan en el registro.
+# El caché de usuarios no se vacía: los cambios de nombre llegan por la tabla de cambios (o los cubre el TTL),
+# igual que los cambios en columnas fuera del índice. Retorna (IDs actualizados, IDs eliminados).
+def sondear_cambios_externos() -> Tuple[List[int], List[int]]:
+    if _cambios_compartidos is not False:
+        desde = _registro_cambios.version()["version"]
+        sincronizar_cambios()  # (o reintenta leer la tabla por primera vez)
+        if _cambios_compartidos:
+            cambios = _registro_cambios.cambios_desde(desde)
+            return (cambios[0], cambios[1]) if cambios else ([], [])
+    with _indice_lock:
+        actualizadas, eliminadas = _recargar_indice()
+    if actualizadas or eliminadas:
+        cambiadas = set(actualizadas + eliminadas)
+        _cache_propiedades.descartar(lambda clave: clave[0] != "id" or clave[1] in cambiadas)
+        _nueva_version_catalogo(actualizadas, eliminadas)
+    return actualizadas, eliminadas
+
+
+# Funcionamiento: Lee de la tabla de cambios las filas posteriores a la última versión conocida (escritas por
+# cualquier proceso) y las pasa al registro. Antes, a las propiedades que no estén en 'propias' (las que este
+# proceso acaba de escribir o actualizar) les descarta el caché y les actualiza la fila del índice, para que
+# quien vea la versión nueva lea datos nuevos. La primera vez carga el historial reciente de la tabla
+# (_activar_cambios_compartidos). Falla con el error de Supabase si no responde. Retorna la versión actual.
+def sincronizar_cambios(propias: Iterable[int] = ()) -> str:
+    with _cambios_lock:
+        if _cambios_compartidos is None:
+            _activar_cambios_compartidos()
+            return _registro_cambios.version()["version"]
+        if not _cambios_compartidos:
+            return _registro_cambios.version()["version"]
+
+        client = _get_client()
+        filas: List[Dict[str, Any]] = []
+        while True:
+            response = (
+                client.table(CAMBIOS_TABLE)
+                .select("seq,propiedad_id,eliminada,creado")
+                .gt("seq", filas[-1]["seq"] if filas else _registro_cambios.numero)
+                .order("seq")
+                .limit(CAMBIOS_CAPACIDAD)
+                .execute()
+            )
+            lote = _handle_response(response)
+            filas.extend(lote)
+            if len(lote) < CAMBIOS_CAPACIDAD:
+                break
+        ajenas = sorted({fila["propiedad_id"] for fila in filas} - set(propias))
+        if ajenas:
+            _refrescar_propiedades(ajenas)
+        return _registro_cambios.agregar(*_entradas_de_cambios(filas))
+
+
+# Funcionamiento: Función interna (helper) de sincronizar_cambios. Pasa el registro al modo compartido con las
+# últimas CAMBIOS_CAPACIDAD filas de la tabla de cambios. Si la tabla no existe, queda (para siempre) con la
+# versión del proceso; si Supabase no responde se reintenta en la próxima sincronización.
+def _activar_cambios_compartidos() -> None:
+    global _cambios_compartidos
+    try:
+        response = (
+            _get_client().table(CAMBIOS_TABLE)
+            .select("seq,propiedad_id,eliminada,creado")
+            .order("seq", desc=True)
+            .limit(CAMBIOS_CAPACIDAD)
+            .execute()
+        )
+    except APIError as e:
+        print(f"ADVERTENCIA: No se pudo leer la tabla '{CAMBIOS_TABLE}' ({e.message}); cada proceso llevará "
+              "su propia versión del catálogo. Aplica docs/migraciones.sql.")
+        _cambios_compartidos = False
+        return
+    _registro_cambios.compartir(*_entradas_de_cambios(_handle_response(response)))
+    _cambios_compartidos = True
+
+
+# Funcionamiento: Función interna (helper). Filas de la tabla de cambios -> ([(seq, propiedad_id, eliminada)], epoch de la última).
+def _entradas_de_cambios(filas: List[Dict[str, Any]]) -> Tuple[List[Tuple[int, int, bool]], Optional[float]]:
+    entradas = [(fila["seq"], fila["propiedad_id"], bool(fila.get("eliminada"))) for fila in filas]
+    modificado = None
+    if filas:
+        ultima = max(filas, key=lambda fila: fila["seq"])
+        try:
+            modificado = datetime.fromisoformat(ultima.get("creado") or "").timestamp()
+        except ValueError:
+            pass
+    return entradas, modificado
+
+
+# Funcionamiento: Función interna (helper). Descarta del caché las propiedades 'ids' (y las listas) y actualiza
+# sus filas del índice (las que ya no existen se quitan). Con más de _TAMANO_LOTE_IDS se invalida todo.
+# También descarta los nombres de sus dueños guardados para las listas (pudo cambiar el nombre del dueño).
+def _refrescar_propiedades(ids: List[int]) -> None:
+    if len(ids) > _TAMANO_LOTE_IDS:
+        _cache_propiedades.invalidar()
+        _indice_catalogo.invalidar()
+        return
+    cambiadas = set(ids)
+    _cache_propiedades.descartar(lambda clave: clave[0] != "id" or clave[1] in cambiadas)
+    filas = _obtener_propiedades_en_orden(ids, _columnas(PERFILES_PROPIEDAD, "indice"), _get_client())
+    for fila in filas:
+        _indice_catalogo.guardar(fila)
+    for propiedad_id in cambiadas - {fila.get("id") for fila in filas}:
+        _indice_catalogo.eliminar(propiedad_id)
+    duenos = {fila.get("propietario") for fila in filas}
+    _cache_usuarios.descartar(lambda clave: clave[0] == "ids" and not duenos.isdisjoint(clave[1]))
+
+
+_invalidador: Optional[InvalidadorCache] = None
+
+
+# Funcionamiento: Empieza a escuchar los cambios de otros procesos (una sola vez por proceso).
+# Con INVALIDACION_REALTIME=0 (o si no se puede abrir el canal) solo se sondea cada INVALIDACION_SONDEO_SEGUNDOS.
+# 'fuente' permite pasar otra fuente de eventos (ej. FuenteFalsa en pruebas). Retorna el invalidador.
+def iniciar_invalidacion(fuente: Any = None) -> InvalidadorCache:
+    global _invalidador
+    if _invalidador is not None:
+        return _invalidador
+    if fuente is None and os.getenv("INVALIDACION_REALTIME", "1") != "0":
+        fuente = FuenteRealtime(SUPABASE_URL, SUPABASE_KEY, (USERS_TABLE, PROPIEDADES_TABLE))
+    try:
+        sincronizar_cambios()
+    except ERRORES_UPSTREAM as e:
+        print(f"ADVERTENCIA: No se pudo leer la tabla de cambios, se reintentará al sondear: {e}")
+    _invalidador = InvalidadorCache(fuente, aplicar_cambio_externo, sondear_cambios_externos)
+    try:
+        _invalidador.iniciar()
+    except Exception as e:
+        print(f"ADVERTENCIA: No se pudo abrir el canal Realtime, se usará sondeo: {e}")
+        _invalidador = InvalidadorCache(None, aplicar_cambio_externo, sondear_cambios_externos)
+        _invalidador.iniciar()
+    return _invalidador
+
+
+# NORMALIZACIÓN DE IMÁGENES DE FILAS EXISTENTES
+
+# Funcionamiento: Backfill único para las filas escritas antes de normalizar las imágenes.
+# Recorre todas las propiedades por lotes (avanzando por ID) y, a cada fila que no esté normalizada,
+# le sube el base64 al almacén de blobs y le deja la lista canónica en 'galeria' ('img' = portada).
+# Se puede ejecutar varias veces: las filas ya normalizadas no se vuelven a escribir.
+# Requiere la columna 'galeria' (docs/migraciones.sql). Retorna la cantidad de filas actualizadas.
+# Uso: python -m persistencia.base_datos normalizar-imagenes
+def normalizar_imagenes_existentes(tamano_lote: int = 20) -> int:
+    client = _get_client()
+    if not _hay_columna_galeria():
+        return 0
+    actualizadas = 0
+    ultimo_id = None
+    while True:
+        query = client.table(PROPIEDADES_TABLE).select("*")
+        if ultimo_id is not None:
+            query = query.gt("id", ultimo_id)
+        filas = _handle_response(query.order("id").limit(tamano_lote).execute())
+        if not filas:
+            break
+        for fila in filas:
+            imagenes = {clave: fila[clave] for clave in ("img",) + CLAVES_GALERIA if clave in fila}
+            cambios = extraer_imagenes(imagenes)
+            if cambios.get("galeria") != fila.get("galeria") or cambios.get("img") != fila.get("img"):
+                client.table(PROPIEDADES_TABLE).update(
+                    {"img": cambios["img"], "galeria": cambios["galeria"]}
+                ).eq("id", fila["id"]).execute()
+                actualizadas += 1
+        ultimo_id = filas[-1]["id"]
+        print(f"Imágenes normalizadas hasta la propiedad {ultimo_id} ({actualizadas} filas actualizadas).")
+    _cache_propiedades.invalidar()
+    _nueva_version_catalogo()
+    return actualizadas
+
 # NORMALIZAR VALORES BOOLEANOS (para el campo "activo")
 
 # Funcionamiento: Función interna (helper).
@@ -315,3 +1207,11 @@ def _prepare_propiedad_payload(propiedad: Dict[str, Any]) -> Dict[str, Any]:
         payload[columna] = valor
 
     return payload
+
+
+if __name__ == "__main__":
+    import sys
+    if sys.argv[1:] == ["normalizar-imagenes"]:
+        print(f"{normalizar_imagenes_existentes()} propiedades normalizadas.")
+    else:
+        print("Uso: python -m persistencia.base_datos normalizar-imagenes")
@@ -0,0 +1,355 @@
+import base64
+import binascii
+import hashlib
+import json
+import os
+import re
+import tempfile
+import threading
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
+
+# ALMACÉN DE IMÁGENES DIRECCIONADO POR CONTENIDO
+#
+# Las imágenes dejan de guardarse como base64 dentro de la fila de 'propiedades'.
+# Los bytes se guardan aparte, con su SHA-256 como nombre, y la fila solo guarda la
+# referencia "blob:<sha256>". Dos subidas iguales producen la misma clave (se guardan una vez).
+# Hay dos backends: carpeta local (por defecto) y Supabase Storage (BLOB_BACKEND=supabase).
+# Los blobs no se borran al eliminar una propiedad: otras filas pueden apuntar al mismo contenido.
+
+PREFIJO_BLOB = "blob:"
+CLAVES_GALERIA = ("galeria", "fotos", "imagenes", "imagenes_urls")
+
+BLOB_BACKEND = os.getenv("BLOB_BACKEND", "local").strip().lower()
+BLOB_DIR = Path(os.getenv("BLOB_DIR", Path(__file__).resolve().parents[1] / "datos" / "blobs"))
+BLOB_BUCKET = os.getenv("BLOB_BUCKET", "imagenes")
+
+# Tamaño de cada bloque al copiar una subida (la memoria usada no depende del tamaño del archivo).
+TAMANO_BLOQUE = 64 * 1024
+
+_DATA_URI_RE = re.compile(r'^data:(?P<mime>[\w.+-]+/[\w.+-]+)?(;[^,]*)?;base64,', re.IGNORECASE)
+_CLAVE_RE = re.compile(r'^[0-9a-f]{64}$')
+
+
+# REFERENCIAS
+
+# Funcionamiento: Arma la referencia que se guarda en la fila a partir de la clave del blob.
+def referencia_blob(clave: str) -> str:
+    return f"{PREFIJO_BLOB}{clave}"
+
+
+# Funcionamiento: Retorna la clave (sha256) si 'valor' es una referencia "blob:<sha256>" válida,
+# o None en cualquier otro caso (URL, base64 antiguo, texto vacío, etc.).
+def clave_de_referencia(valor: Any) -> Optional[str]:
+    if not isinstance(valor, str) or not valor.startswith(PREFIJO_BLOB):
+        return None
+    clave = valor[len(PREFIJO_BLOB):].strip().lower()
+    return clave if _CLAVE_RE.match(clave) else None
+
+
+# DECODIFICACIÓN DE BASE64
+
+# Funcionamiento: Reconoce el tipo de imagen por sus primeros bytes. Retorna None si no es un formato conocido
+# (se usa también para rechazar subidas que no son imágenes).
+def tipo_por_firma(datos: bytes) -> Optional[str]:
+    if datos.startswith(b"\xff\xd8\xff"):
+        return "image/jpeg"
+    if datos.startswith(b"\x89PNG"):
+        return "image/png"
+    if datos.startswith((b"GIF87a", b"GIF89a")):
+        return "image/gif"
+    if datos[:4] == b"RIFF" and datos[8:12] == b"WEBP":
+        return "image/webp"
+    return None
+
+
+# Funcionamiento: Detecta el tipo de imagen (JPEG por defecto, como en el resto del sistema).
+def detectar_mimetype(datos: bytes) -> str:
+    return tipo_por_firma(datos) or "image/jpeg"
+
+
+# Funcionamiento: Convierte un texto base64 (o data: URI) en bytes.
+# Retorna (bytes, mimetype, es_data_uri), o None si el texto no es base64 válido.
+def _decodificar(fuente: str) -> Optional[Tuple[bytes, str, bool]]:
+    mimetype = None
+    coincidencia = _DATA_URI_RE.match(fuente)
+    if coincidencia:
+        mimetype = coincidencia.group("mime")
+        fuente = fuente[coincidencia.end():]
+    try:
+        datos = base64.b64decode("".join(fuente.split()), validate=True)
+    except (binascii.Error, ValueError):
+        return None
+    if not datos:
+        return None
+    return datos, mimetype or detectar_mimetype(datos), bool(coincidencia)
+
+
+# Funcionamiento: Convierte una imagen guardada como base64 (o data: URI) en bytes.
+# Retorna (bytes, mimetype), o None si el texto no es base64 válido.
+def decodificar_base64(fuente: str) -> Optional[Tuple[bytes, str]]:
+    resultado = _decodificar(fuente)
+    if not resultado:
+        return None
+    datos, mimetype, _ = resultado
+    return datos, mimetype
+
+
+# BACKENDS
+
+class AlmacenBlobs(ABC):
+    # Funcionamiento: Interfaz común de los backends.
+    # Las claves son el SHA-256 (hex) del contenido; se reparten en subcarpetas por sus 2 primeros caracteres.
+    # Las variantes (derivados de una imagen, ej. 'card') se guardan junto al original como "<clave>.<variante>".
+    # Cada backend solo implementa _leer/_existe/_escribir/_mover sobre rutas relativas.
+
+    # Funcionamiento: Calcula la clave de 'datos', los guarda si todavía no existen y retorna la clave.
+    def guardar(self, datos: bytes, mimetype: Optional[str] = None) -> str:
+        clave = hashlib.sha256(datos).hexdigest()
+        ruta = self._ruta_relativa(clave)
+        if not self._existe(ruta):
+            self._escribir(ruta, datos, mimetype or detectar_mimetype(datos))
+        return clave
+
+    # Funcionamiento: Igual que 'guardar', pero lee 'archivo' (cualquier objeto con .read) por bloques.
+    # Los bloques se copian a un temporal en disco mientras se calcula el SHA-256, así la memoria
+    # usada por una subida queda acotada sin importar el tamaño de la imagen. Retorna la clave.
+    def guardar_archivo(self, archivo: BinaryIO, mimetype: Optional[str] = None) -> str:
+        sha = hashlib.sha256()
+        fd, temporal = tempfile.mkstemp(suffix=".tmp", dir=self._directorio_temporal())
+        try:
+            with os.fdopen(fd, "wb") as destino:
+                for bloque in iter(lambda: archivo.read(TAMANO_BLOQUE), b""):
+                    sha.update(bloque)
+                    destino.write(bloque)
+            clave = sha.hexdigest()
+            ruta = self._ruta_relativa(clave)
+            if not self._existe(ruta):
+                self._mover(ruta, Path(temporal), mimetype or "image/jpeg")
+        finally:
+            if os.path.exists(temporal):
+                os.remove(temporal)
+        return clave
+
+    # Funcionamiento: Retorna los bytes del blob, o None si no existe.
+    def leer(self, clave: str) -> Optional[bytes]:
+        return self._leer(self._ruta_relativa(clave))
+
+    # Funcionamiento: Indica si el blob ya está guardado.
+    def existe(self, clave: str) -> bool:
+        return self._existe(self._ruta_relativa(clave))
+
+    # Funcionamiento: Guarda la 'variante' (ej. 'thumb', 'card') del blob 'clave'.
+    def guardar_variante(self, clave: str, variante: str, datos: bytes, mimetype: str) -> None:
+        self._escribir(self._ruta_relativa(clave, variante), datos, mimetype)
+
+    # Funcionamiento: Retorna los bytes de la variante, o None si todavía no se generó.
+    def leer_variante(self, clave: str, variante: str) -> Optional[bytes]:
+        return self._leer(self._ruta_relativa(clave, variante))
+
+    # Funcionamiento: Indica si la variante ya fue generada.
+    def existe_variante(self, clave: str, variante: str) -> bool:
+        return self._existe(self._ruta_relativa(clave, variante))
+
+    @abstractmethod
+    def _leer(self, ruta: str) -> Optional[bytes]:
+        ...
+
+    @abstractmethod
+    def _existe(self, ruta: str) -> bool:
+        ...
+
+    @abstractmethod
+    def _escribir(self, ruta: str, datos: bytes, mimetype: str) -> None:
+        ...
+
+    # Funcionamiento: Guarda en 'ruta' el archivo temporal ya escrito en disco.
+    @abstractmethod
+    def _mover(self, ruta: str, temporal: Path, mimetype: str) -> None:
+        ...
+
+    # Funcionamiento: Carpeta donde se escriben los temporales de 'guardar_archivo' (None = la del sistema).
+    def _directorio_temporal(self) -> Optional[Path]:
+        return None
+
+    @staticmethod
+    def _ruta_relativa(clave: str, variante: Optional[str] = None) -> str:
+        nombre = f"{clave}.{variante}" if variante else clave
+        return f"{clave[:2]}/{nombre}"
+
+
+class AlmacenLocal(AlmacenBlobs):
+    # Funcionamiento: Guarda cada blob como un archivo dentro de 'directorio'.
+    def __init__(self, directorio: Path = BLOB_DIR):
+        self.directorio = Path(directorio)
+
+    def _leer(self, ruta: str) -> Optional[bytes]:
+        try:
+            return (self.directorio / ruta).read_bytes()
+        except FileNotFoundError:
+            return None
+
+    def _existe(self, ruta: str) -> bool:
+        return (self.directorio / ruta).exists()
+
+    # Funcionamiento: Escribe un temporal y lo renombra, para no dejar un blob a medio escribir
+    # (y para que dos escrituras simultáneas del mismo contenido no se pisen).
+    def _escribir(self, ruta: str, datos: bytes, mimetype: str) -> None:
+        destino = self.directorio / ruta
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        temporal = destino.with_name(f"{destino.name}.{os.getpid()}.{threading.get_ident()}.tmp")
+        temporal.write_bytes(datos)
+        os.replace(temporal, destino)
+
+    # Funcionamiento: El temporal se escribe en la misma carpeta, así moverlo es solo un renombre.
+    def _mover(self, ruta: str, temporal: Path, mimetype: str) -> None:
+        destino = self.directorio / ruta
+        destino.parent.mkdir(parents=True, exist_ok=True)
+        os.replace(temporal, destino)
+
+    def _directorio_temporal(self) -> Optional[Path]:
+        self.directorio.mkdir(parents=True, exist_ok=True)
+        return self.directorio
+
+
+class AlmacenSupabase(AlmacenBlobs):
+    # Funcionamiento: Guarda cada blob como un objeto del bucket 'bucket' de Supabase Storage.
+    # 'obtener_cliente' retorna el cliente de Supabase (se pide recién al usarlo).
+    def __init__(self, obtener_cliente: Callable[[], Any], bucket: str = BLOB_BUCKET):
+        self.obtener_cliente = obtener_cliente
+        self.bucket = bucket
+
+    def _bucket(self):
+        return self.obtener_cliente().storage.from_(self.bucket)
+
+    def _leer(self, ruta: str) -> Optional[bytes]:
+        try:
+            return self._bucket().download(ruta)
+        except Exception as e:
+            print(f"ADVERTENCIA: No se pudo descargar el blob {ruta}: {e}")
+            return None
+
+    def _existe(self, ruta: str) -> bool:
+        try:
+            return bool(self._bucket().exists(ruta))
+        except Exception:
+            return False
+
+    # Funcionamiento: Sube el objeto con 'upsert' (si otro proceso ya lo subió, el contenido es idéntico).
+    # 'cache-control' largo porque el contenido de una clave nunca cambia.
+    def _escribir(self, ruta: str, datos: bytes, mimetype: str) -> None:
+        self._bucket().upload(ruta, datos, self._opciones(mimetype))
+
+    # Funcionamiento: Sube el temporal abierto como archivo (httpx lo envía por partes, sin cargarlo entero).
+    def _mover(self, ruta: str, temporal: Path, mimetype: str) -> None:
+        with open(temporal, "rb") as archivo:
+            self._bucket().upload(ruta, archivo, self._opciones(mimetype))
+
+    @staticmethod
+    def _opciones(mimetype: str) -> Dict[str, str]:
+        return {"content-type": mimetype, "cache-control": "31536000", "upsert": "true"}
+
+
+# GALERÍA CANÓNICA DE UNA FILA
+
+# Funcionamiento: Reúne las imágenes "crudas" de una propiedad, en orden y sin repetir.
+# Revisa las claves de galería (lista, dict, JSON o texto separado por | ; ,) y,
+# si no hay galería, usa el campo 'img'.
+# Solo se usa al escribir (y para filas antiguas que aún no tienen 'galeria' normalizada).
+def lista_imagenes(propiedad: Dict[str, Any]) -> List[str]:
+    if not propiedad:
+        return []
+    posibles = None
+    for clave in CLAVES_GALERIA:
+        posibles = propiedad.get(clave)
+        if posibles:
+            break
+    imagenes = []
+    if isinstance(posibles, list):
+        imagenes = posibles
+    elif isinstance(posibles, dict):
+        imagenes = list(posibles.values())
+    elif isinstance(posibles, str):
+        cadena = posibles.strip()
+        if cadena:
+            try:
+                parsed = json.loads(cadena)
+                if isinstance(parsed, list):
+                    imagenes = parsed
+                elif isinstance(parsed, str):
+                    imagenes = [parsed]
+            except json.JSONDecodeError:
+                separadores = ["|", ";", ","]
+                partes = [cadena]
+                for separador in separadores:
+                    if separador in cadena:
+                        partes = [p.strip() for p in cadena.split(separador)]
+                        break
+                imagenes = [p for p in partes if p]
+    if not imagenes and propiedad.get("img"):
+        imagenes = [propiedad.get("img")]
+    limpias = (str(imagen).strip() for imagen in imagenes if imagen)
+    return list(dict.fromkeys(imagen for imagen in limpias if imagen))
+
+
+# MOVER IMÁGENES DE UNA FILA AL ALMACÉN
+
+# Funcionamiento: Función interna (helper).
+# Si 'valor' es una imagen en base64 (data: URI, o base64 con firma de imagen reconocible),
+# la guarda en el almacén y retorna su referencia. Cualquier otro valor (URL, referencia, texto)
+# se retorna sin cambios.
+def _a_referencia(almacen: AlmacenBlobs, valor: Any) -> Any:
+    if not isinstance(valor, str) or clave_de_referencia(valor):
+        return valor
+    resultado = _decodificar(valor)
+    if not resultado:
+        return valor
+    datos, mimetype, es_data_uri = resultado
+    if not es_data_uri and tipo_por_firma(datos) is None:
+        return valor
+    return referencia_blob(almacen.guardar(datos, mimetype))
+
+
+# Funcionamiento: Recibe el diccionario que se va a insertar/actualizar en 'propiedades'.
+# Si trae imágenes ('img' o alguna clave de galería), las normaliza una sola vez al escribir:
+# 1. Reúne la galería (lista_imagenes) y sube el base64 al almacén (referencias "blob:<sha256>").
+# 2. Deja la lista canónica, sin repetidos, en 'galeria'; 'img' queda como la portada (primer elemento).
+# 3. Quita las claves de galería antiguas (fotos, imagenes, imagenes_urls).
+# Así el render solo lee 'galeria', sin volver a interpretar texto ni recorrer base64.
+# Retorna un diccionario nuevo; el original no se modifica.
+def extraer_imagenes(payload: Dict[str, Any], almacen: Optional[AlmacenBlobs] = None) -> Dict[str, Any]:
+    if not any(clave in payload for clave in ("img",) + CLAVES_GALERIA):
+        return dict(payload)
+    almacen = almacen or obtener_almacen()
+    resultado = {clave: valor for clave, valor in payload.items() if clave not in CLAVES_GALERIA}
+    galeria = list(dict.fromkeys(_a_referencia(almacen, imagen) for imagen in lista_imagenes(payload)))
+    resultado["galeria"] = galeria
+    resultado["img"] = galeria[0] if galeria else None
+    return resultado
+
+
+# ALMACÉN COMPARTIDO
+
+_almacen: Optional[AlmacenBlobs] = None
+_almacen_lock = threading.Lock()
+
+
+# Funcionamiento: Retorna el almacén configurado en el .env (BLOB_BACKEND), creado la primera vez.
+def obtener_almacen() -> AlmacenBlobs:
+    global _almacen
+    with _almacen_lock:
+        if _almacen is None:
+            if BLOB_BACKEND == "supabase":
+                from persistencia.base_datos import _get_client
+                _almacen = AlmacenSupabase(_get_client, BLOB_BUCKET)
+            else:
+                _almacen = AlmacenLocal(BLOB_DIR)
+        return _almacen
+
+
+# Funcionamiento: Reemplaza el almacén compartido (ej. en pruebas, con una carpeta temporal).
+def configurar_almacen(almacen: Optional[AlmacenBlobs]) -> None:
+    global _almacen
+    with _almacen_lock:
+        _almacen = almacen
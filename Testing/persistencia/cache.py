@@ -0,0 +1,205 @@
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Callable, Dict, Hashable, Optional, Tuple
+from persistencia.vuelo_unico import VueloUnico
+
+# Caché en memoria (por proceso) para las lecturas de Supabase.
+# Cada colección (propiedades, usuarios) tiene su propia instancia en base_datos.py,
+# y las funciones de escritura de esa colección la invalidan completa. Los cambios hechos por otros
+# procesos llegan por persistencia/invalidacion.py y descartan solo las entradas afectadas.
+# Las lecturas simultáneas de una misma clave que no está en el caché comparten una sola carga
+# (ver persistencia/vuelo_unico.py).
+# Las lecturas del catálogo piden además 'obsoleto': pasado el TTL se sigue respondiendo con el valor
+# anterior mientras se refresca en segundo plano ('ventana_obsoleta'), y si Supabase no responde
+# se usa la última copia buena que se tuvo (o el 'ultimo_recurso'), marcando la petición como degradada.
+
+_peticion = threading.local()
+
+
+# Funcionamiento: Modo degradado de la petición en curso (hilo actual): None si todo salió de Supabase
+# o del caché vigente, "cache" si algo se respondió con una copia antigua porque Supabase no respondió,
+# "archivo" si hubo que usar el respaldo local (datos/*.json).
+def modo_degradado() -> Optional[str]:
+    return getattr(_peticion, "modo", None)
+
+
+# Funcionamiento: Marca la petición en curso como degradada ("archivo" no se rebaja a "cache").
+def marcar_modo_degradado(modo: str) -> None:
+    if modo_degradado() != "archivo":
+        _peticion.modo = modo
+
+
+# Funcionamiento: Limpia la marca (al empezar cada petición; los hilos del servidor se reutilizan).
+def reiniciar_modo_degradado() -> None:
+    _peticion.modo = None
+
+
+# Funcionamiento: Función interna (helper).
+# Lanza 'tarea' en un hilo daemon (refresco en segundo plano de una entrada vencida).
+def _en_hilo(tarea: Callable[[], None]) -> None:
+    threading.Thread(target=tarea, name="refresco-cache", daemon=True).start()
+
+
+# Funcionamiento: Función interna (helper).
+# Copia listas y diccionarios (estructura JSON) para que quien lea del caché
+# pueda modificar el resultado sin alterar lo que quedó guardado.
+def _copiar(valor: Any) -> Any:
+    if isinstance(valor, dict):
+        return {clave: _copiar(v) for clave, v in valor.items()}
+    if isinstance(valor, list):
+        return [_copiar(v) for v in valor]
+    return valor
+
+
+class CacheTTL:
+    # Funcionamiento: Crea un caché con tiempo de vida ('ttl', en segundos) y un máximo de entradas.
+    # Cuando se supera 'max_entradas' se descarta la entrada usada hace más tiempo (LRU).
+    # 'ventana_obsoleta' = segundos después del TTL en que una lectura con 'obsoleto' todavía recibe el valor
+    # vencido (y dispara su refresco). 'errores_upstream' = excepciones de la carga que significan que Supabase
+    # no respondió (ej. timeout): con ellas se responde con la última copia buena.
+    # 'ejecutar' lanza los refrescos en segundo plano (se puede reemplazar en las pruebas).
+    def __init__(self, ttl: float, max_entradas: int, ventana_obsoleta: float = 0.0,
+                 errores_upstream: Tuple[type, ...] = (), ejecutar: Callable[[Callable[[], None]], None] = _en_hilo) -> None:
+        self.ttl = ttl
+        self.max_entradas = max_entradas
+        self.ventana_obsoleta = ventana_obsoleta
+        self.errores_upstream = errores_upstream
+        self.ejecutar = ejecutar
+        self._entradas: "OrderedDict[Hashable, Tuple[float, Any]]" = OrderedDict()
+        # Última copia buena de cada clave leída con 'obsoleto' (no se borra al invalidar; solo para emergencias)
+        self._respaldo: "OrderedDict[Hashable, Any]" = OrderedDict()
+        self._lock = threading.Lock()
+        self._generacion = 0
+        self._vuelos = VueloUnico()
+        self.aciertos = 0
+        self.fallos = 0
+        self.obsoletas = 0
+        self.respaldos = 0
+
+    # Funcionamiento: Busca 'clave' en el caché.
+    # Retorna (True, copia_del_valor) si existe y no ha expirado, o (False, None) si no.
+    def obtener(self, clave: Hashable) -> Tuple[bool, Any]:
+        ahora = time.monotonic()
+        with self._lock:
+            entrada = self._entradas.get(clave)
+            if entrada is None or entrada[0] <= ahora:
+                if entrada is not None and entrada[0] + self.ventana_obsoleta <= ahora:
+                    del self._entradas[clave]
+                self.fallos += 1
+                return False, None
+            self._entradas.move_to_end(clave)
+            self.aciertos += 1
+            return True, _copiar(entrada[1])
+
+    # Funcionamiento: Guarda 'valor' bajo 'clave' con el TTL configurado.
+    # Si se indica 'generacion' y el caché fue invalidado desde entonces, no guarda nada
+    # (evita que una lectura lenta vuelva a meter datos anteriores a una escritura).
+    # Con 'respaldo' el valor queda además como la última copia buena de 'clave'.
+    def guardar(self, clave: Hashable, valor: Any, generacion: Any = None, respaldo: bool = False) -> None:
+        if self.ttl <= 0 or self.max_entradas <= 0:
+            return
+        with self._lock:
+            if respaldo:
+                self._respaldo[clave] = _copiar(valor)
+                self._respaldo.move_to_end(clave)
+                while len(self._respaldo) > self.max_entradas:
+                    self._respaldo.popitem(last=False)
+            if generacion is not None and generacion != self._generacion:
+                return
+            self._entradas[clave] = (time.monotonic() + self.ttl, _copiar(valor))
+            self._entradas.move_to_end(clave)
+            while len(self._entradas) > self.max_entradas:
+                self._entradas.popitem(last=False)
+
+    # Funcionamiento: Lectura "read-through".
+    # Si 'clave' está en el caché la retorna; si no, llama a 'cargar()', guarda el resultado y lo retorna.
+    # Si otra petición ya está cargando la misma clave, espera esa carga en vez de repetirla; solo se comparten
+    # cargas de la misma generación (una lectura posterior a una escritura no recibe datos de antes de ella).
+    # Con 'obsoleto' (lecturas que toleran datos algo antiguos, ej. el catálogo):
+    # 1. Si la entrada venció hace menos de 'ventana_obsoleta', la retorna al tiro y la refresca en segundo plano.
+    # 2. Si la carga falla con uno de 'errores_upstream', retorna la última copia buena de 'clave' aunque
+    #    sea anterior a una escritura; si nunca la hubo, retorna 'ultimo_recurso()' (si se indicó).
+    #    En ambos casos la petición queda marcada como degradada (ver modo_degradado).
+    # Las entradas invalidadas por una escritura no se sirven como obsoletas (quien escribió ve su cambio).
+    def obtener_o_cargar(self, clave: Hashable, cargar: Callable[[], Any], obsoleto: bool = False,
+                         ultimo_recurso: Optional[Callable[[], Any]] = None) -> Any:
+        encontrado, valor = self.obtener(clave)
+        if encontrado:
+            return valor
+        with self._lock:
+            generacion = self._generacion
+            vencida = self._entradas.get(clave) if obsoleto else None
+            if vencida is not None:
+                self.obsoletas += 1
+
+        def cargar_y_guardar():
+            valor = cargar()
+            self.guardar(clave, valor, generacion, respaldo=obsoleto)
+            return valor
+        vuelo = (clave, generacion)
+
+        if vencida is not None:
+            if not self._vuelos.en_curso(vuelo):
+                self.ejecutar(lambda: self._refrescar(vuelo, cargar_y_guardar))
+            return _copiar(vencida[1])
+        try:
+            return _copiar(self._vuelos.ejecutar(vuelo, cargar_y_guardar))
+        except self.errores_upstream as e:
+            if not obsoleto:
+                raise
+            with self._lock:
+                hay_respaldo = clave in self._respaldo
+                respaldo = _copiar(self._respaldo.get(clave))
+                if hay_respaldo:
+                    self.respaldos += 1
+            if hay_respaldo:
+                print(f"ADVERTENCIA: Supabase no respondió ({type(e).__name__}); se usa la última copia buena.")
+                marcar_modo_degradado("cache")
+                return respaldo
+            if ultimo_recurso is None:
+                raise
+            print(f"ADVERTENCIA: Supabase no respondió ({type(e).__name__}); se usa el respaldo local.")
+            marcar_modo_degradado("archivo")
+            return ultimo_recurso()
+
+    # Funcionamiento: Función interna. Refresco en segundo plano de una entrada vencida (una sola carga por clave).
+    def _refrescar(self, vuelo: Hashable, cargar_y_guardar: Callable[[], Any]) -> None:
+        try:
+            self._vuelos.ejecutar(vuelo, cargar_y_guardar)
+        except Exception as e:
+            print(f"ADVERTENCIA: No se pudo refrescar una entrada del caché: {e}")
+
+    # Funcionamiento: Vacía el caché completo (se llama después de cada escritura en la colección).
+    def invalidar(self) -> None:
+        with self._lock:
+            self._entradas.clear()
+            self._generacion += 1
+
+    # Funcionamiento: Descarta solo las entradas cuya clave cumple 'predicado(clave)' (ej. las de un usuario
+    # que cambió en otro proceso). Igual que invalidar, las lecturas que ya estaban en curso no se guardan.
+    # Retorna cuántas entradas se descartaron.
+    def descartar(self, predicado: Callable[[Hashable], bool]) -> int:
+        with self._lock:
+            claves = [clave for clave in self._entradas if predicado(clave)]
+            for clave in claves:
+                del self._entradas[clave]
+            self._generacion += 1
+            return len(claves)
+
+    # Funcionamiento: Retorna los contadores del caché (aciertos, fallos, entradas actuales) y de las cargas:
+    # 'cargas' = lecturas hechas a Supabase, 'coalescidas' = lecturas que esperaron una carga ya en curso,
+    # 'obsoletas' = respuestas vencidas mientras se refrescaban, 'respaldos' = copias buenas usadas porque Supabase no respondió.
+    def estadisticas(self) -> Dict[str, Any]:
+        with self._lock:
+            estadisticas = {
+                "aciertos": self.aciertos,
+                "fallos": self.fallos,
+                "entradas": len(self._entradas),
+                "max_entradas": self.max_entradas,
+                "ttl": self.ttl,
+                "obsoletas": self.obsoletas,
+                "respaldos": self.respaldos,
+            }
+        estadisticas.update(self._vuelos.estadisticas())
+        return estadisticas
@@ -0,0 +1,399 @@
+import bisect
+import heapq
+import math
+import re
+import threading
+import time
+import unicodedata
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+from persistencia.indice_geo import Caja, GrillaGeo, JerarquiaClusters, clave_coordenadas, parsear_coordenadas
+
+# ÍNDICE EN MEMORIA DEL CATÁLOGO
+#
+# Guarda, por cada propiedad, solo los campos por los que se filtra (no la fila completa) y
+# un índice invertido de palabras sobre nombre, localización y descripción, más un arreglo ordenado
+# (valor, id) por cada campo numérico para los filtros de rango (min_/max_, con bisect)
+# y una grilla espacial con las coordenadas ya convertidas a números (solo propiedades activas),
+# de la que salen los marcadores del mapa sin consultar a Supabase, más los clusters por nivel de zoom
+# y las búsquedas por distancia (radio_km y orden=distancia desde lat/lng). Un diccionario
+# coordenadas normalizadas -> IDs (todas las propiedades, activas o no) responde si unas coordenadas ya existen.
+# Con él, una búsqueda se resuelve intersectando conjuntos de IDs (el costo depende de cuántas
+# propiedades coinciden, no del largo de todos los textos) y después se piden a Supabase
+# solo las filas de la página. Se actualiza en cada alta/edición/baja hecha por este proceso
+# y se vuelve a cargar completo cada 'ttl' segundos (cambios hechos por otros procesos).
+
+CAMPOS_TEXTO = ("nombre", "localizacion", "descripcion")
+CAMPOS_CATEGORIA = ("tipo", "estado", "propietario")
+CAMPOS_NUMERICOS = ("precio", "dormitorios", "baños", "area")
+CAMPOS_MAPA = ("activo", "propietario", "coordenadas")
+CAMPOS_MARCADOR = ("nombre", "precio", "localizacion", "tipo", "estado", "propietario")
+
+_TOKEN_RE = re.compile(r"\w+")
+
+
+# Funcionamiento: Pasa un texto a minúsculas y sin tildes ("Curicó" -> "curico", "Ñuble" -> "nuble").
+def plegar_texto(texto: Any) -> str:
+    descompuesto = unicodedata.normalize("NFKD", str(texto or "").lower())
+    return "".join(c for c in descompuesto if not unicodedata.combining(c))
+
+
+# Funcionamiento: Separa un texto (ya plegado o no) en palabras normalizadas, sin repetir.
+def tokenizar(texto: Any) -> Set[str]:
+    return set(_TOKEN_RE.findall(plegar_texto(texto)))
+
+
+class IndiceCatalogo:
+    # Funcionamiento: 'ttl' = segundos tras los cuales el índice se considera vencido
+    # y se debe volver a cargar completo (ver 'vencido').
+    def __init__(self, ttl: float = 300.0):
+        self.ttl = ttl
+        self._lock = threading.RLock()
+        self._cargado_en: Optional[float] = None
+        self._documentos: Dict[int, Dict[str, Any]] = {}
+        self._ids: List[int] = []
+        self._palabras: Dict[int, Set[str]] = {}
+        self._postings: Dict[str, Set[int]] = {}
+        self._categorias: Dict[tuple, Set[int]] = {}
+        self._vocabulario: List[str] = []
+        self._vocabulario_sucio = False
+        self._numericos: Dict[str, List[Tuple[float, int]]] = {campo: [] for campo in CAMPOS_NUMERICOS}
+        self._geo = GrillaGeo()
+        self._clusters = JerarquiaClusters()
+        self._coordenadas: Dict[str, Set[int]] = {}
+        self._cargando = False
+
+    # CARGA Y ACTUALIZACIÓN
+
+    # Funcionamiento: Reemplaza todo el contenido del índice con las 'filas' recibidas.
+    # Retorna (IDs nuevos o con algún campo indexado distinto, IDs que ya no están) respecto del contenido anterior.
+    def cargar(self, filas: Iterable[Dict[str, Any]]) -> Tuple[List[int], List[int]]:
+        with self._lock:
+            anteriores = dict(self._documentos)
+            self._vocabulario_sucio = True
+            self._documentos.clear()
+            self._ids.clear()
+            self._palabras.clear()
+            self._postings.clear()
+            self._categorias.clear()
+            self._geo.limpiar()
+            self._clusters.limpiar()
+            self._coordenadas.clear()
+            # Durante la carga los arreglos numéricos se llenan sin orden y se ordenan una vez al final
+            self._cargando = True
+            for lista in self._numericos.values():
+                lista.clear()
+            for fila in filas:
+                self._agregar(fila)
+            for lista in self._numericos.values():
+                lista.sort()
+            self._ids.sort()
+            self._cargando = False
+            self._cargado_en = time.monotonic()
+            actualizados = [i for i in self._ids if anteriores.get(i) != self._documentos[i]]
+            eliminados = sorted(i for i in anteriores if i not in self._documentos)
+            return actualizados, eliminados
+
+    # Funcionamiento: Indica si el índice nunca se cargó o si pasó más de 'ttl' desde la última carga.
+    def vencido(self) -> bool:
+        with self._lock:
+            return self._cargado_en is None or time.monotonic() - self._cargado_en >= self.ttl
+
+    # Funcionamiento: Marca el índice como vencido (la próxima consulta lo vuelve a cargar).
+    def invalidar(self) -> None:
+        with self._lock:
+            self._cargado_en = None
+
+    # Funcionamiento: Posterga la próxima recarga 'segundos' (ej. si Supabase no respondió, se sigue usando
+    # lo que ya tiene en vez de reintentar en cada consulta).
+    def aplazar_recarga(self, segundos: float) -> None:
+        with self._lock:
+            self._cargado_en = time.monotonic() - self.ttl + segundos
+
+    # Funcionamiento: Agrega una propiedad nueva o reemplaza la versión anterior (alta o edición).
+    # Si la fila trae solo algunos campos, los demás se conservan de la versión indexada.
+    def guardar(self, fila: Dict[str, Any]) -> None:
+        propiedad_id = fila.get("id")
+        if propiedad_id is None:
+            return
+        with self._lock:
+            anterior = self._documentos.get(propiedad_id, {})
+            self._quitar(propiedad_id)
+            self._agregar({**anterior, **fila})
+
+    # Funcionamiento: Quita una propiedad del índice (baja).
+    def eliminar(self, propiedad_id: int) -> None:
+        with self._lock:
+            self._quitar(propiedad_id)
+
+    def _agregar(self, fila: Dict[str, Any]) -> None:
+        propiedad_id = fila.get("id")
+        if propiedad_id is None:
+            return
+        documento = {
+            campo: fila.get(campo) for campo in CAMPOS_TEXTO + CAMPOS_CATEGORIA + CAMPOS_NUMERICOS + CAMPOS_MAPA
+        }
+        self._documentos[propiedad_id] = documento
+        if self._cargando:
+            self._ids.append(propiedad_id)
+        else:
+            bisect.insort(self._ids, propiedad_id)
+
+        palabras = set()
+        for campo in CAMPOS_TEXTO:
+            palabras |= tokenizar(documento[campo])
+        self._palabras[propiedad_id] = palabras
+        for palabra in palabras:
+            if palabra not in self._postings:
+                self._postings[palabra] = set()
+                if not self._vocabulario_sucio:
+                    bisect.insort(self._vocabulario, palabra)
+            self._postings[palabra].add(propiedad_id)
+
+        for campo in CAMPOS_CATEGORIA:
+            self._categorias.setdefault((campo, plegar_texto(documento[campo]).strip()), set()).add(propiedad_id)
+
+        for campo in CAMPOS_NUMERICOS:
+            valor = _numero(documento[campo])
+            if valor is None:
+                continue
+            if self._cargando:
+                self._numericos[campo].append((valor, propiedad_id))
+            else:
+                bisect.insort(self._numericos[campo], (valor, propiedad_id))
+
+        clave = clave_coordenadas(documento["coordenadas"])
+        if clave is not None:
+            self._coordenadas.setdefault(clave, set()).add(propiedad_id)
+
+        punto = parsear_coordenadas(documento["coordenadas"])
+        if punto is not None and documento["activo"] is not False:
+            self._geo.guardar(propiedad_id, *punto)
+            self._clusters.guardar(propiedad_id, *punto, _numero(documento["precio"]))
+
+    def _quitar(self, propiedad_id: int) -> None:
+        documento = self._documentos.pop(propiedad_id, None)
+        if documento is None:
+            return
+        del self._ids[bisect.bisect_left(self._ids, propiedad_id)]
+        self._geo.eliminar(propiedad_id)
+        self._clusters.eliminar(propiedad_id)
+        clave = clave_coordenadas(documento["coordenadas"])
+        ids = self._coordenadas.get(clave)
+        if ids is not None:
+            ids.discard(propiedad_id)
+            if not ids:
+                del self._coordenadas[clave]
+        for palabra in self._palabras.pop(propiedad_id, ()):
+            ids = self._postings.get(palabra)
+            if ids is not None:
+                ids.discard(propiedad_id)
+                if not ids:
+                    del self._postings[palabra]
+                    if not self._vocabulario_sucio:
+                        del self._vocabulario[bisect.bisect_left(self._vocabulario, palabra)]
+        for campo in CAMPOS_CATEGORIA:
+            clave = (campo, plegar_texto(documento[campo]).strip())
+            ids = self._categorias.get(clave)
+            if ids is not None:
+                ids.discard(propiedad_id)
+                if not ids:
+                    del self._categorias[clave]
+        for campo in CAMPOS_NUMERICOS:
+            valor = _numero(documento[campo])
+            if valor is None:
+                continue
+            lista = self._numericos[campo]
+            posicion = bisect.bisect_left(lista, (valor, propiedad_id))
+            if posicion < len(lista) and lista[posicion] == (valor, propiedad_id):
+                del lista[posicion]
+
+    # CONSULTAS
+
+    # Funcionamiento: Función interna (helper).
+    # Retorna los IDs cuyo texto tiene alguna palabra que empieza con 'prefijo'.
+    # Usa el vocabulario ordenado (bisect), así "curi" encuentra "curico" sin recorrer todo.
+    # El vocabulario se ordena completo solo después de una carga; las altas/bajas lo mantienen ordenado.
+    def _ids_con_prefijo(self, prefijo: str) -> Set[int]:
+        if self._vocabulario_sucio:
+            self._vocabulario = sorted(self._postings)
+            self._vocabulario_sucio = False
+        ids: Set[int] = set()
+        inicio = bisect.bisect_left(self._vocabulario, prefijo)
+        for palabra in self._vocabulario[inicio:]:
+            if not palabra.startswith(prefijo):
+                break
+            ids |= self._postings[palabra]
+        return ids
+
+    # Funcionamiento: Búsqueda de texto libre. Cada palabra de 'q' debe aparecer (como palabra o
+    # comienzo de palabra, sin distinguir mayúsculas ni tildes) en nombre, localización o descripción.
+    # Intersecta las listas de IDs empezando por la más corta. Retorna None si 'q' no tiene palabras.
+    def buscar_texto(self, q: str) -> Optional[Set[int]]:
+        palabras = tokenizar(q)
+        if not palabras:
+            return None
+        with self._lock:
+            listas = sorted((self._ids_con_prefijo(p) for p in palabras), key=len)
+        resultado = set(listas[0])
+        for ids in listas[1:]:
+            if not resultado:
+                break
+            resultado &= ids
+        return resultado
+
+    # Funcionamiento: Retorna los IDs cuyo 'campo' numérico está entre 'minimo' y 'maximo'
+    # (ambos incluidos; None = sin límite). Son dos búsquedas binarias sobre el arreglo ordenado.
+    def ids_en_rango(self, campo: str, minimo: Optional[float], maximo: Optional[float]) -> Set[int]:
+        with self._lock:
+            lista = self._numericos[campo]
+            desde = 0 if minimo is None else bisect.bisect_left(lista, (minimo,))
+            hasta = len(lista) if maximo is None else bisect.bisect_right(lista, (maximo, math.inf))
+            return {propiedad_id for _, propiedad_id in lista[desde:hasta]}
+
+    # Funcionamiento: Aplica los filtros del catálogo: q, tipo, estado, propietario, min_/max_ de cada campo numérico
+    # (precio, dormitorios, baños, area; 0 o vacío = sin límite) y radio_km desde lat/lng.
+    # Intersecta los conjuntos de IDs. Retorna la lista de IDs que cumplen todos, ordenada por ID
+    # o, con orden='distancia' (y lat/lng), de la más cercana a la más lejana (solo propiedades en el mapa).
+    # Si se pasa 'limite' retorna solo los primeros; ordenando por distancia usa la búsqueda de k-vecinos.
+    def consultar(self, filtros: Dict[str, Any], limite: Optional[int] = None) -> List[int]:
+        with self._lock:
+            candidatos = self._candidatos(filtros)
+            origen = _origen(filtros)
+            if origen is not None and filtros.get("orden") == "distancia":
+                if limite is not None:
+                    cercanos = self._geo.cercanos(*origen, limite, candidatos)
+                else:
+                    cercanos = self._geo.ordenar_por_distancia(*origen, candidatos)
+                return [propiedad_id for _, propiedad_id in cercanos]
+            ids = sorted(self._documentos.keys() if candidatos is None else candidatos)
+            return ids if limite is None else ids[:limite]
+
+    # Funcionamiento: Paginación por cursor (keyset sobre el ID): retorna hasta 'limite' IDs que cumplen
+    # los 'filtros' y son mayores que 'despues_de' (None = desde el principio), ordenados por ID.
+    # Sin filtros es una búsqueda binaria en la lista ordenada de IDs; con filtros se eligen
+    # los 'limite' menores del conjunto de candidatos, sin ordenarlo completo.
+    def consultar_despues_de(self, filtros: Dict[str, Any], despues_de: Optional[int], limite: int) -> List[int]:
+        with self._lock:
+            candidatos = self._candidatos(filtros)
+            if candidatos is None:
+                desde = 0 if despues_de is None else bisect.bisect_right(self._ids, despues_de)
+                return self._ids[desde:desde + limite]
+            if despues_de is not None:
+                candidatos = (propiedad_id for propiedad_id in candidatos if propiedad_id > despues_de)
+            return heapq.nsmallest(limite, candidatos)
+
+    # Funcionamiento: Retorna cuántas propiedades cumplen los 'filtros' (el total de 'consultar' sin límite),
+    # sin ordenarlas.
+    def contar(self, filtros: Dict[str, Any]) -> int:
+        with self._lock:
+            candidatos = self._candidatos(filtros)
+            if _origen(filtros) is not None and filtros.get("orden") == "distancia":
+                return self._geo.contar(candidatos)
+            return len(self._documentos if candidatos is None else candidatos)
+
+    # Funcionamiento: Retorna una copia de los campos indexados de la propiedad (None si no está en el índice).
+    def documento(self, propiedad_id: int) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            documento = self._documentos.get(propiedad_id)
+            return dict(documento) if documento is not None else None
+
+    # Funcionamiento: Retorna los IDs de las propiedades que tienen estas 'coordenadas'
+    # (comparadas en su forma normalizada, ver clave_coordenadas).
+    def ids_con_coordenadas(self, coordenadas: Any) -> Set[int]:
+        clave = clave_coordenadas(coordenadas)
+        with self._lock:
+            return set(self._coordenadas.get(clave, ())) if clave is not None else set()
+
+    # Funcionamiento: Retorna {id: distancia_km} desde (lat, lng) para los 'ids' que tienen coordenadas.
+    def distancias_km(self, ids: Iterable[int], lat: float, lng: float) -> Dict[int, float]:
+        with self._lock:
+            cercanos = self._geo.ordenar_por_distancia(lat, lng, ids)
+            return {propiedad_id: distancia for distancia, propiedad_id in cercanos}
+
+    # Funcionamiento: Retorna los marcadores (id, nombre, precio, localización, tipo, estado,
+    # propietario, lat, lng) de las propiedades activas dentro de 'caja' (min_lat, min_lng, max_lat, max_lng)
+    # que además cumplen los 'filtros' del catálogo, ordenados por ID.
+    def marcadores(self, caja: Caja, filtros: Optional[Dict[str, Any]] = None) -> List[Dict[str, Any]]:
+        with self._lock:
+            ids = self._geo.en_caja(*caja)
+            candidatos = self._candidatos(filtros or {})
+            if candidatos is not None:
+                ids &= candidatos
+            return [self._marcador(propiedad_id) for propiedad_id in sorted(ids)]
+
+    # Funcionamiento: Clusters del mapa para un nivel de 'zoom' (0 a ZOOM_CLUSTER_MAXIMO) dentro de 'caja'.
+    # Sin filtros usa la jerarquía precalculada; con filtros agrupa al vuelo solo las propiedades que cumplen.
+    # Retorna (clusters, marcadores): los clusters de 2 o más propiedades (cantidad, centroide lat/lng,
+    # precio_min, precio_max) y, como marcadores normales, las propiedades que quedan solas en su celda.
+    def clusters(
+        self, caja: Caja, zoom: int, filtros: Optional[Dict[str, Any]] = None
+    ) -> Tuple[List[Dict[str, Any]], List[Dict[str, Any]]]:
+        with self._lock:
+            candidatos = self._candidatos(filtros or {})
+            if candidatos is None:
+                grupos = self._clusters.en_caja(zoom, caja)
+            else:
+                caja_celdas = self._clusters.caja_de_celdas(zoom, caja)
+                grupos = self._clusters.agrupar(zoom, self._geo.en_caja(*caja_celdas) & candidatos)
+
+            resumenes, sueltos = [], []
+            for grupo in grupos:
+                if len(grupo.ids) == 1:
+                    sueltos.extend(grupo.ids)
+                else:
+                    resumenes.append(grupo.resumen())
+            resumenes.sort(key=lambda cluster: (cluster["lat"], cluster["lng"]))
+            return resumenes, [self._marcador(propiedad_id) for propiedad_id in sorted(sueltos)]
+
+    # Funcionamiento: Función interna (helper). Arma el marcador del mapa de una propiedad de la grilla.
+    def _marcador(self, propiedad_id: int) -> Dict[str, Any]:
+        documento = self._documentos[propiedad_id]
+        lat, lng = self._geo.punto(propiedad_id)
+        marcador = {"id": propiedad_id, **{campo: documento[campo] for campo in CAMPOS_MARCADOR}}
+        return {**marcador, "lat": lat, "lng": lng}
+
+    # Funcionamiento: Función interna (helper).
+    # Intersecta los conjuntos de IDs de cada filtro activo. Retorna None si no hay ningún filtro.
+    def _candidatos(self, filtros: Dict[str, Any]) -> Optional[Set[int]]:
+        with self._lock:
+            candidatos: Optional[Set[int]] = None
+
+            def restringir(ids: Set[int]) -> None:
+                nonlocal candidatos
+                candidatos = set(ids) if candidatos is None else candidatos & ids
+
+            texto = self.buscar_texto(filtros.get("q") or "")
+            if texto is not None:
+                restringir(texto)
+            for campo in CAMPOS_CATEGORIA:
+                if filtros.get(campo):
+                    restringir(self._categorias.get((campo, plegar_texto(filtros[campo]).strip()), set()))
+
+            for campo in CAMPOS_NUMERICOS:
+                minimo = filtros.get(f"min_{campo}") or None
+                maximo = filtros.get(f"max_{campo}") or None
+                if minimo is not None or maximo is not None:
+                    restringir(self.ids_en_rango(campo, minimo, maximo))
+
+            origen = _origen(filtros)
+            if origen is not None and filtros.get("radio_km"):
+                restringir(set(self._geo.en_radio(*origen, filtros["radio_km"])))
+            return candidatos
+
+
+# Funcionamiento: Función interna (helper).
+# Retorna el punto de origen (lat, lng) de los filtros de distancia, o None si no vienen los dos.
+def _origen(filtros: Dict[str, Any]) -> Optional[Tuple[float, float]]:
+    lat, lng = filtros.get("lat"), filtros.get("lng")
+    if lat is None or lng is None:
+        return None
+    return lat, lng
+
+
+# Funcionamiento: Función interna (helper).
+# Convierte el valor de un campo numérico a float (None si está vacío o no es un número).
+def _numero(valor: Any) -> Optional[float]:
+    try:
+        return float(valor)
+    except (TypeError, ValueError):
+        return None
@@ -0,0 +1,328 @@
+import bisect
+import math
+from typing import Any, Dict, Iterable, Iterator, List, Optional, Set, Tuple, TypeVar
+
+# ÍNDICE ESPACIAL (GRILLA) DE LAS PROPIEDADES
+#
+# Las coordenadas se guardan en la BD como texto ("lat,lng"). Aquí se convierten una sola vez
+# a números y cada propiedad se ubica en una celda de una grilla de 'tamano_celda' grados
+# (0.01° ≈ 1,1 km). Una consulta por rectángulo (la vista del mapa) solo revisa las celdas
+# que lo cubren, no todas las propiedades.
+#
+# Para los zoom alejados se mantiene además una jerarquía de clusters: por cada nivel de zoom
+# (0 a ZOOM_CLUSTER_MAXIMO) las propiedades se agrupan en celdas de ~PIXELES_CLUSTER píxeles en pantalla,
+# y cada celda guarda cantidad, centroide y precio mínimo/máximo. Se actualiza con cada alta,
+# movimiento o baja, así el mapa recibe unos pocos clusters en vez de miles de marcadores.
+#
+# La misma grilla resuelve las búsquedas por distancia: "dentro de X km" (rectángulo que contiene
+# el círculo + distancia exacta) y "las k más cercanas" (agranda el radio hasta juntar k).
+
+TAMANO_CELDA = 0.01
+ZOOM_CLUSTER_MAXIMO = 14
+PIXELES_CLUSTER = 64
+RADIO_TIERRA_KM = 6371.0088
+KM_POR_GRADO = math.pi * RADIO_TIERRA_KM / 180
+# Ningún punto de la Tierra está más lejos que media circunferencia
+DISTANCIA_MAXIMA_KM = math.pi * RADIO_TIERRA_KM
+
+Caja = Tuple[float, float, float, float]
+Celda = Tuple[int, int]
+T = TypeVar("T")
+
+
+# Funcionamiento: Convierte el texto de 'coordenadas' ("-35.0, -71.2") a una tupla (lat, lng) de floats.
+# Retorna None si no tiene dos números o si están fuera de rango (lat ±90, lng ±180).
+def parsear_coordenadas(valor: Any) -> Optional[Tuple[float, float]]:
+    if not isinstance(valor, str):
+        return None
+    partes = valor.split(",")
+    if len(partes) != 2:
+        return None
+    try:
+        lat, lng = float(partes[0]), float(partes[1])
+    except ValueError:
+        return None
+    if not (math.isfinite(lat) and math.isfinite(lng)):
+        return None
+    if not (-90 <= lat <= 90 and -180 <= lng <= 180):
+        return None
+    return lat, lng
+
+
+# Funcionamiento: Retorna la forma normalizada de 'coordenadas' para compararlas (índice de unicidad):
+# si son dos números válidos, "lat,lng" con 6 decimales ("-35.0, -71.20" -> "-35.000000,-71.200000");
+# si no, el texto sin espacios a los lados y en minúsculas. Retorna None si viene vacío.
+# La función SQL clave_coordenadas (docs/migraciones.sql) hace lo mismo para el índice único de la BD.
+def clave_coordenadas(valor: Any) -> Optional[str]:
+    punto = parsear_coordenadas(valor)
+    if punto is not None:
+        # '+ 0.0' evita que -0.0 y 0.0 den claves distintas
+        return f"{punto[0] + 0.0:.6f},{punto[1] + 0.0:.6f}"
+    texto = str(valor).strip().lower() if valor is not None else ""
+    return texto or None
+
+
+# Funcionamiento: Distancia (km, fórmula de haversine) desde el punto (lat, lng) a cada uno de 'puntos',
+# una lista de (id, lat, lng). Los senos/cosenos del punto de origen se calculan una sola vez.
+# Retorna una lista de (distancia_km, id) en el mismo orden.
+def distancias_km(lat: float, lng: float, puntos: Iterable[Tuple[int, float, float]]) -> List[Tuple[float, int]]:
+    lat0, lng0 = math.radians(lat), math.radians(lng)
+    cos_lat0 = math.cos(lat0)
+    sin, cos, asin, sqrt, radians = math.sin, math.cos, math.asin, math.sqrt, math.radians
+    resultado = []
+    for propiedad_id, lat1, lng1 in puntos:
+        lat1, lng1 = radians(lat1), radians(lng1)
+        a = sin((lat1 - lat0) / 2) ** 2 + cos_lat0 * cos(lat1) * sin((lng1 - lng0) / 2) ** 2
+        resultado.append((2 * RADIO_TIERRA_KM * asin(min(1.0, sqrt(a))), propiedad_id))
+    return resultado
+
+
+# Funcionamiento: Retorna el rectángulo (min_lat, min_lng, max_lat, max_lng) que contiene el círculo
+# de 'radio_km' alrededor de (lat, lng). Si el círculo toca un polo o cruza el meridiano 180,
+# se usan todas las longitudes.
+def caja_de_radio(lat: float, lng: float, radio_km: float) -> Caja:
+    delta_lat = radio_km / KM_POR_GRADO
+    min_lat, max_lat = lat - delta_lat, lat + delta_lat
+    if min_lat <= -90 or max_lat >= 90:
+        return max(min_lat, -90), -180, min(max_lat, 90), 180
+    delta_lng = delta_lat / math.cos(math.radians(lat))
+    if lng - delta_lng < -180 or lng + delta_lng > 180:
+        return min_lat, -180, max_lat, 180
+    return min_lat, lng - delta_lng, max_lat, lng + delta_lng
+
+
+# Funcionamiento: Retorna el tamaño (en grados) de la celda de cluster para un nivel de 'zoom'.
+# En el zoom z el mundo mide 256·2^z píxeles de ancho (teselas de Leaflet/OpenStreetMap).
+def tamano_celda_cluster(zoom: int) -> float:
+    return 360.0 / (256 * 2 ** zoom) * PIXELES_CLUSTER
+
+
+# Funcionamiento: Función interna (helper). Retorna la celda (fila, columna) de un punto.
+def _celda(lat: float, lng: float, tamano: float) -> Celda:
+    return math.floor(lat / tamano), math.floor(lng / tamano)
+
+
+# Funcionamiento: Función interna (helper).
+# Recorre las celdas ocupadas ('celdas') que tocan el rectángulo 'caja'. Si el rectángulo cubre más celdas
+# de las que hay ocupadas (ej. zoom muy alejado), recorre las ocupadas en vez de todas las del rectángulo.
+# Retorna pares (celda, valor, interior); 'interior' indica que la celda queda completa dentro de la caja.
+def _celdas_en_caja(celdas: Dict[Celda, T], tamano: float, caja: Caja) -> Iterator[Tuple[Celda, T, bool]]:
+    min_lat, min_lng, max_lat, max_lng = caja
+    fila_min, col_min = _celda(min_lat, min_lng, tamano)
+    fila_max, col_max = _celda(max_lat, max_lng, tamano)
+    cantidad = (fila_max - fila_min + 1) * (col_max - col_min + 1)
+
+    if cantidad <= len(celdas):
+        candidatas: Iterable[Celda] = (
+            (fila, col)
+            for fila in range(fila_min, fila_max + 1)
+            for col in range(col_min, col_max + 1)
+        )
+    else:
+        candidatas = list(celdas)
+    for celda in candidatas:
+        fila, col = celda
+        if celda not in celdas or not (fila_min <= fila <= fila_max and col_min <= col <= col_max):
+            continue
+        yield celda, celdas[celda], fila_min < fila < fila_max and col_min < col < col_max
+
+
+class GrillaGeo:
+    # Funcionamiento: No es thread-safe por sí sola; el índice del catálogo la usa bajo su propio lock.
+    def __init__(self, tamano_celda: float = TAMANO_CELDA):
+        self.tamano_celda = tamano_celda
+        self._puntos: Dict[int, Tuple[float, float]] = {}
+        self._celdas: Dict[Tuple[int, int], Set[int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._puntos)
+
+    # Funcionamiento: Vacía la grilla (antes de una carga completa).
+    def limpiar(self) -> None:
+        self._puntos.clear()
+        self._celdas.clear()
+
+    # Funcionamiento: Ubica (o mueve) la propiedad 'propiedad_id' en el punto (lat, lng).
+    def guardar(self, propiedad_id: int, lat: float, lng: float) -> None:
+        self.eliminar(propiedad_id)
+        self._puntos[propiedad_id] = (lat, lng)
+        self._celdas.setdefault(_celda(lat, lng, self.tamano_celda), set()).add(propiedad_id)
+
+    # Funcionamiento: Quita la propiedad de la grilla (si estaba).
+    def eliminar(self, propiedad_id: int) -> None:
+        punto = self._puntos.pop(propiedad_id, None)
+        if punto is None:
+            return
+        celda = _celda(*punto, self.tamano_celda)
+        ids = self._celdas.get(celda)
+        if ids is not None:
+            ids.discard(propiedad_id)
+            if not ids:
+                del self._celdas[celda]
+
+    # Funcionamiento: Retorna el punto (lat, lng) de una propiedad, o None si no está en la grilla.
+    def punto(self, propiedad_id: int) -> Optional[Tuple[float, float]]:
+        return self._puntos.get(propiedad_id)
+
+    # Funcionamiento: Retorna los IDs cuyo punto está dentro del rectángulo (bordes incluidos).
+    def en_caja(self, min_lat: float, min_lng: float, max_lat: float, max_lng: float) -> Set[int]:
+        resultado: Set[int] = set()
+        caja = (min_lat, min_lng, max_lat, max_lng)
+        for _, ids, interior in _celdas_en_caja(self._celdas, self.tamano_celda, caja):
+            if interior:
+                # Celda interior: todos sus puntos están dentro del rectángulo
+                resultado |= ids
+                continue
+            for propiedad_id in ids:
+                lat, lng = self._puntos[propiedad_id]
+                if min_lat <= lat <= max_lat and min_lng <= lng <= max_lng:
+                    resultado.add(propiedad_id)
+        return resultado
+
+    # Funcionamiento: Retorna {id: distancia_km} de las propiedades a 'radio_km' o menos de (lat, lng).
+    # Solo se calcula la distancia de las que caen en el rectángulo que contiene el círculo.
+    # 'permitidos' (opcional) limita el resultado a esos IDs (ej. los que cumplen los demás filtros).
+    def en_radio(
+        self, lat: float, lng: float, radio_km: float, permitidos: Optional[Set[int]] = None
+    ) -> Dict[int, float]:
+        ids = self.en_caja(*caja_de_radio(lat, lng, radio_km))
+        if permitidos is not None:
+            ids &= permitidos
+        return {
+            propiedad_id: distancia
+            for distancia, propiedad_id in distancias_km(lat, lng, self._con_puntos(ids))
+            if distancia <= radio_km
+        }
+
+    # Funcionamiento: Búsqueda de las 'k' propiedades más cercanas a (lat, lng) (k-vecinos más cercanos).
+    # Parte con un radio del tamaño de una celda y lo duplica hasta tener 'k' propiedades dentro del círculo
+    # (las que están dentro del círculo son seguro más cercanas que cualquiera de afuera).
+    # 'permitidos' (opcional) limita la búsqueda a esos IDs. Retorna [(distancia_km, id)] de menor a mayor.
+    def cercanos(
+        self, lat: float, lng: float, k: int, permitidos: Optional[Set[int]] = None
+    ) -> List[Tuple[float, int]]:
+        k = min(k, self.contar(permitidos))
+        if k <= 0:
+            return []
+        radio = self.tamano_celda * KM_POR_GRADO
+        while True:
+            dentro = self.en_radio(lat, lng, radio, permitidos)
+            if len(dentro) >= k or radio >= DISTANCIA_MAXIMA_KM:
+                return sorted((distancia, propiedad_id) for propiedad_id, distancia in dentro.items())[:k]
+            radio = min(radio * 2, DISTANCIA_MAXIMA_KM)
+
+    # Funcionamiento: Retorna [(distancia_km, id)] de menor a mayor distancia a (lat, lng), para los 'ids'
+    # indicados (o todas las propiedades de la grilla si es None). Los que no están en la grilla se omiten.
+    def ordenar_por_distancia(
+        self, lat: float, lng: float, ids: Optional[Iterable[int]] = None
+    ) -> List[Tuple[float, int]]:
+        return sorted(distancias_km(lat, lng, self._con_puntos(self._puntos if ids is None else ids)))
+
+    # Funcionamiento: Retorna cuántos de los 'ids' (o todas si es None) están en la grilla.
+    def contar(self, ids: Optional[Iterable[int]] = None) -> int:
+        return len(self._puntos) if ids is None else sum(1 for i in ids if i in self._puntos)
+
+    # Funcionamiento: Función interna (helper). Retorna (id, lat, lng) de los 'ids' que están en la grilla.
+    def _con_puntos(self, ids: Iterable[int]) -> List[Tuple[int, float, float]]:
+        return [(i, *self._puntos[i]) for i in ids if i in self._puntos]
+
+
+class Cluster:
+    # Funcionamiento: Acumula las propiedades de una celda: IDs, suma de lat/lng (para el centroide)
+    # y los precios ordenados (para el mínimo y máximo, también al quitar una propiedad).
+    def __init__(self):
+        self.ids: Set[int] = set()
+        self.suma_lat = 0.0
+        self.suma_lng = 0.0
+        self.precios: List[float] = []
+
+    def agregar(self, propiedad_id: int, lat: float, lng: float, precio: Optional[float]) -> None:
+        self.ids.add(propiedad_id)
+        self.suma_lat += lat
+        self.suma_lng += lng
+        if precio is not None:
+            bisect.insort(self.precios, precio)
+
+    def quitar(self, propiedad_id: int, lat: float, lng: float, precio: Optional[float]) -> None:
+        self.ids.discard(propiedad_id)
+        self.suma_lat -= lat
+        self.suma_lng -= lng
+        if precio is not None:
+            posicion = bisect.bisect_left(self.precios, precio)
+            if posicion < len(self.precios) and self.precios[posicion] == precio:
+                del self.precios[posicion]
+
+    # Funcionamiento: Retorna el cluster como diccionario para el JSON del mapa.
+    def resumen(self) -> Dict[str, Any]:
+        cantidad = len(self.ids)
+        return {
+            "cantidad": cantidad,
+            "lat": self.suma_lat / cantidad,
+            "lng": self.suma_lng / cantidad,
+            "precio_min": self.precios[0] if self.precios else None,
+            "precio_max": self.precios[-1] if self.precios else None,
+        }
+
+
+class JerarquiaClusters:
+    # Funcionamiento: Un diccionario {celda: Cluster} por cada nivel de zoom (0 a 'zoom_maximo').
+    # Igual que la grilla, no es thread-safe por sí sola.
+    def __init__(self, zoom_maximo: int = ZOOM_CLUSTER_MAXIMO):
+        self.zoom_maximo = zoom_maximo
+        self._niveles: Dict[int, Dict[Celda, Cluster]] = {z: {} for z in range(zoom_maximo + 1)}
+        self._puntos: Dict[int, Tuple[float, float, Optional[float]]] = {}
+
+    # Funcionamiento: Vacía todos los niveles (antes de una carga completa).
+    def limpiar(self) -> None:
+        self._puntos.clear()
+        for nivel in self._niveles.values():
+            nivel.clear()
+
+    # Funcionamiento: Agrega la propiedad (o la mueve, si cambió de punto o de precio) en todos los niveles.
+    def guardar(self, propiedad_id: int, lat: float, lng: float, precio: Optional[float]) -> None:
+        self.eliminar(propiedad_id)
+        self._puntos[propiedad_id] = (lat, lng, precio)
+        for zoom, nivel in self._niveles.items():
+            celda = _celda(lat, lng, tamano_celda_cluster(zoom))
+            nivel.setdefault(celda, Cluster()).agregar(propiedad_id, lat, lng, precio)
+
+    # Funcionamiento: Quita la propiedad de todos los niveles (baja o desactivación).
+    def eliminar(self, propiedad_id: int) -> None:
+        punto = self._puntos.pop(propiedad_id, None)
+        if punto is None:
+            return
+        lat, lng, precio = punto
+        for zoom, nivel in self._niveles.items():
+            celda = _celda(lat, lng, tamano_celda_cluster(zoom))
+            cluster = nivel.get(celda)
+            if cluster is None:
+                continue
+            cluster.quitar(propiedad_id, lat, lng, precio)
+            if not cluster.ids:
+                del nivel[celda]
+
+    # Funcionamiento: Retorna los clusters del nivel 'zoom' cuyas celdas tocan 'caja'.
+    def en_caja(self, zoom: int, caja: Caja) -> List[Cluster]:
+        nivel = self._niveles[zoom]
+        return [cluster for _, cluster, _ in _celdas_en_caja(nivel, tamano_celda_cluster(zoom), caja)]
+
+    # Funcionamiento: Agrupa al vuelo los 'ids' indicados (ej. los que cumplen un filtro) en celdas del nivel 'zoom'.
+    # Retorna los clusters resultantes (mismas celdas que los precalculados).
+    def agrupar(self, zoom: int, ids: Iterable[int]) -> List[Cluster]:
+        tamano = tamano_celda_cluster(zoom)
+        celdas: Dict[Celda, Cluster] = {}
+        for propiedad_id in ids:
+            punto = self._puntos.get(propiedad_id)
+            if punto is None:
+                continue
+            lat, lng, precio = punto
+            celdas.setdefault(_celda(lat, lng, tamano), Cluster()).agregar(propiedad_id, lat, lng, precio)
+        return list(celdas.values())
+
+    # Funcionamiento: Retorna la caja 'caja' agrandada hasta los bordes de las celdas del nivel 'zoom'
+    # (así una consulta filtrada cuenta los mismos puntos que el cluster precalculado de esa celda).
+    def caja_de_celdas(self, zoom: int, caja: Caja) -> Caja:
+        tamano = tamano_celda_cluster(zoom)
+        fila_min, col_min = _celda(caja[0], caja[1], tamano)
+        fila_max, col_max = _celda(caja[2], caja[3], tamano)
+        return (fila_min * tamano, col_min * tamano, (fila_max + 1) * tamano, (col_max + 1) * tamano)
@@ -0,0 +1,234 @@
+import asyncio
+import os
+import threading
+from typing import Any, Callable, Dict, Iterable, Optional
+
+try:
+    from realtime import AsyncRealtimeClient
+except ImportError:  # viene con 'supabase'; sin él solo queda el modo de sondeo
+    AsyncRealtimeClient = None
+
+# INVALIDACIÓN DE CACHÉS ENTRE PROCESOS
+#
+# Con varios procesos de la app (o con ediciones hechas directo en Supabase), los cachés, el índice del
+# catálogo y el registro de cambios de un proceso no ven lo que escriben los demás. Aquí se escuchan los
+# cambios de Postgres de las tablas de usuarios y propiedades (canal Realtime de Supabase, "postgres_changes")
+# y cada uno se entrega a un 'receptor' (base_datos.aplicar_cambio_externo) que descarta o actualiza solo
+# lo afectado. Solo mientras el canal no está conectado corre un hilo que cada 'intervalo_sondeo' segundos llama
+# a 'sondear' (base_datos.sondear_cambios_externos), y una vez más al reconectarse, para cubrir lo ocurrido
+# entre medio; después el hilo termina. Con el canal conectado no se consulta nada a Supabase.
+# FuenteFalsa emite los mismos eventos sin Supabase (pruebas y desarrollo local).
+#
+# Cada evento es un diccionario {"tabla", "tipo" ("INSERT", "UPDATE" o "DELETE"), "nuevo", "anterior"},
+# con la fila nueva y la anterior (None si el evento no la trae; en un DELETE 'anterior' suele traer solo el id).
+# Requiere habilitar Realtime en ambas tablas:
+# alter publication supabase_realtime add table users, propiedades;
+
+INTERVALO_SONDEO = float(os.getenv("INVALIDACION_SONDEO_SEGUNDOS", "30"))
+REINTENTO_CANAL = 30.0         # segundos entre intentos de volver a abrir el canal Realtime
+
+
+class FuenteFalsa:
+    # Funcionamiento: Fuente local de eventos. 'conectada' = False simula el canal caído:
+    # lo que se emita mientras tanto se pierde (como en Realtime) y el invalidador pasa a sondear.
+    def __init__(self, conectada: bool = True):
+        self._conectada = conectada
+        self._receptor: Optional[Callable[[Dict[str, Any]], None]] = None
+        self._al_cambiar_conexion: Optional[Callable[[bool], None]] = None
+
+    @property
+    def conectada(self) -> bool:
+        return self._conectada
+
+    @conectada.setter
+    def conectada(self, conectada: bool) -> None:
+        self._conectada = conectada
+        if self._al_cambiar_conexion is not None:
+            self._al_cambiar_conexion(conectada)
+
+    # Funcionamiento: 'receptor' recibe cada evento; 'al_cambiar_conexion' (opcional) recibe True/False
+    # cada vez que la fuente se conecta o se desconecta.
+    def iniciar(self, receptor: Callable[[Dict[str, Any]], None],
+                al_cambiar_conexion: Optional[Callable[[bool], None]] = None) -> None:
+        self._receptor = receptor
+        self._al_cambiar_conexion = al_cambiar_conexion
+
+    def detener(self) -> None:
+        self._receptor = None
+
+    # Funcionamiento: Entrega al receptor un evento de 'tabla' como los de Realtime.
+    # Retorna True si se entregó (False si la fuente está "desconectada" o detenida).
+    def emitir(self, tabla: str, tipo: str, nuevo: Optional[Dict[str, Any]] = None,
+               anterior: Optional[Dict[str, Any]] = None) -> bool:
+        if not self.conectada or self._receptor is None:
+            return False
+        self._receptor({"tabla": tabla, "tipo": tipo, "nuevo": nuevo, "anterior": anterior})
+        return True
+
+
+class FuenteRealtime:
+    # Funcionamiento: Escucha los cambios de 'tablas' en Supabase Realtime ('url' y 'clave' del proyecto).
+    # El cliente de Python es asíncrono, así que corre en su propio event loop dentro de un hilo daemon.
+    # Si el canal se cae, la fuente queda desconectada y cada REINTENTO_CANAL segundos se vuelve a abrir.
+    def __init__(self, url: str, clave: str, tablas: Iterable[str], esquema: str = "public"):
+        self.url = url.rstrip("/")
+        self.clave = clave
+        self.tablas = tuple(tablas)
+        self.esquema = esquema
+        self._receptor: Optional[Callable[[Dict[str, Any]], None]] = None
+        self._al_cambiar_conexion: Optional[Callable[[bool], None]] = None
+        self._cliente: Any = None
+        self._suscrita = False
+        self._detenida = threading.Event()
+
+    @property
+    def conectada(self) -> bool:
+        return self._suscrita and self._cliente is not None and self._cliente.is_connected
+
+    def iniciar(self, receptor: Callable[[Dict[str, Any]], None],
+                al_cambiar_conexion: Optional[Callable[[bool], None]] = None) -> None:
+        if AsyncRealtimeClient is None:
+            raise RuntimeError("El paquete 'realtime' no está instalado.")
+        self._receptor = receptor
+        self._al_cambiar_conexion = al_cambiar_conexion
+        threading.Thread(target=lambda: asyncio.run(self._escuchar()), name="invalidacion-realtime", daemon=True).start()
+
+    def detener(self) -> None:
+        self._detenida.set()
+
+    # Funcionamiento: Función interna. Abre el canal, se suscribe a las tablas y espera mientras siga conectado;
+    # al caerse (o si no se pudo abrir) lo cierra y reintenta, hasta que se llame a detener().
+    async def _escuchar(self) -> None:
+        while not self._detenida.is_set():
+            cliente = AsyncRealtimeClient(f"{self.url}/realtime/v1", self.clave, auto_reconnect=False)
+            self._cliente = cliente
+            try:
+                canal = cliente.channel("invalidacion-cache")
+                for tabla in self.tablas:
+                    canal.on_postgres_changes("*", self._al_cambiar, table=tabla, schema=self.esquema)
+                await canal.subscribe(self._al_cambiar_estado)
+                while not self._detenida.is_set() and cliente.is_connected:
+                    await asyncio.sleep(1)
+            except Exception as e:
+                print(f"ADVERTENCIA: Canal Realtime de invalidación no disponible: {e}")
+            finally:
+                self._marcar_suscrita(False)
+                try:
+                    await cliente.close()
+                except Exception:
+                    pass
+            if not self._detenida.is_set():
+                await asyncio.to_thread(self._detenida.wait, REINTENTO_CANAL)
+
+    def _al_cambiar_estado(self, estado: Any, error: Optional[Exception]) -> None:
+        self._marcar_suscrita(estado == "SUBSCRIBED")
+        if error is not None:
+            print(f"ADVERTENCIA: Error en el canal Realtime de invalidación: {error}")
+
+    # Funcionamiento: Función interna. Anota si el canal quedó suscrito y, si cambió, avisa al invalidador.
+    def _marcar_suscrita(self, suscrita: bool) -> None:
+        cambio = suscrita != self._suscrita
+        self._suscrita = suscrita
+        if cambio and self._al_cambiar_conexion is not None:
+            self._al_cambiar_conexion(suscrita)
+
+    # Funcionamiento: Función interna. Pasa el payload de Realtime al formato de evento del módulo.
+    def _al_cambiar(self, payload: Dict[str, Any]) -> None:
+        datos = payload.get("data") or {}
+        self._receptor({
+            "tabla": datos.get("table"),
+            "tipo": str(getattr(datos.get("type"), "value", datos.get("type"))),
+            "nuevo": datos.get("record") or None,
+            "anterior": datos.get("old_record") or None,
+        })
+
+
+class InvalidadorCache:
+    # Funcionamiento: Une una 'fuente' de eventos (FuenteRealtime, FuenteFalsa o None = solo sondeo)
+    # con el 'receptor' que aplica cada evento y la función 'sondear' para cuando la fuente no está conectada.
+    # El hilo de sondeo se inicia al desconectarse la fuente (o al iniciar, si no está conectada) y termina
+    # después del sondeo de reconexión. 'intervalo_sondeo' <= 0 lo desactiva (se puede llamar a revisar() a mano).
+    def __init__(self, fuente: Any, receptor: Callable[[Dict[str, Any]], None], sondear: Callable[[], Any],
+                 intervalo_sondeo: float = INTERVALO_SONDEO):
+        self.fuente = fuente
+        self.receptor = receptor
+        self.sondear = sondear
+        self.intervalo_sondeo = intervalo_sondeo
+        self.eventos = 0
+        self.sondeos = 0
+        self._conectada_antes = True
+        self._detenido = threading.Event()
+        self._lock = threading.Lock()
+        self._sondeando = False
+
+    def iniciar(self) -> None:
+        if self.fuente is not None:
+            self.fuente.iniciar(self._recibir, self._al_cambiar_conexion)
+        if not self._conectada():
+            self._al_cambiar_conexion(False)
+
+    def detener(self) -> None:
+        self._detenido.set()
+        if self.fuente is not None:
+            self.fuente.detener()
+
+    # Funcionamiento: Función interna. Aplica un evento; un evento malo no debe cortar el canal.
+    def _recibir(self, evento: Dict[str, Any]) -> None:
+        try:
+            self.receptor(evento)
+            self.eventos += 1
+        except Exception as e:
+            print(f"ADVERTENCIA: No se pudo aplicar un cambio de {evento.get('tabla')}: {e}")
+
+    # Funcionamiento: Función interna. La fuente avisa cada vez que se conecta o se desconecta.
+    # La desconexión queda anotada: el sondeo de reconexión se hace aunque vuelva antes del primer sondeo.
+    def _al_cambiar_conexion(self, conectada: bool) -> None:
+        if not conectada:
+            self._conectada_antes = False
+            self._iniciar_sondeo()
+
+    # Funcionamiento: Función interna. Inicia el hilo de sondeo si no está corriendo ya.
+    def _iniciar_sondeo(self) -> None:
+        if self.intervalo_sondeo <= 0 or self._detenido.is_set():
+            return
+        with self._lock:
+            if self._sondeando:
+                return
+            self._sondeando = True
+        threading.Thread(target=self._correr, name="invalidacion-sondeo", daemon=True).start()
+
+    def _conectada(self) -> bool:
+        return self.fuente is not None and self.fuente.conectada
+
+    # Funcionamiento: Sondea si la fuente no está conectada, o si se acaba de reconectar
+    # (los eventos ocurridos mientras estuvo caída se perdieron). Retorna True si sondeó.
+    def revisar(self) -> bool:
+        conectada = self._conectada()
+        reconectada = conectada and not self._conectada_antes
+        self._conectada_antes = conectada
+        if conectada and not reconectada:
+            return False
+        try:
+            self.sondear()
+            self.sondeos += 1
+        except Exception as e:
+            print(f"ADVERTENCIA: Falló el sondeo de cambios externos: {e}")
+        return True
+
+    # Funcionamiento: Función interna. Sondea cada 'intervalo_sondeo' segundos hasta que la fuente se reconecta
+    # (el último sondeo es el de reconexión). Si se volvió a caer justo al terminar, se inicia de nuevo.
+    def _correr(self) -> None:
+        try:
+            while not self._detenido.wait(self.intervalo_sondeo):
+                self.revisar()
+                if self._conectada_antes:
+                    break
+        finally:
+            with self._lock:
+                self._sondeando = False
+        if not self._conectada():
+            self._iniciar_sondeo()
+
+    # Funcionamiento: Retorna {"modo": "realtime" o "sondeo", "eventos": <aplicados>, "sondeos": <hechos>}.
+    def estado(self) -> Dict[str, Any]:
+        return {"modo": "realtime" if self._conectada() else "sondeo", "eventos": self.eventos, "sondeos": self.sondeos}
@@ -0,0 +1,138 @@
+import threading
+import time
+import uuid
+from collections import deque
+from typing import Any, Deque, Dict, Iterable, List, Optional, Tuple
+
+# REGISTRO DE CAMBIOS DEL CATÁLOGO
+#
+# Secuencia creciente que sube con cada escritura (la "versión del catálogo") y guarda, para las últimas
+# 'capacidad' escrituras, qué propiedades cambiaron o se eliminaron. Con ella un cliente que ya tiene las
+# propiedades de la versión N pide solo lo que cambió después (cambios_desde) en vez de volver a descargar
+# todo el catálogo. Quien quiere enterarse apenas haya cambios (ej. el flujo de eventos SSE) se queda en 'esperar'.
+#
+# Hay dos modos:
+# - Compartido (compartir/agregar): los números vienen de la tabla de cambios de la base de datos
+#   (docs/migraciones.sql) y la versión es solo el número ("N"): es la misma en todos los procesos,
+#   así que un cliente puede continuar en cualquiera de ellos.
+# - Del proceso (registrar): el número lo lleva este proceso y la versión es "<token>.<número>". Se usa mientras
+#   la tabla de cambios no está disponible; una versión de otro proceso (o de antes de reiniciar) no se puede
+#   continuar y el cliente debe recargar completo.
+
+
+class RegistroCambios:
+    # Funcionamiento: 'capacidad' = cuántos cambios (propiedad, número) se recuerdan como máximo.
+    # Las versiones anteriores al cambio más antiguo que se olvidó ya no se pueden continuar.
+    def __init__(self, capacidad: int = 2000):
+        self.token = uuid.uuid4().hex[:8]
+        self._lock = threading.Lock()
+        self._hay_cambios = threading.Condition(self._lock)
+        self._numero = 0
+        self._modificado = time.time()
+        self._entradas: Deque[Tuple[int, int, bool]] = deque()
+        self._capacidad = capacidad
+        self._olvidado_hasta = 0
+
+    # Funcionamiento: Último número conocido (en modo compartido, la última 'seq' leída de la tabla).
+    @property
+    def numero(self) -> int:
+        with self._lock:
+            return self._numero
+
+    # Funcionamiento: Sube la versión y anota las propiedades 'actualizadas' (altas y ediciones) y 'eliminadas'.
+    # Sin IDs solo sube la versión (ej. al normalizar imágenes). Solo para el modo del proceso.
+    # Retorna la nueva versión ("<token>.<número>").
+    def registrar(self, actualizadas: Iterable[int] = (), eliminadas: Iterable[int] = ()) -> str:
+        with self._lock:
+            self._numero += 1
+            self._modificado = time.time()
+            for propiedad_id, eliminada in [(i, False) for i in actualizadas] + [(i, True) for i in eliminadas]:
+                self._anotar(self._numero, propiedad_id, eliminada)
+            self._hay_cambios.notify_all()
+            return self._version()
+
+    # Funcionamiento: Pasa al modo compartido con el historial reciente de la tabla de cambios:
+    # 'entradas' = [(seq, propiedad_id, eliminada)] y 'modificado' = epoch de la última.
+    # Las versiones anteriores a la primera entrada (y todas las del modo del proceso) ya no se pueden continuar.
+    def compartir(self, entradas: Iterable[Tuple[int, int, bool]], modificado: Optional[float] = None) -> str:
+        entradas = sorted(entradas)
+        with self._lock:
+            self.token = ""
+            self._entradas.clear()
+            self._numero = entradas[-1][0] if entradas else 0
+            self._olvidado_hasta = entradas[0][0] - 1 if entradas else 0
+            for entrada in entradas:
+                self._anotar(*entrada)
+            if modificado is not None:
+                self._modificado = modificado
+            self._hay_cambios.notify_all()
+            return self._version()
+
+    # Funcionamiento: Agrega (modo compartido) las entradas de la tabla de cambios posteriores al último número
+    # conocido; las que ya estaban se ignoran, así que se puede llamar varias veces con las mismas filas.
+    # Retorna la versión actual.
+    def agregar(self, entradas: Iterable[Tuple[int, int, bool]], modificado: Optional[float] = None) -> str:
+        with self._lock:
+            nuevas = [entrada for entrada in sorted(entradas) if entrada[0] > self._numero]
+            for entrada in nuevas:
+                self._anotar(*entrada)
+            if nuevas:
+                self._numero = nuevas[-1][0]
+                self._modificado = modificado if modificado is not None else time.time()
+                self._hay_cambios.notify_all()
+            return self._version()
+
+    # Funcionamiento: Retorna {"version": versión actual, "modificado": <epoch de la última escritura>,
+    # "compartida": True si la versión viene de la tabla de cambios (es la misma en todos los procesos)}.
+    def version(self) -> Dict[str, Any]:
+        with self._lock:
+            return {"version": self._version(), "modificado": self._modificado, "compartida": not self.token}
+
+    # Funcionamiento: Número de la versión 'desde' si es de este registro ("N" en modo compartido,
+    # "<token>.N" en el del proceso); None si no lo es.
+    def numero_de(self, desde: Optional[str]) -> Optional[int]:
+        numero = desde or ""
+        if self.token:
+            token, _, numero = numero.partition(".")
+            if token != self.token:
+                return None
+        return int(numero) if numero.isdigit() else None
+
+    # Funcionamiento: Espera hasta 'espera' segundos a que la versión pase más allá de 'desde'.
+    # Retorna True si ya hay una versión posterior (o si 'desde' no es de este registro), False si se cumplió el plazo.
+    def esperar(self, desde: Optional[str], espera: float) -> bool:
+        numero = self.numero_de(desde)
+        if numero is None:
+            return True
+        with self._lock:
+            return self._hay_cambios.wait_for(lambda: self._numero != numero, espera)
+
+    # Funcionamiento: Cambios posteriores a la versión 'desde'.
+    # Retorna (IDs actualizados, IDs eliminados, versión actual), cada ID una sola vez con su último estado,
+    # o None si 'desde' no se puede continuar (no es de este registro, es futura o ya se olvidó).
+    def cambios_desde(self, desde: Optional[str]) -> Optional[Tuple[List[int], List[int], str]]:
+        numero = self.numero_de(desde)
+        if numero is None:
+            return None
+        with self._lock:
+            if numero > self._numero or numero < self._olvidado_hasta:
+                return None
+            estados: Dict[int, bool] = {}
+            for numero_entrada, propiedad_id, eliminada in reversed(self._entradas):
+                if numero_entrada <= numero:
+                    break
+                estados.setdefault(propiedad_id, eliminada)
+            version = self._version()
+        actualizadas = sorted(i for i, eliminada in estados.items() if not eliminada)
+        eliminadas = sorted(i for i, eliminada in estados.items() if eliminada)
+        return actualizadas, eliminadas, version
+
+    # Funcionamiento: Función interna. Guarda una entrada; si se llenó, olvida la más antigua.
+    # Se llama con '_lock' tomado.
+    def _anotar(self, numero: int, propiedad_id: int, eliminada: bool) -> None:
+        if len(self._entradas) >= self._capacidad:
+            self._olvidado_hasta = self._entradas.popleft()[0]
+        self._entradas.append((numero, propiedad_id, eliminada))
+
+    def _version(self) -> str:
+        return f"{self.token}.{self._numero}" if self.token else str(self._numero)
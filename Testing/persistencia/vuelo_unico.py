@@ -0,0 +1,65 @@
+import threading
+from typing import Any, Callable, Dict, Hashable, Optional
+
+# LECTURAS EN VUELO ÚNICO ("single-flight")
+#
+# Si varias peticiones piden la misma lectura a la vez (ej. un pico de visitas a /ventas con el caché vacío),
+# solo la primera llama a Supabase; las demás esperan esa misma llamada y reciben su resultado (o su error).
+# Así llega una consulta por clave en vez de N idénticas. No guarda nada: apenas termina la llamada,
+# la siguiente petición con esa clave vuelve a consultar (para eso está el caché, ver persistencia/cache.py).
+
+
+class _Vuelo:
+    def __init__(self) -> None:
+        self.listo = threading.Event()
+        self.resultado: Any = None
+        self.error: Optional[BaseException] = None
+
+
+class VueloUnico:
+    def __init__(self) -> None:
+        self._lock = threading.Lock()
+        self._vuelos: Dict[Hashable, _Vuelo] = {}
+        self.cargas = 0
+        self.coalescidas = 0
+
+    # Funcionamiento: Ejecuta 'cargar()' para 'clave', o si ya hay una ejecución en curso con esa clave,
+    # espera a que termine y retorna su mismo resultado (o lanza su misma excepción).
+    # Quien reciba el resultado compartido no debe modificarlo (el caché entrega copias).
+    def ejecutar(self, clave: Hashable, cargar: Callable[[], Any]) -> Any:
+        with self._lock:
+            vuelo = self._vuelos.get(clave)
+            if vuelo is None:
+                vuelo = self._vuelos[clave] = _Vuelo()
+                self.cargas += 1
+                propio = True
+            else:
+                self.coalescidas += 1
+                propio = False
+
+        if not propio:
+            vuelo.listo.wait()
+            if vuelo.error is not None:
+                raise vuelo.error
+            return vuelo.resultado
+
+        try:
+            vuelo.resultado = cargar()
+            return vuelo.resultado
+        except BaseException as e:
+            vuelo.error = e
+            raise
+        finally:
+            with self._lock:
+                del self._vuelos[clave]
+            vuelo.listo.set()
+
+    # Funcionamiento: Indica si ya hay una ejecución en curso para 'clave'.
+    def en_curso(self, clave: Hashable) -> bool:
+        with self._lock:
+            return clave in self._vuelos
+
+    # Funcionamiento: Retorna {"cargas": llamadas hechas, "coalescidas": llamadas ahorradas, "en_vuelo": en curso}.
+    def estadisticas(self) -> Dict[str, int]:
+        with self._lock:
+            return {"cargas": self.cargas, "coalescidas": self.coalescidas, "en_vuelo": len(self._vuelos)}
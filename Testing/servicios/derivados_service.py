@@ -0,0 +1,88 @@
+import io
+import queue
+import threading
+from persistencia.blobs import clave_de_referencia, obtener_almacen
+
+try:
+    from PIL import Image, ImageOps
+except ImportError:  # Sin Pillow no se generan variantes y siempre se sirve el original
+    Image = None
+
+# Variantes de tamaño fijo de cada imagen subida (ancho máximo en píxeles).
+# Se generan en un hilo de fondo al crear/actualizar una propiedad, así la petición no espera.
+# Mientras una variante no exista (o si falló), el endpoint de imágenes entrega el original.
+
+VARIANTES = {"thumb": 160, "card": 480, "full": 1280}
+CALIDAD_JPEG = 80
+
+_cola = queue.Queue()
+_pendientes = set()
+_pendientes_lock = threading.Lock()
+_hilo = None
+
+
+# Funcionamiento: Genera (si faltan) las variantes del blob 'clave' y las guarda en el almacén.
+# Las imágenes se reducen sin deformarlas (nunca se agrandan) y se guardan como JPEG.
+# Retorna la lista de variantes generadas en esta llamada.
+def generar_variantes(clave, almacen=None):
+    if Image is None:
+        return []
+    almacen = almacen or obtener_almacen()
+    faltantes = [nombre for nombre in VARIANTES if not almacen.existe_variante(clave, nombre)]
+    if not faltantes:
+        return []
+    original = almacen.leer(clave)
+    if not original:
+        return []
+
+    with Image.open(io.BytesIO(original)) as imagen:
+        imagen = ImageOps.exif_transpose(imagen).convert("RGB")
+        for nombre in faltantes:
+            ancho = VARIANTES[nombre]
+            copia = imagen.copy()
+            copia.thumbnail((ancho, ancho * 4))
+            salida = io.BytesIO()
+            copia.save(salida, "JPEG", quality=CALIDAD_JPEG, optimize=True, progressive=True)
+            almacen.guardar_variante(clave, nombre, salida.getvalue(), "image/jpeg")
+    return faltantes
+
+
+# Funcionamiento: Función interna (helper).
+# Bucle del hilo de fondo: toma claves de la cola y genera sus variantes.
+# Un error en una imagen se registra y no detiene al hilo (esa imagen seguirá usando el original).
+def _trabajar():
+    while True:
+        clave = _cola.get()
+        try:
+            generar_variantes(clave)
+        except Exception as e:
+            print(f"ADVERTENCIA: No se pudieron generar las variantes de {clave}: {e}")
+        finally:
+            with _pendientes_lock:
+                _pendientes.discard(clave)
+            _cola.task_done()
+
+
+# Funcionamiento: Recibe los valores de imagen de una propiedad ('img' o una lista de ellos).
+# Encola las referencias "blob:<sha256>" para que el hilo de fondo genere sus variantes
+# (las URLs externas y el base64 antiguo se ignoran). No bloquea.
+def encolar_variantes(imagenes):
+    global _hilo
+    if Image is None:
+        return
+    if not isinstance(imagenes, (list, tuple)):
+        imagenes = [imagenes]
+    claves = [clave for clave in map(clave_de_referencia, imagenes) if clave]
+    with _pendientes_lock:
+        if _hilo is None:
+            _hilo = threading.Thread(target=_trabajar, name="variantes-imagenes", daemon=True)
+            _hilo.start()
+        for clave in claves:
+            if clave not in _pendientes:
+                _pendientes.add(clave)
+                _cola.put(clave)
+
+
+# Funcionamiento: Espera a que el hilo de fondo termine todo lo encolado (se usa en pruebas y scripts).
+def esperar_variantes():
+    _cola.join()
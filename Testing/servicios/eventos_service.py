@@ -0,0 +1,132 @@
+import json
+import threading
+import time
+from persistencia.base_datos import esperar_cambios_catalogo, ids_cambiados_desde, ids_activos, version_catalogo
+
+# EVENTOS DEL CATÁLOGO (Server-Sent Events)
+#
+# Cada navegador conectado a /api/eventos recibe un evento 'cambios' con los IDs de las propiedades
+# creadas/editadas ('actualizadas') y eliminadas tras cada escritura, leídos del registro de cambios
+# del catálogo. El 'id' de cada evento es la versión del catálogo: al reconectarse, el navegador envía
+# 'Last-Event-ID' y el flujo continúa desde ahí sin perder cambios (o envía 'reiniciar' si ya no se puede).
+# Cada conexión solo guarda la última versión que envió (no una cola de eventos pendientes): un cliente
+# lento no acumula memoria, recibe juntos todos los cambios ocurridos mientras tanto.
+#
+# Compradores y visitantes (el mapa del comprador) solo ven propiedades activas: si una se desactiva,
+# les llega como eliminada.
+#
+# Cada conexión abierta ocupa un worker mientras dura. Con workers síncronos (gunicorn por defecto) unas
+# pocas conexiones bastan para dejar sin workers al resto de la app, así que las conexiones públicas
+# (compradores y visitantes, que pueden ser muchas) tienen su propio cupo (MAX_CONEXIONES_PUBLICAS) y duran
+# menos (DURACION_PUBLICA): los paneles de vendedor y admin siempre tienen cupo. En producción conviene
+# servir con workers asíncronos, ej. gunicorn -k gevent --worker-connections 100 wsgi:app
+
+INTERVALO_LATIDO = 15          # segundos sin cambios tras los que se envía un comentario (mantiene viva la conexión)
+DURACION_MAXIMA = 300          # segundos (paneles); luego se cierra y el navegador se reconecta solo (libera el worker)
+DURACION_PUBLICA = 60          # segundos, para compradores y visitantes
+MAX_CONEXIONES = 50            # conexiones abiertas a la vez en este proceso; sobre esto se responde 503
+MAX_CONEXIONES_PUBLICAS = 10   # de ellas, como máximo para compradores y visitantes
+MAX_IDS_POR_EVENTO = 200       # si cambiaron más propiedades se envía 'reiniciar'
+REINTENTO_MS = 3000            # espera sugerida al navegador antes de reconectarse
+
+ROLES_PANEL = {'vendedor', 'admin', 'administrador'}
+
+_conexiones = 0
+_conexiones_publicas = 0
+_conexiones_lock = threading.Lock()
+
+
+class FlujoEventos:
+    # Funcionamiento: Flujo SSE de una conexión. 'solo_activas' = True para compradores y visitantes
+    # (no ven propiedades inactivas y la conexión dura DURACION_PUBLICA).
+    # 'desde' = versión desde la que continuar (Last-Event-ID o parámetro); None = desde la versión actual.
+    # Ocupa un cupo de MAX_CONEXIONES hasta que se cierra (close), aunque nunca se haya empezado a leer.
+    def __init__(self, solo_activas, desde=None):
+        self.solo_activas = solo_activas
+        self.version = desde or version_catalogo()["version"]
+        self._cerrado = False
+
+    # El latido se envía cuando pasan INTERVALO_LATIDO segundos sin enviar nada, aunque entre medio
+    # el flujo haya despertado por cambios que no produjeron evento.
+    def __iter__(self):
+        yield f"retry: {REINTENTO_MS}\n\n"
+        ultimo_envio = time.monotonic()
+        limite = ultimo_envio + (DURACION_PUBLICA if self.solo_activas else DURACION_MAXIMA)
+        try:
+            while True:
+                ahora = time.monotonic()
+                if ahora >= limite:
+                    break
+                if ahora - ultimo_envio >= INTERVALO_LATIDO:
+                    yield ": latido\n\n"
+                    ultimo_envio = ahora
+                    continue
+                espera = min(ultimo_envio + INTERVALO_LATIDO, limite) - ahora
+                if esperar_cambios_catalogo(self.version, espera):
+                    evento = self.siguiente_evento()
+                    if evento:
+                        yield evento
+                        ultimo_envio = time.monotonic()
+        except Exception as e:
+            # El navegador se reconecta solo (con Last-Event-ID) y el flujo continúa
+            print(f"ADVERTENCIA: Se cerró un flujo de eventos por un error: {e}")
+
+    # Funcionamiento: Arma el siguiente evento con los cambios posteriores a la última versión enviada
+    # y avanza la versión. Retorna None si los cambios no le corresponden a esta conexión.
+    def siguiente_evento(self):
+        cambios = ids_cambiados_desde(self.version)
+        if cambios is None or len(cambios[0]) + len(cambios[1]) > MAX_IDS_POR_EVENTO:
+            self.version = version_catalogo()["version"]
+            return formatear_evento("reiniciar", self.version, {"version": self.version})
+
+        actualizadas, eliminadas, self.version = cambios
+        if self.solo_activas:
+            activas = ids_activos(actualizadas)
+            eliminadas = sorted(set(eliminadas) | (set(actualizadas) - activas))
+            actualizadas = [propiedad_id for propiedad_id in actualizadas if propiedad_id in activas]
+        if not actualizadas and not eliminadas:
+            return None
+        datos = {"version": self.version, "actualizadas": actualizadas, "eliminadas": eliminadas}
+        return formatear_evento("cambios", self.version, datos)
+
+    # Funcionamiento: Libera el cupo de la conexión. Werkzeug la llama al terminar la respuesta
+    # (también si el navegador se desconectó). Se puede llamar más de una vez.
+    def close(self):
+        if self._cerrado:
+            return
+        self._cerrado = True
+        _liberar_cupo(self.solo_activas)
+
+
+# Funcionamiento: Abre un flujo de eventos para un usuario con rol 'rol' (None = visitante) desde la versión
+# 'desde' (None = la actual). Los compradores y visitantes solo reciben propiedades activas; vendedores y
+# administradores, todas. Retorna el FlujoEventos, o None si ya hay MAX_CONEXIONES abiertas en este proceso
+# (o MAX_CONEXIONES_PUBLICAS, para compradores y visitantes).
+def abrir_flujo_eventos(rol, desde=None):
+    global _conexiones, _conexiones_publicas
+    solo_activas = (rol or '').lower() not in ROLES_PANEL
+    with _conexiones_lock:
+        if _conexiones >= MAX_CONEXIONES or (solo_activas and _conexiones_publicas >= MAX_CONEXIONES_PUBLICAS):
+            return None
+        _conexiones += 1
+        if solo_activas:
+            _conexiones_publicas += 1
+    try:
+        return FlujoEventos(solo_activas, desde)
+    except Exception:
+        _liberar_cupo(solo_activas)
+        raise
+
+
+# Funcionamiento: Función interna. Devuelve el cupo de una conexión (y el público si era de comprador o visitante).
+def _liberar_cupo(solo_activas):
+    global _conexiones, _conexiones_publicas
+    with _conexiones_lock:
+        _conexiones -= 1
+        if solo_activas:
+            _conexiones_publicas -= 1
+
+
+# Funcionamiento: Da formato SSE a un evento: 'id' (versión), 'event' (tipo) y 'data' (JSON en una línea).
+def formatear_evento(tipo, id_evento, datos):
+    return f"id: {id_evento}\nevent: {tipo}\ndata: {json.dumps(datos, separators=(',', ':'))}\n\n"
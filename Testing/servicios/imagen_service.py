@@ -0,0 +1,84 @@
+import hashlib
+import re
+from persistencia.blobs import (
+    clave_de_referencia, lista_imagenes, decodificar_base64, detectar_mimetype,
+    obtener_almacen, referencia_blob, tipo_por_firma
+)
+
+# Funciones para leer las imágenes guardadas en una propiedad (referencias "blob:<sha256>",
+# base64 antiguo, data: URI o URLs) y convertirlas en bytes que se puedan servir
+# desde /api/propiedades/<id>/imagenes/<n>.
+
+_IMAGE_PATH_RE = re.compile(r'/[^/]+\.(jpe?g|png|webp|gif)(\?.*)?$', re.IGNORECASE)
+
+
+# Funcionamiento: Retorna las imágenes de una propiedad, en orden (la posición es el <n> del endpoint).
+# Las filas escritas o normalizadas ya traen la lista canónica en 'galeria' y se usa tal cual;
+# solo las filas antiguas sin normalizar se interpretan con lista_imagenes.
+def fuentes_imagenes(propiedad):
+    if not propiedad:
+        return []
+    galeria = propiedad.get("galeria")
+    if isinstance(galeria, list):
+        return galeria
+    return lista_imagenes(propiedad)
+
+
+# Funcionamiento: Indica si la imagen es una URL (externa o ruta estática) que el navegador
+# puede pedir directamente, en vez de datos guardados en la fila.
+def es_externa(fuente):
+    if fuente.startswith(("http://", "https://")):
+        return True
+    return fuente.startswith("/") and bool(_IMAGE_PATH_RE.search(fuente))
+
+
+# Funcionamiento: Huella (SHA-256 abreviado) del contenido guardado.
+# Para una referencia "blob:<sha256>" es la misma clave del blob (no hay que leer los bytes).
+# Se usa como ETag y como parámetro de versión '?v=' en las URLs de imagen.
+def huella_fuente(fuente):
+    clave = clave_de_referencia(fuente)
+    if clave:
+        return clave[:32]
+    return hashlib.sha256(fuente.encode("utf-8")).hexdigest()[:32]
+
+
+# Funcionamiento: Obtiene los bytes de una imagen guardada.
+# Si es una referencia "blob:<sha256>" la lee del almacén de blobs; si no, decodifica el base64
+# (filas todavía no migradas). Retorna (bytes, mimetype), o None si no se encuentra o no es válida.
+def decodificar_imagen(fuente):
+    clave = clave_de_referencia(fuente)
+    if clave:
+        datos = obtener_almacen().leer(clave)
+        return (datos, detectar_mimetype(datos)) if datos else None
+    return decodificar_base64(fuente)
+
+
+# Funcionamiento: Obtiene una variante ya generada (ej. 'card') de una imagen guardada como blob.
+# Retorna (bytes, mimetype), o None si la imagen no es un blob o la variante aún no existe
+# (en ese caso se sirve el original).
+def leer_variante(fuente, variante):
+    clave = clave_de_referencia(fuente)
+    if not clave:
+        return None
+    datos = obtener_almacen().leer_variante(clave, variante)
+    return (datos, detectar_mimetype(datos)) if datos else None
+
+
+# Funcionamiento: Recibe el archivo subido por multipart (stream de Werkzeug).
+# Revisa por los primeros bytes que sea una imagen (JPEG, PNG, GIF o WEBP) y lo guarda en el almacén
+# de blobs leyéndolo por bloques. Falla (ValueError) si no es una imagen.
+# Retorna la referencia "blob:<sha256>" que se guarda en 'img' al crear/actualizar la propiedad.
+def guardar_imagen_subida(archivo):
+    cabecera = archivo.read(16)
+    mimetype = tipo_por_firma(cabecera)
+    if not mimetype:
+        raise ValueError("El archivo debe ser una imagen JPG, PNG, GIF o WEBP.")
+    archivo.seek(0)
+    return referencia_blob(obtener_almacen().guardar_archivo(archivo, mimetype))
+
+
+# Funcionamiento: Indica si 'img' apunta a un blob que ya está en el almacén.
+# Los valores que no son referencias (URLs o base64 antiguo) se aceptan como antes.
+def referencia_valida(img):
+    clave = clave_de_referencia(img)
+    return clave is None or obtener_almacen().existe(clave)
@@ -1,67 +1,228 @@
-from persistencia.base_datos import obtener_propiedades
+from persistencia.base_datos import (
+    obtener_propiedades, consultar_propiedades, consultar_pagina_propiedades, consultar_mapa, coordenadas_en_uso,
+    cambios_propiedades, version_catalogo, MENSAJE_COORDENADAS_DUPLICADAS
+)
+from servicios.imagen_service import referencia_valida
 import math
 
+
+# Campos numéricos que se pueden filtrar por rango con min_<campo> / max_<campo>
+CAMPOS_RANGO = ('precio', 'dormitorios', 'baños', 'area')
+
+# Máximo de marcadores que retorna una consulta del mapa (si hay más, se marca 'truncado')
+MAX_MARCADORES_MAPA = 500
+ZOOM_MAXIMO = 22
+
+# Tamaño de página de GET /api/propiedades: por defecto (sin 'limit') y máximo permitido
+LIMITE_PAGINA_API = 50
+LIMITE_MAXIMO_API = 200
+
+
+# Funcionamiento: Función interna de ayuda (helper).
+# Convierte un parámetro a float entre -limite y limite. Retorna None si viene vacío o no es válido.
+def _float_en_rango(valor, limite):
+    try:
+        numero = float(valor)
+    except (TypeError, ValueError):
+        return None
+    if not math.isfinite(numero) or abs(numero) > limite:
+        return None
+    return numero
+
+
+# Funcionamiento: Función interna de ayuda (helper).
+# Limpia los filtros recibidos (ej. request.args) y los deja en un diccionario simple:
+# textos en minúsculas y sin espacios, rangos (min_/max_ de cada campo numérico) como enteros
+# (0 si no son válidos). 'min_banos'/'max_banos' (sin ñ) se aceptan como alias de baños.
+# 'propietario' = ID del dueño como texto (vacío = todos).
+# Búsqueda por distancia: 'lat'/'lng' como float (None si no son válidos), 'radio_km' (0 = sin límite)
+# y 'orden' ('distancia' o vacío).
+def _normalizar_filtros(filtros):
+    if not filtros:
+        return {}
+    normalizados = {
+        'q': (filtros.get('q') or '').strip().lower(),
+        'tipo': (filtros.get('tipo') or '').strip().lower(),
+        'estado': (filtros.get('estado') or '').strip().lower(),
+        'propietario': str(filtros.get('propietario') or '').strip(),
+    }
+    for campo in CAMPOS_RANGO:
+        for limite in ('min', 'max'):
+            clave = f'{limite}_{campo}'
+            crudo = filtros.get(clave) or filtros.get(clave.replace('ñ', 'n'))
+            try:
+                valor = int(crudo or 0)
+            except ValueError:
+                valor = 0
+            normalizados[clave] = valor if valor > 0 else 0
+
+    normalizados['lat'] = _float_en_rango(filtros.get('lat'), 90)
+    normalizados['lng'] = _float_en_rango(filtros.get('lng'), 180)
+    radio = _float_en_rango(filtros.get('radio_km'), math.inf)
+    normalizados['radio_km'] = radio if radio and radio > 0 else 0
+    orden = (filtros.get('orden') or '').strip().lower()
+    normalizados['orden'] = orden if orden == 'distancia' else ''
+    return normalizados
+
+
 # Funcionamiento: Lee propiedades con filtrado y paginación opcional.
+# El filtrado y el total se resuelven con el índice del catálogo en memoria (consultar_propiedades, ver
+# persistencia/indice_catalogo.py) y a Supabase solo se le piden las filas de la página, por ID.
 # Si se pasa 'pagina' y 'por_pagina': Retorna un DICT con datos de paginación.
 # Si NO se pasan: Retorna una LISTA simple (para compatibilidad con el resto del sistema).
-def leer_propiedades(filtros=None, pagina=None, por_pagina=None):
-    propiedades = obtener_propiedades()
-    
-    # Filtrado 
-    filtradas = []
-    
+# 'perfil' indica qué columnas pedir (ver PERFILES_PROPIEDAD en base_datos.py).
+# 'con_propietario' agrega 'propietario_nombre' consultando solo a los dueños del resultado.
+def leer_propiedades(filtros=None, pagina=None, por_pagina=None, perfil="full", con_propietario=False):
     # Si no hay filtros y no hay paginación, retorno rápido
     if not filtros and not pagina:
-        return propiedades
-
-    q = (filtros.get('q') or '').strip().lower() if filtros else ''
-    tipo = (filtros.get('tipo') or '').strip().lower() if filtros else ''
-    estado = (filtros.get('estado') or '').strip().lower() if filtros else ''
-    
-    min_precio = 0
-    max_precio = 0
-    if filtros:
-        try: min_precio = int(filtros.get('min_precio') or 0)
-        except ValueError: min_precio = 0
-        try: max_precio = int(filtros.get('max_precio') or 0)
-        except ValueError: max_precio = 0
-
-    for p in propiedades:
-        # Filtro Texto
-        if q:
-            texto = f"{p.get('nombre','')} {p.get('localizacion','')} {p.get('descripcion','')}".lower()
-            if q not in texto: continue
-        # Filtro Tipo
-        if tipo and str(p.get('tipo', '')).lower() != tipo: continue
-        # Filtro Estado
-        if estado and str(p.get('estado', '')).lower() != estado: continue
-        # Filtro Precio
-        precio = int(p.get('precio') or 0)
-        if min_precio > 0 and precio < min_precio: continue
-        if max_precio > 0 and precio > max_precio: continue
-        
-        filtradas.append(p)
+        return obtener_propiedades(perfil, con_propietario)
+
+    filtros_normalizados = _normalizar_filtros(filtros)
+
+    # Retorno Clásico (Para Admin y Validaciones)
+    if pagina is None or por_pagina is None:
+        return consultar_propiedades(
+            filtros_normalizados, perfil=perfil, con_propietario=con_propietario
+        )['propiedades']
 
     # Paginación (Solo si se solicita explícitamente)
-    if pagina is not None and por_pagina is not None:
-        total_propiedades = len(filtradas)
-        total_paginas = math.ceil(total_propiedades / por_pagina)
-        
-        if pagina < 1: pagina = 1
-        if pagina > total_paginas and total_paginas > 0: pagina = total_paginas
-        
+    if pagina < 1: pagina = 1
+    inicio = (pagina - 1) * por_pagina
+    resultado = consultar_propiedades(
+        filtros_normalizados, inicio, inicio + por_pagina - 1, perfil, con_propietario
+    )
+    total_propiedades = resultado['total']
+    total_paginas = math.ceil(total_propiedades / por_pagina)
+
+    # Si la página pedida quedó fuera de rango, se consulta la última página válida
+    if pagina > total_paginas and total_paginas > 0:
+        pagina = total_paginas
         inicio = (pagina - 1) * por_pagina
-        fin = inicio + por_pagina
-        
-        return {
-            "propiedades": filtradas[inicio:fin],
-            "total": total_propiedades,
-            "paginas": total_paginas,
-            "actual": pagina
-        }
-    
-    # Retorno Clásico (Para Admin y Validaciones)
-    return filtradas
+        resultado = consultar_propiedades(
+            filtros_normalizados, inicio, inicio + por_pagina - 1, perfil, con_propietario
+        )
+
+    return {
+        "propiedades": resultado['propiedades'],
+        "total": total_propiedades,
+        "paginas": total_paginas,
+        "actual": pagina
+    }
+
+# Funcionamiento: Página de la API del catálogo (GET /api/propiedades), paginada por cursor.
+# Recibe los parámetros de la petición: los filtros del catálogo (q, tipo, estado, propietario, min_/max_...,
+# lat/lng con radio_km y orden=distancia) y además:
+# - 'limit': cuántas propiedades (por defecto LIMITE_PAGINA_API, como máximo LIMITE_MAXIMO_API; 0 = solo el total).
+# - 'cursor': el 'next_cursor' de la página anterior (vacío = primera página).
+# - 'fields': campos a incluir separados por coma (ej. "nombre,precio"); 'id' viene siempre.
+# Retorna {"propiedades": [...], "total": n, "limit": l, "next_cursor": "..." o None si es la última página,
+# "version": versión del catálogo de estos datos (para pedir después solo los cambios, ver leer_cambios_propiedades)}.
+# Falla (ValueError) si 'limit', 'cursor' o 'fields' no son válidos, o si se usa 'cursor' con orden=distancia.
+def leer_pagina_propiedades(parametros):
+    limite = _parsear_entero(parametros.get('limit'), 'limit', LIMITE_PAGINA_API)
+    limite = min(limite, LIMITE_MAXIMO_API)
+    cursor = parametros.get('cursor') or None
+    despues_de = None if cursor is None else _parsear_entero(cursor, 'cursor', None)
+
+    filtros = _normalizar_filtros(parametros)
+    ordena_por_distancia = filtros.get('orden') == 'distancia' and None not in (filtros.get('lat'), filtros.get('lng'))
+    if despues_de is not None and ordena_por_distancia:
+        raise ValueError("El orden por distancia no admite 'cursor'; use 'limit' para pedir las más cercanas.")
+
+    campos = None
+    if parametros.get('fields'):
+        campos = [campo.strip() for campo in parametros.get('fields').split(',') if campo.strip()]
+
+    # La versión se lee antes que los datos: si algo cambia entremedio, vuelve en los cambios siguientes
+    version = version_catalogo()['version']
+    resultado = consultar_pagina_propiedades(filtros, despues_de, limite, campos)
+    siguiente = resultado['siguiente']
+    return {
+        "propiedades": resultado['propiedades'],
+        "total": resultado['total'],
+        "limit": limite,
+        "next_cursor": None if siguiente is None else str(siguiente),
+        "version": version
+    }
+
+
+# Funcionamiento: Cambios del catálogo desde la versión 'desde' (parámetro de la petición) que el cliente
+# recibió junto con sus datos (campo 'version' de GET /api/propiedades o del panel).
+# Retorna {"version": ..., "reiniciar": bool, "propiedades": [creadas o editadas], "eliminadas": [IDs]}.
+# Con "reiniciar": True (versión desconocida o demasiados cambios, más de LIMITE_MAXIMO_API)
+# el cliente debe volver a cargar la lista completa.
+def leer_cambios_propiedades(parametros):
+    return cambios_propiedades(parametros.get('desde') or None, LIMITE_MAXIMO_API)
+
+
+# Funcionamiento: Función interna de ayuda (helper).
+# Convierte el parámetro 'nombre' a entero no negativo. Vacío = 'por_defecto'. Falla (ValueError) si no es válido.
+def _parsear_entero(valor, nombre, por_defecto):
+    if valor in (None, ''):
+        return por_defecto
+    try:
+        numero = int(valor)
+    except ValueError:
+        raise ValueError(f"El parámetro '{nombre}' debe ser un entero mayor o igual a 0.")
+    if numero < 0:
+        raise ValueError(f"El parámetro '{nombre}' debe ser un entero mayor o igual a 0.")
+    return numero
+
+
+# Funcionamiento: Función interna de ayuda (helper).
+# Convierte el parámetro 'bbox' ("minLat,minLng,maxLat,maxLng") en una tupla de 4 floats.
+# Falla (ValueError) si no son 4 números, si están fuera de rango o si los mínimos superan a los máximos.
+def _parsear_bbox(bbox):
+    mensaje = "El parámetro 'bbox' debe ser minLat,minLng,maxLat,maxLng."
+    partes = (bbox or '').split(',')
+    if len(partes) != 4:
+        raise ValueError(mensaje)
+    try:
+        min_lat, min_lng, max_lat, max_lng = (float(p) for p in partes)
+    except ValueError:
+        raise ValueError(mensaje)
+    if not all(math.isfinite(v) for v in (min_lat, min_lng, max_lat, max_lng)):
+        raise ValueError(mensaje)
+    if not (-90 <= min_lat <= max_lat <= 90 and -180 <= min_lng <= max_lng <= 180):
+        raise ValueError(mensaje)
+    return min_lat, min_lng, max_lat, max_lng
+
+
+# Funcionamiento: Función interna de ayuda (helper).
+# Convierte el parámetro 'zoom' a entero (0 a ZOOM_MAXIMO). Vacío = None. Falla (ValueError) si no es válido.
+def _parsear_zoom(zoom):
+    if zoom in (None, ''):
+        return None
+    try:
+        valor = int(zoom)
+    except ValueError:
+        raise ValueError(f"El parámetro 'zoom' debe ser un entero entre 0 y {ZOOM_MAXIMO}.")
+    if not 0 <= valor <= ZOOM_MAXIMO:
+        raise ValueError(f"El parámetro 'zoom' debe ser un entero entre 0 y {ZOOM_MAXIMO}.")
+    return valor
+
+
+# Funcionamiento: Marcadores del mapa para la vista actual.
+# Recibe los parámetros de la petición: 'bbox' (obligatorio), 'zoom' y los filtros del catálogo (q, tipo, ...).
+# Solo incluye propiedades activas con coordenadas válidas dentro del rectángulo.
+# Con zoom alejado (hasta ZOOM_CLUSTER_MAXIMO) las cercanas vienen agrupadas en 'clusters'
+# (cantidad, centroide lat/lng, precio_min, precio_max) y el resto como marcadores individuales.
+# Retorna {"clusters": [...], "marcadores": [...], "total": n, "truncado": bool, "zoom": z};
+# como máximo MAX_MARCADORES_MAPA marcadores. Falla (ValueError) si 'bbox' o 'zoom' no son válidos.
+def leer_marcadores_mapa(parametros):
+    caja = _parsear_bbox(parametros.get('bbox'))
+    zoom = _parsear_zoom(parametros.get('zoom'))
+    resultado = consultar_mapa(
+        caja, _normalizar_filtros(parametros), limite=MAX_MARCADORES_MAPA, con_propietario=True, zoom=zoom
+    )
+    return {
+        "clusters": resultado['clusters'],
+        "marcadores": resultado['marcadores'],
+        "total": resultado['total'],
+        "truncado": resultado['total'] > len(resultado['marcadores']),
+        "zoom": zoom
+    }
+
 
 # Funcionamiento: Función interna de ayuda (helper).
 # Verifica si un rol de usuario (ej. 'admin') es considerado administrador, manejando mayúsculas o valores nulos (None).
@@ -89,11 +250,11 @@ def _normalizar_bool(valor, campo):
 # 1. Valida campos obligatorios (texto y numéricos).
 # 2. Normaliza valores (ej. '  Nombre ' -> 'Nombre').
 # 3. Valida reglas de negocio (ej. 'precio' > 0).
-# 4. Asegura que 'coordenadas' sean únicas en la BD.
+# 4. Asegura que 'coordenadas' sean únicas (índice de coordenadas normalizadas; solo si vienen en 'data').
 # 5. Falla (ValueError) si algún campo es inválido.
 # 6. Retorna un diccionario 'resultado' con datos limpios.
 # 7. el "parcial=True" permite a la funcion determinar solo los campos que consideras en el diccionario.
-def _validar_y_normalizar_propiedad(data, parcial, propiedades_existentes, propiedad_actual=None):
+def _validar_y_normalizar_propiedad(data, parcial, propiedad_actual=None):
     if not isinstance(data, dict):
         raise ValueError("Formato de datos inválido para la propiedad.")
 
@@ -179,9 +340,8 @@ def _validar_y_normalizar_propiedad(data, parcial, propiedades_existentes, propi
         if not coordenadas_normalizadas:
             raise ValueError("Las coordenadas no pueden estar vacías.")
         propiedad_id_actual = propiedad_actual.get('id') if propiedad_actual else None
-        for propiedad in propiedades_existentes:
-            if propiedad.get('coordenadas') == coordenadas_normalizadas and propiedad.get('id') != propiedad_id_actual:
-                raise ValueError("Las coordenadas ya existen en otra propiedad.")
+        if coordenadas_en_uso(coordenadas_normalizadas, excluir_id=propiedad_id_actual):
+            raise ValueError(MENSAJE_COORDENADAS_DUPLICADAS)
         resultado['coordenadas'] = coordenadas_normalizadas
     elif not parcial:
         raise ValueError("El campo 'coordenadas' es obligatorio.")
@@ -197,6 +357,8 @@ def _validar_y_normalizar_propiedad(data, parcial, propiedades_existentes, propi
             resultado['img'] = None
         else:
             resultado['img'] = str(img)
+            if not referencia_valida(resultado['img']):
+                raise ValueError("La imagen indicada no existe. Vuelve a subirla.")
     elif not parcial:
         resultado['img'] = None
 
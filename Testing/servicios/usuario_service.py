@@ -33,8 +33,9 @@ def validar_password(password):
 # Funcionamiento: Abstracción simple para leer usuarios.
 # Llama a 'obtener_usuarios' de la capa de
 # persistencia (base_datos.py) y retorna la lista.
-def leer_usuarios():
-    return obtener_usuarios()
+# 'perfil' indica qué columnas pedir (ver PERFILES_USUARIO en base_datos.py).
+def leer_usuarios(perfil="full"):
+    return obtener_usuarios(perfil)
 
 
 # Funcionamiento: Convierte un rol (ej. "administrador") a su versión canónica (ej. "admin").
@@ -0,0 +1,53 @@
+// Sube la imagen de una propiedad a /api/imagenes como multipart (sin pasar por base64).
+// Antes de subirla la reduce a 800px de ancho y la comprime como JPEG (70%), igual que antes.
+// Retorna la referencia ("blob:<sha256>") que se envía como 'img' al crear/actualizar la propiedad.
+(function () {
+  const ANCHO_MAXIMO = 800;
+  const CALIDAD_JPEG = 0.7;
+
+  function comprimirImagen(file) {
+    return new Promise((resolve, reject) => {
+      const url = URL.createObjectURL(file);
+      const img = new Image();
+      img.onload = () => {
+        URL.revokeObjectURL(url);
+        const canvas = document.createElement('canvas');
+        const escala = Math.min(1, ANCHO_MAXIMO / img.width);
+        canvas.width = Math.round(img.width * escala);
+        canvas.height = Math.round(img.height * escala);
+        canvas.getContext('2d').drawImage(img, 0, 0, canvas.width, canvas.height);
+        canvas.toBlob((blob) => {
+          if (blob) {
+            resolve(blob);
+          } else {
+            reject(new Error('No se pudo procesar la imagen.'));
+          }
+        }, 'image/jpeg', CALIDAD_JPEG);
+      };
+      img.onerror = () => {
+        URL.revokeObjectURL(url);
+        reject(new Error('El archivo seleccionado no es una imagen válida.'));
+      };
+      img.src = url;
+    });
+  }
+
+  async function subirImagen(file) {
+    const blob = await comprimirImagen(file);
+    const datos = new FormData();
+    datos.append('imagen', blob, 'imagen.jpg');
+
+    const response = await fetch('/api/imagenes', {
+      method: 'POST',
+      body: datos,
+      credentials: 'same-origin'
+    });
+    const resultado = await response.json().catch(() => ({}));
+    if (!response.ok) {
+      throw new Error(resultado.error || 'No se pudo subir la imagen.');
+    }
+    return resultado.referencia;
+  }
+
+  window.subirImagen = subirImagen;
+})();
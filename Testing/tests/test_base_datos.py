@@ -0,0 +1,114 @@
+import pytest
+from persistencia import base_datos
+
+
+# Cliente falso de Supabase: registra las columnas pedidas en cada 'select'
+# y responde con las filas indicadas, sin conectarse a la red.
+class _RespuestaFalsa:
+    def __init__(self, data):
+        self.data = data
+        self.count = len(data)
+
+
+class _ConsultaFalsa:
+    def __init__(self, cliente, tabla):
+        self.cliente = cliente
+        self.tabla = tabla
+
+    def select(self, columnas, **kwargs):
+        self.cliente.selects.append((self.tabla, columnas))
+        return self
+
+    def __getattr__(self, nombre):
+        # eq, in_, order, limit, range, etc. no cambian el resultado falso
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        return _RespuestaFalsa(self.cliente.filas.get(self.tabla, []))
+
+
+class _ClienteFalso:
+    def __init__(self, filas):
+        self.filas = filas
+        self.selects = []
+
+    def table(self, tabla):
+        return _ConsultaFalsa(self, tabla)
+
+
+@pytest.fixture
+def cliente_falso(monkeypatch):
+    cliente = _ClienteFalso({
+        base_datos.PROPIEDADES_TABLE: [{"id": 1, "nombre": "Casa"}],
+        base_datos.USERS_TABLE: [{"id": 1, "email": "a@b.cl", "password": "hash", "tipo_usuario": "admin"}],
+    })
+    monkeypatch.setattr(base_datos, "_get_client", lambda: cliente)
+    monkeypatch.setattr(base_datos, "_get_client_lectura", lambda: cliente)
+    base_datos._cache_propiedades.invalidar()
+    base_datos._cache_usuarios.invalidar()
+    yield cliente
+    base_datos._cache_propiedades.invalidar()
+    base_datos._cache_usuarios.invalidar()
+
+
+# Prueba 1: Cada lectura pide solo las columnas de su perfil de proyección.
+def test_perfiles_de_proyeccion(cliente_falso):
+    base_datos.obtener_propiedades("card")
+    base_datos.obtener_usuario_por_email("A@B.cl", perfil="auth")
+
+    assert cliente_falso.selects == [
+        (base_datos.PROPIEDADES_TABLE, base_datos.PERFILES_PROPIEDAD["card"]),
+        (base_datos.USERS_TABLE, "id,email,password,tipo_usuario"),
+    ]
+    assert "img" not in base_datos.PERFILES_PROPIEDAD["card"]
+
+
+# Prueba 2: Un perfil inexistente falla en vez de caer en 'SELECT *'.
+def test_perfil_desconocido(cliente_falso):
+    with pytest.raises(ValueError):
+        base_datos.obtener_propiedades("no-existe")
+    assert cliente_falso.selects == []
+
+
+# Prueba 3: El nombre del dueño se obtiene con un único SELECT a usuarios (filtro 'in'),
+# sin cargar la tabla completa.
+def test_adjuntar_nombre_propietario(cliente_falso):
+    cliente_falso.filas[base_datos.USERS_TABLE] = [{"id": 7, "nombre": " Ana ", "apellido": "Soto"}]
+    propiedades = [{"id": 1, "propietario": 7}, {"id": 2, "propietario": 7}, {"id": 3, "propietario": None}]
+
+    base_datos.adjuntar_nombre_propietario(propiedades)
+
+    assert [p["propietario_nombre"] for p in propiedades] == ["Ana Soto", "Ana Soto", None]
+    assert cliente_falso.selects == [(base_datos.USERS_TABLE, "id,nombre,apellido")]
+
+
+# Prueba 4: Si la BD rechaza la escritura por la restricción única de 'coordenadas' (23505),
+# se informa con el mismo ValueError (-> 400) que el chequeo del validador.
+def test_conflicto_de_coordenadas_en_la_bd(cliente_falso, monkeypatch):
+    from postgrest.exceptions import APIError
+
+    def execute_con_conflicto(self):
+        raise APIError({
+            "code": "23505",
+            "message": 'duplicate key value violates unique constraint "propiedades_coordenadas_key"',
+            "details": "Key (coordenadas)=(-35.0,-71.0) already exists.",
+        })
+    monkeypatch.setattr(_ConsultaFalsa, "execute", execute_con_conflicto)
+
+    with pytest.raises(ValueError, match=base_datos.MENSAJE_COORDENADAS_DUPLICADAS):
+        base_datos.crear_propiedad({"nombre": "Casa", "coordenadas": "-35.0,-71.0"})
+    with pytest.raises(ValueError, match=base_datos.MENSAJE_COORDENADAS_DUPLICADAS):
+        base_datos.actualizar_propiedad(1, {"coordenadas": "-35.0,-71.0"})
+
+
+# Prueba 5: El perfil 'auth' (con el hash de la contraseña) no se guarda en el caché: cada login lo consulta.
+# Las propiedades de un usuario salen del índice, que se carga si todavía no se cargó.
+def test_auth_sin_cache_y_propiedades_del_usuario(cliente_falso, monkeypatch):
+    from persistencia.indice_catalogo import IndiceCatalogo
+    base_datos.obtener_usuario_por_email("a@b.cl", perfil="auth")
+    base_datos.obtener_usuario_por_email("a@b.cl", perfil="auth")
+    assert len(cliente_falso.selects) == 2
+
+    monkeypatch.setattr(base_datos, "_indice_catalogo", IndiceCatalogo(ttl=60))
+    cliente_falso.filas[base_datos.PROPIEDADES_TABLE] = [{"id": 1, "propietario": 7}, {"id": 2, "propietario": 8}]
+    assert base_datos._propiedades_de(7) == [1]
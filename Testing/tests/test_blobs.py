@@ -0,0 +1,115 @@
+import base64
+import hashlib
+import pytest
+from persistencia import base_datos, blobs
+
+JPEG_FALSO = b"\xff\xd8\xff\xe0" + b"0123456789" * 20
+IMG_BASE64 = base64.b64encode(JPEG_FALSO).decode()
+CLAVE = hashlib.sha256(JPEG_FALSO).hexdigest()
+
+
+# Cliente falso de Supabase: guarda lo que se inserta/actualiza y responde con 'filas' a los SELECT.
+class _ConsultaFalsa:
+    def __init__(self, cliente):
+        self.cliente = cliente
+        self.datos = None
+
+    def insert(self, payload):
+        self.cliente.escrituras.append(("insert", payload))
+        self.datos = [payload]
+        return self
+
+    def update(self, cambios):
+        self.cliente.escrituras.append(("update", cambios))
+        self.datos = [cambios]
+        return self
+
+    def __getattr__(self, nombre):
+        return lambda *args, **kwargs: self
+
+    def execute(self):
+        datos = self.datos if self.datos is not None else self.cliente.filas
+        self.cliente.filas = []
+        return type("Respuesta", (), {"data": datos})()
+
+
+class _ClienteFalso:
+    def __init__(self, filas=None):
+        self.filas = filas or []
+        self.escrituras = []
+
+    def table(self, tabla):
+        return _ConsultaFalsa(self)
+
+
+@pytest.fixture
+def almacen(tmp_path, monkeypatch):
+    monkeypatch.setattr(base_datos, "_columna_galeria", True)
+    almacen = blobs.AlmacenLocal(tmp_path)
+    blobs.configurar_almacen(almacen)
+    yield almacen
+    blobs.configurar_almacen(None)
+
+
+# Prueba 1: La clave es el SHA-256 del contenido; subir dos veces lo mismo guarda un solo archivo.
+# La interfaz común no se puede instanciar (cada backend implementa _leer/_existe/_escribir/_mover).
+def test_almacen_local_deduplica(almacen, tmp_path):
+    assert almacen.guardar(JPEG_FALSO) == CLAVE
+    assert almacen.guardar(JPEG_FALSO) == CLAVE
+
+    assert almacen.leer(CLAVE) == JPEG_FALSO
+    assert len([r for r in tmp_path.rglob("*") if r.is_file()]) == 1
+    assert almacen.leer("0" * 64) is None
+    with pytest.raises(TypeError):
+        blobs.AlmacenBlobs()
+
+
+# Prueba 2: crear_propiedad guarda la imagen en el almacén y a la fila solo llega la referencia,
+# con la galería canónica en 'galeria'. Las URLs externas no se tocan.
+def test_crear_propiedad_guarda_referencia(almacen, monkeypatch):
+    cliente = _ClienteFalso()
+    monkeypatch.setattr(base_datos, "_get_client", lambda: cliente)
+
+    base_datos.crear_propiedad({"nombre": "Casa", "img": f"data:image/jpeg;base64,{IMG_BASE64}"})
+    base_datos.actualizar_propiedad(1, {"img": "https://ejemplo.cl/casa.jpg"})
+
+    assert cliente.escrituras == [
+        ("insert", {"nombre": "Casa", "img": f"blob:{CLAVE}", "galeria": [f"blob:{CLAVE}"]}),
+        ("update", {"img": "https://ejemplo.cl/casa.jpg", "galeria": ["https://ejemplo.cl/casa.jpg"]}),
+    ]
+    assert almacen.leer(CLAVE) == JPEG_FALSO
+
+
+# Prueba 3: El backfill mueve el base64 existente al almacén, arma la galería canónica
+# (sin repetidos, desde las claves antiguas) y no reescribe las filas ya normalizadas.
+def test_normalizar_imagenes_existentes(almacen, monkeypatch):
+    cliente = _ClienteFalso(filas=[
+        {"id": 3, "img": IMG_BASE64, "galeria": None},
+        {"id": 4, "img": IMG_BASE64, "fotos": f"{IMG_BASE64} | /static/img/casa.jpg | {IMG_BASE64}"},
+        {"id": 5, "img": "/static/img/casa.jpg", "galeria": ["/static/img/casa.jpg"]},
+    ])
+    monkeypatch.setattr(base_datos, "_get_client", lambda: cliente)
+
+    assert base_datos.normalizar_imagenes_existentes() == 2
+    assert cliente.escrituras == [
+        ("update", {"img": f"blob:{CLAVE}", "galeria": [f"blob:{CLAVE}"]}),
+        ("update", {"img": f"blob:{CLAVE}", "galeria": [f"blob:{CLAVE}", "/static/img/casa.jpg"]}),
+    ]
+    assert almacen.existe(CLAVE)
+
+
+# Prueba 4: Un PATCH con solo 'img' cambia la portada y conserva el resto de la galería.
+# Sin la columna 'galeria' la fila lleva solo la portada.
+def test_cambiar_portada_conserva_la_galeria(almacen, monkeypatch):
+    base_datos._cache_propiedades.invalidar()
+    cliente = _ClienteFalso(filas=[{"id": 1, "img": "/static/img/a.jpg", "galeria": ["/static/img/a.jpg", "/static/img/b.jpg"]}])
+    monkeypatch.setattr(base_datos, "_get_client", lambda: cliente)
+
+    base_datos.actualizar_propiedad(1, {"img": "/static/img/c.jpg", "precio": 10})
+    assert cliente.escrituras == [
+        ("update", {"img": "/static/img/c.jpg", "precio": 10, "galeria": ["/static/img/c.jpg", "/static/img/b.jpg"]}),
+    ]
+
+    monkeypatch.setattr(base_datos, "_columna_galeria", False)
+    base_datos.crear_propiedad({"nombre": "Casa", "fotos": ["/static/img/a.jpg", "/static/img/b.jpg"]})
+    assert cliente.escrituras[-1] == ("insert", {"nombre": "Casa", "img": "/static/img/a.jpg"})
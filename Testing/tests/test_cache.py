@@ -0,0 +1,231 @@
+import threading
+import time
+from types import SimpleNamespace
+import pytest
+from persistencia import cache as modulo_cache
+from persistencia.cache import CacheTTL, modo_degradado, reiniciar_modo_degradado
+from persistencia.vuelo_unico import VueloUnico
+
+
+# Prueba 1: La segunda lectura de la misma clave sale del caché (no llama a Supabase)
+# y los contadores de aciertos/fallos lo reflejan.
+def test_cache_lectura_read_through():
+    cache = CacheTTL(ttl=60, max_entradas=10)
+    llamadas = []
+
+    def cargar():
+        llamadas.append(1)
+        return [{"id": 1, "nombre": "Casa"}]
+
+    primero = cache.obtener_o_cargar(("todas",), cargar)
+    segundo = cache.obtener_o_cargar(("todas",), cargar)
+
+    assert primero == segundo == [{"id": 1, "nombre": "Casa"}]
+    assert len(llamadas) == 1
+    assert cache.estadisticas()["aciertos"] == 1
+    assert cache.estadisticas()["fallos"] == 1
+
+
+# Prueba 2: Modificar lo que retorna el caché no altera la copia guardada.
+def test_cache_retorna_copias():
+    cache = CacheTTL(ttl=60, max_entradas=10)
+    cache.guardar("usuarios", [{"id": 1}])
+
+    _, usuarios = cache.obtener("usuarios")
+    usuarios[0]["rol_legible"] = "admin"
+
+    _, usuarios_otra_vez = cache.obtener("usuarios")
+    assert usuarios_otra_vez == [{"id": 1}]
+
+
+# Prueba 3: Se respeta el tamaño máximo (se descarta la entrada menos usada)
+# e 'invalidar' vacía todo el caché.
+def test_cache_tamano_maximo_e_invalidacion():
+    cache = CacheTTL(ttl=60, max_entradas=2)
+    cache.guardar("a", 1)
+    cache.guardar("b", 2)
+    cache.obtener("a")
+    cache.guardar("c", 3)
+
+    assert cache.obtener("b") == (False, None)
+    assert cache.obtener("a") == (True, 1)
+
+    cache.invalidar()
+    assert cache.obtener("a") == (False, None)
+    assert cache.obtener("c") == (False, None)
+
+
+# Prueba 4: Una carga que empezó antes de una invalidación no vuelve a guardar datos viejos.
+def test_cache_no_guarda_lecturas_previas_a_una_escritura():
+    cache = CacheTTL(ttl=60, max_entradas=10)
+
+    def cargar_con_escritura_concurrente():
+        cache.invalidar()
+        return "dato viejo"
+
+    assert cache.obtener_o_cargar("clave", cargar_con_escritura_concurrente) == "dato viejo"
+    assert cache.obtener("clave") == (False, None)
+
+
+# Prueba 5: 'descartar' quita solo las entradas cuya clave cumple el predicado.
+def test_cache_descartar_entradas_puntuales():
+    cache = CacheTTL(ttl=60, max_entradas=10)
+    cache.guardar(("id", 1), "uno")
+    cache.guardar(("id", 2), "dos")
+    cache.guardar(("todos",), ["uno", "dos"])
+
+    assert cache.descartar(lambda clave: clave[0] == "todos" or clave[1] == 1) == 2
+    assert cache.obtener(("id", 1)) == (False, None)
+    assert cache.obtener(("todos",)) == (False, None)
+    assert cache.obtener(("id", 2)) == (True, "dos")
+
+
+# Prueba 6: Lecturas simultáneas de la misma clave comparten una sola carga (y la cuentan como coalescidas);
+# cada una recibe su propia copia. Una lectura posterior a una invalidación no se suma a la carga anterior.
+def test_cache_lecturas_simultaneas_comparten_la_carga():
+    cache = CacheTTL(ttl=60, max_entradas=10)
+    liberar = threading.Event()
+    llamadas = []
+
+    def cargar_lento():
+        llamadas.append(1)
+        liberar.wait(5)
+        return [{"id": len(llamadas)}]
+
+    resultados = []
+    hilos = [
+        threading.Thread(target=lambda: resultados.append(cache.obtener_o_cargar("todas", cargar_lento)))
+        for _ in range(5)
+    ]
+    for hilo in hilos:
+        hilo.start()
+    while cache.estadisticas()["cargas"] + cache.estadisticas()["coalescidas"] < 5:
+        time.sleep(0.01)
+    liberar.set()
+    for hilo in hilos:
+        hilo.join()
+
+    assert llamadas == [1]
+    assert resultados == [[{"id": 1}]] * 5
+    assert len({id(resultado) for resultado in resultados}) == 5
+    assert cache.estadisticas()["coalescidas"] == 4
+
+    liberar.clear()
+    primera = threading.Thread(target=lambda: cache.obtener_o_cargar("otra", cargar_lento))
+    primera.start()
+    while cache.estadisticas()["en_vuelo"] == 0:
+        time.sleep(0.01)
+    cache.invalidar()
+    assert cache.obtener_o_cargar("otra", lambda: "después de la escritura") == "después de la escritura"
+    liberar.set()
+    primera.join()
+
+
+# Prueba 7: Si la carga compartida falla, todas las lecturas que la esperaban reciben el mismo error.
+def test_vuelo_unico_comparte_errores():
+    vuelos = VueloUnico()
+    empezo, liberar = threading.Event(), threading.Event()
+    errores = []
+
+    def cargar_con_error():
+        empezo.set()
+        liberar.wait(5)
+        raise TimeoutError("Supabase no respondió")
+
+    def leer():
+        try:
+            vuelos.ejecutar("clave", cargar_con_error)
+        except TimeoutError as e:
+            errores.append(str(e))
+
+    primera = threading.Thread(target=leer)
+    primera.start()
+    empezo.wait(5)
+    segunda = threading.Thread(target=leer)
+    segunda.start()
+    while vuelos.estadisticas()["coalescidas"] == 0:
+        time.sleep(0.01)
+    liberar.set()
+    primera.join()
+    segunda.join()
+
+    assert errores == ["Supabase no respondió"] * 2
+    assert vuelos.estadisticas() == {"cargas": 1, "coalescidas": 1, "en_vuelo": 0}
+
+
+# Prueba 8: Con 'obsoleto', una entrada vencida hace poco se retorna al tiro y se refresca en segundo plano;
+# pasada la ventana (o sin 'obsoleto', o tras una invalidación) se vuelve a cargar antes de responder.
+def test_cache_obsoleto_mientras_se_refresca(monkeypatch):
+    reloj = [1000.0]
+    monkeypatch.setattr(modulo_cache, "time", SimpleNamespace(monotonic=lambda: reloj[0]))
+    refrescos = []
+    cache = CacheTTL(ttl=10, max_entradas=10, ventana_obsoleta=60, ejecutar=refrescos.append)
+    version = [1]
+
+    def cargar():
+        return {"version": version[0]}
+
+    assert cache.obtener_o_cargar("todas", cargar, obsoleto=True) == {"version": 1}
+    version[0] = 2
+    reloj[0] += 15
+    assert cache.obtener_o_cargar("todas", cargar, obsoleto=True) == {"version": 1}
+    assert len(refrescos) == 1
+    refrescos.pop()()
+    assert cache.obtener_o_cargar("todas", cargar, obsoleto=True) == {"version": 2}
+    assert cache.estadisticas()["obsoletas"] == 1
+
+    version[0] = 3
+    reloj[0] += 15
+    assert cache.obtener_o_cargar("todas", cargar) == {"version": 3}
+    version[0] = 4
+    cache.invalidar()
+    assert cache.obtener_o_cargar("todas", cargar, obsoleto=True) == {"version": 4}
+    version[0] = 5
+    reloj[0] += 100
+    assert cache.obtener_o_cargar("todas", cargar, obsoleto=True) == {"version": 5}
+    assert refrescos == []
+
+
+# Prueba 9: Si Supabase no responde, una lectura con 'obsoleto' recibe la última copia buena (aunque se haya
+# invalidado) o, si nunca la hubo, el último recurso; la petición queda marcada como degradada.
+# Otros errores, y las lecturas sin 'obsoleto', fallan igual que antes.
+def test_cache_respaldo_si_supabase_no_responde():
+    cache = CacheTTL(ttl=60, max_entradas=10, errores_upstream=(TimeoutError,))
+
+    def sin_respuesta():
+        raise TimeoutError("timeout")
+
+    reiniciar_modo_degradado()
+    cache.obtener_o_cargar("todas", lambda: ["buena"], obsoleto=True)
+    cache.invalidar()
+    assert cache.obtener_o_cargar("todas", sin_respuesta, obsoleto=True) == ["buena"]
+    assert modo_degradado() == "cache"
+    assert cache.estadisticas()["respaldos"] == 1
+
+    assert cache.obtener_o_cargar("otra", sin_respuesta, obsoleto=True, ultimo_recurso=lambda: ["local"]) == ["local"]
+    assert modo_degradado() == "archivo"
+    reiniciar_modo_degradado()
+
+    with pytest.raises(TimeoutError):
+        cache.obtener_o_cargar("todas", sin_respuesta)
+    with pytest.raises(TimeoutError):
+        cache.obtener_o_cargar("sin_respaldo", sin_respuesta, obsoleto=True)
+    with pytest.raises(ValueError):
+        cache.obtener_o_cargar("todas", lambda: int("x"), obsoleto=True)
+    assert modo_degradado() is None
+
+
+# Prueba 10: /api/admin/cache entrega los contadores de ambos cachés, solo a administradores.
+def test_endpoint_estadisticas_cache(client):
+    with client.session_transaction() as sesion:
+        sesion["user_id"] = 1
+        sesion["user_role"] = "vendedor"
+    assert client.get('/api/admin/cache', headers={"Accept": "application/json"}).status_code == 403
+
+    with client.session_transaction() as sesion:
+        sesion["user_role"] = "admin"
+    response = client.get('/api/admin/cache')
+    assert response.status_code == 200
+    datos = response.get_json()
+    assert set(datos) == {"propiedades", "usuarios"}
+    assert {"aciertos", "fallos", "cargas", "coalescidas"} <= set(datos["propiedades"])
@@ -0,0 +1,79 @@
+import pytest
+from persistencia import base_datos
+from persistencia.registro_cambios import RegistroCambios
+from servicios import propiedad_service
+
+
+@pytest.fixture
+def catalogo(monkeypatch):
+    llamadas = []
+
+    def leer_falso(parametros):
+        llamadas.append(dict(parametros))
+        return {"propiedades": [{"id": 1, "nombre": "Casa"}], "total": 1, "limit": 50, "next_cursor": None}
+
+    monkeypatch.setattr("controladores.propiedad_controller.leer_pagina_propiedades", leer_falso)
+    return llamadas
+
+
+# Registro de cambios con la versión compartida (como si ya se hubiera leído la tabla de cambios)
+@pytest.fixture
+def version_compartida(monkeypatch):
+    registro = RegistroCambios()
+    registro.compartir([(10, 1, False)], modificado=1700000000.0)
+    monkeypatch.setattr(base_datos, "_registro_cambios", registro)
+    return registro
+
+
+# Prueba 1: La API pública del catálogo sale con ETag y caché público revalidable (no 'no-store').
+# Con la versión compartida e If-None-Match vigente responde 304 sin volver a leer las propiedades.
+def test_api_propiedades_get_condicional(client, catalogo, version_compartida):
+    response = client.get('/api/propiedades')
+    assert response.status_code == 200
+    etag = response.headers["ETag"]
+    assert "no-store" not in response.headers["Cache-Control"]
+    assert "public" in response.headers["Cache-Control"]
+    assert "Last-Modified" in response.headers
+
+    response = client.get('/api/propiedades', headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.data == b""
+    assert catalogo == [{}]
+
+
+# Prueba 2: Una escritura sube la versión del catálogo y el ETag anterior deja de servir.
+# Otros parámetros (filtros) tienen otro ETag.
+def test_escritura_cambia_el_etag(client, catalogo, version_compartida):
+    etag = client.get('/api/propiedades').headers["ETag"]
+    assert client.get('/api/propiedades?q=casa').headers["ETag"] != etag
+
+    version_compartida.agregar([(11, 1, False)])
+    response = client.get('/api/propiedades', headers={"If-None-Match": etag})
+    assert response.status_code == 200
+    assert response.headers["ETag"] != etag
+
+
+# Prueba 3: Sin la versión compartida el ETag sale del contenido: no cambia entre procesos (cada uno con su
+# propia versión) ni cuando la versión sube sin que cambien los datos, y con If-None-Match vigente responde 304.
+def test_etag_por_contenido_sin_version_compartida(client, catalogo, monkeypatch):
+    monkeypatch.setattr(base_datos, "_registro_cambios", RegistroCambios())
+    etag = client.get('/api/propiedades').headers["ETag"]
+
+    monkeypatch.setattr(base_datos, "_registro_cambios", RegistroCambios())
+    base_datos._registro_cambios.registrar([1])
+    response = client.get('/api/propiedades', headers={"If-None-Match": etag})
+    assert response.status_code == 304
+    assert response.headers["ETag"] == etag
+    assert "Last-Modified" not in response.headers
+
+
+# Prueba 4: Las respuestas con datos del usuario y los errores siguen con 'no-store'.
+def test_respuestas_privadas_siguen_sin_cache(client, monkeypatch):
+    response = client.get('/api/me')
+    assert "no-store" in response.headers["Cache-Control"]
+
+    monkeypatch.setattr(
+        propiedad_service, "consultar_mapa", lambda *args, **kwargs: {"clusters": [], "marcadores": [], "total": 0}
+    )
+    assert "no-store" in client.get('/api/propiedades/mapa?bbox=1,2').headers["Cache-Control"]
+    assert "public" in client.get('/api/propiedades/mapa?bbox=1,2,3,4').headers["Cache-Control"]
@@ -0,0 +1,164 @@
+from datetime import datetime
+import pytest
+from persistencia import base_datos
+from persistencia.indice_catalogo import IndiceCatalogo
+from persistencia.registro_cambios import RegistroCambios
+
+
+# Prueba 1: Desde una versión se obtiene cada propiedad cambiada una sola vez, con su último estado
+# (actualizada o eliminada); versiones de otro proceso, futuras u olvidadas no se pueden continuar.
+def test_registro_de_cambios():
+    registro = RegistroCambios(capacidad=5)
+    inicio = registro.version()["version"]
+    registro.registrar([1, 2])
+    medio = registro.registrar([3])
+    registro.registrar(eliminadas=[2])
+    registro.registrar([3])
+
+    actualizadas, eliminadas, version = registro.cambios_desde(inicio)
+    assert (actualizadas, eliminadas) == ([1, 3], [2])
+    assert version == registro.version()["version"]
+    assert registro.cambios_desde(medio)[:2] == ([3], [2])
+    assert registro.cambios_desde(version)[:2] == ([], [])
+
+    assert registro.cambios_desde("otro.1") is None
+    assert registro.cambios_desde(f"{registro.token}.99") is None
+    assert registro.cambios_desde(None) is None
+    registro.registrar([4])  # se olvida el cambio más antiguo (capacidad 5)
+    assert registro.cambios_desde(inicio) is None
+    assert registro.cambios_desde(medio)[:2] == ([3, 4], [2])
+
+
+# Prueba 2: Con la tabla de cambios la versión es su número de secuencia: dos procesos que la leen dan las mismas
+# versiones y un cliente puede continuar en cualquiera de ellos. Las filas ya leídas se ignoran.
+def test_versiones_compartidas_entre_procesos():
+    filas = [(10, 1, False), (11, 2, False), (12, 1, True)]
+    proceso_a, proceso_b = RegistroCambios(capacidad=5), RegistroCambios(capacidad=5)
+    version_del_proceso = proceso_a.version()["version"]
+    assert proceso_a.compartir(filas[:2]) == "11"
+    proceso_b.compartir(filas[:1])
+    assert proceso_a.cambios_desde(version_del_proceso) is None
+
+    assert proceso_b.agregar(filas) == "12"
+    assert proceso_b.agregar(filas[:2]) == "12"
+    assert proceso_a.agregar(filas[2:]) == "12"
+    assert proceso_a.cambios_desde("10") == proceso_b.cambios_desde("10") == ([2], [1], "12")
+    assert proceso_b.cambios_desde("9") == ([2], [1], "12")
+    assert proceso_b.cambios_desde("8") is None  # anterior al historial que se leyó
+    assert proceso_b.cambios_desde(version_del_proceso.replace(".0", ".10")) is None
+
+
+# Prueba 3: Al recargar, el índice informa qué propiedades cambiaron o desaparecieron (ej. escritas por otro proceso).
+def test_recarga_del_indice_informa_diferencias():
+    indice = IndiceCatalogo(ttl=60)
+    indice.cargar([{"id": 1, "nombre": "Casa"}, {"id": 2, "nombre": "Depto"}, {"id": 3, "nombre": "Parcela"}])
+
+    assert indice.cargar([{"id": 1, "nombre": "Casa"}, {"id": 2, "nombre": "Depto 2"}, {"id": 4, "nombre": "Nueva"}]) \
+        == ([2, 4], [3])
+
+
+@pytest.fixture
+def catalogo(monkeypatch):
+    filas = {1: {"id": 1, "nombre": "Casa", "propietario": 7}, 2: {"id": 2, "nombre": "Depto", "propietario": 8}}
+    indice = IndiceCatalogo(ttl=60)
+    indice.cargar(filas.values())
+    monkeypatch.setattr(base_datos, "_obtener_indice", lambda: indice)
+    monkeypatch.setattr(base_datos, "_indice_catalogo", indice)
+    monkeypatch.setattr(
+        base_datos, "_obtener_propiedades_en_orden",
+        lambda ids, columnas, client=None: [dict(filas[i]) for i in ids if i in filas]
+    )
+    monkeypatch.setattr(base_datos, "obtener_usuarios_por_ids", lambda ids: {7: {"nombre": "Ana", "apellido": "Soto"}})
+    return filas
+
+
+# Prueba 4: El endpoint retorna solo lo cambiado desde 'desde' (las que ya no existen van como eliminadas);
+# sin versión válida pide reiniciar. Los cambios de un usuario marcan sus propiedades.
+def test_api_cambios_desde_version(client, catalogo):
+    desde = base_datos.version_catalogo()["version"]
+    base_datos._nueva_version_catalogo([1, 3])
+    base_datos._nueva_version_catalogo(eliminadas=[2])
+    del catalogo[2]
+
+    datos = client.get(f'/api/propiedades/cambios?desde={desde}').get_json()
+    assert datos["reiniciar"] is False
+    assert [(p["id"], p["propietario_nombre"]) for p in datos["propiedades"]] == [(1, "Ana Soto")]
+    assert datos["eliminadas"] == [2, 3]
+    assert datos["version"] == base_datos.version_catalogo()["version"]
+
+    assert client.get(f'/api/propiedades/cambios?desde={datos["version"]}').get_json()["propiedades"] == []
+    assert client.get('/api/propiedades/cambios?desde=x.1').get_json()["reiniciar"] is True
+    assert client.get('/api/propiedades/cambios').get_json()["reiniciar"] is True
+
+    desde = base_datos.version_catalogo()["version"]
+    base_datos._nueva_version_catalogo(base_datos._propiedades_de(7))
+    assert [p["id"] for p in client.get(f'/api/propiedades/cambios?desde={desde}').get_json()["propiedades"]] == [1]
+
+
+# Cliente falso de Supabase con solo la tabla de cambios (respeta 'gt', 'order' y 'limit').
+class _RespuestaFalsa:
+    def __init__(self, data):
+        self.data = data
+
+
+class _ConsultaCambios:
+    def __init__(self, filas):
+        self.filas = list(filas)
+
+    def select(self, columnas):
+        return self
+
+    def gt(self, columna, valor):
+        self.filas = [fila for fila in self.filas if fila[columna] > valor]
+        return self
+
+    def order(self, columna, desc=False):
+        self.filas.sort(key=lambda fila: fila[columna], reverse=desc)
+        return self
+
+    def limit(self, cantidad):
+        self.filas = self.filas[:cantidad]
+        return self
+
+    def execute(self):
+        return _RespuestaFalsa(self.filas)
+
+
+def _cambio(seq, propiedad_id, eliminada=False):
+    return {"seq": seq, "propiedad_id": propiedad_id, "eliminada": eliminada, "creado": f"2026-10-18T12:00:{seq:02d}+00:00"}
+
+
+# Prueba 5: sincronizar_cambios lee la tabla de cambios (la primera vez, su historial): las propiedades que cambió
+# otro proceso se actualizan en el índice antes de subir la versión; las propias no se vuelven a pedir.
+# Una versión de otro proceso más nueva que la de este hace leer la tabla. Recargar el índice no sube la versión.
+def test_sincronizar_con_la_tabla_de_cambios(catalogo, monkeypatch):
+    tabla = [_cambio(4, 1)]
+    monkeypatch.setattr(base_datos, "_get_client", lambda: type("Cliente", (), {"table": lambda self, t: _ConsultaCambios(tabla)})())
+    monkeypatch.setattr(base_datos, "_registro_cambios", RegistroCambios())
+    monkeypatch.setattr(base_datos, "_cambios_compartidos", None)
+    pedidas = []
+
+    def obtener_en_orden(ids, columnas, client=None):
+        pedidas.append(ids)
+        return [dict(catalogo[i]) for i in ids if i in catalogo]
+    monkeypatch.setattr(base_datos, "_obtener_propiedades_en_orden", obtener_en_orden)
+
+    assert base_datos.sincronizar_cambios() == "4"
+    assert pedidas == []
+
+    catalogo[2]["nombre"] = "Depto Nuevo"
+    tabla.extend([_cambio(5, 2), _cambio(7, 1)])
+    assert base_datos.sincronizar_cambios(propias=[1]) == "7"
+    assert pedidas == [[2]]
+    assert base_datos._indice_catalogo.documento(2)["nombre"] == "Depto Nuevo"
+    assert base_datos.ids_cambiados_desde("4")[:2] == ([1, 2], [])
+    assert base_datos.version_catalogo()["modificado"] == datetime.fromisoformat("2026-10-18T12:00:07+00:00").timestamp()
+
+    del catalogo[2]
+    tabla.append(_cambio(9, 2, eliminada=True))
+    assert base_datos.ids_cambiados_desde("9") == ([], [], "9")
+    assert base_datos._indice_catalogo.documento(2) is None
+
+    monkeypatch.setattr(base_datos, "_recargar_indice", lambda: ([1], [3]))
+    base_datos._cargar_indice_o_degradar()
+    assert base_datos.version_catalogo()["version"] == "9"
@@ -0,0 +1,66 @@
+import io
+import pytest
+from persistencia import blobs
+from servicios import derivados_service
+
+Image = pytest.importorskip("PIL.Image")
+
+
+def _jpeg(ancho, alto):
+    salida = io.BytesIO()
+    Image.new("RGB", (ancho, alto), (200, 30, 30)).save(salida, "JPEG")
+    return salida.getvalue()
+
+
+@pytest.fixture
+def almacen(tmp_path):
+    almacen = blobs.AlmacenLocal(tmp_path)
+    blobs.configurar_almacen(almacen)
+    yield almacen
+    blobs.configurar_almacen(None)
+
+
+# Prueba 1: Se generan las tres variantes, reducidas al ancho de cada una (sin agrandar),
+# y una segunda llamada no vuelve a generarlas.
+def test_generar_variantes(almacen):
+    clave = almacen.guardar(_jpeg(2000, 1000))
+
+    assert derivados_service.generar_variantes(clave) == ["thumb", "card", "full"]
+    assert derivados_service.generar_variantes(clave) == []
+
+    for nombre, ancho in derivados_service.VARIANTES.items():
+        with Image.open(io.BytesIO(almacen.leer_variante(clave, nombre))) as variante:
+            assert variante.size == (ancho, ancho // 2)
+
+
+# Prueba 2: El hilo de fondo genera las variantes de las referencias encoladas
+# (las URLs externas se ignoran).
+def test_encolar_variantes_en_segundo_plano(almacen):
+    clave = almacen.guardar(_jpeg(600, 400))
+
+    derivados_service.encolar_variantes([blobs.referencia_blob(clave), "https://ejemplo.cl/casa.jpg"])
+    derivados_service.esperar_variantes()
+
+    assert all(almacen.existe_variante(clave, nombre) for nombre in derivados_service.VARIANTES)
+
+
+# Prueba 3: El endpoint entrega la variante pedida; si no existe entrega el original sin fijarlo en caché.
+def test_endpoint_variante_con_respaldo_al_original(client, almacen, monkeypatch):
+    original = _jpeg(900, 600)
+    clave = almacen.guardar(original)
+    propiedad = {"id": 5, "img": blobs.referencia_blob(clave)}
+    monkeypatch.setattr(
+        "controladores.propiedad_controller.obtener_propiedad_por_id",
+        lambda propiedad_id, perfil="full", obsoleto=False: propiedad
+    )
+    version = clave[:32]
+
+    response = client.get(f'/api/propiedades/5/imagenes/0?v={version}&variante=card')
+    assert response.data == original
+    assert "immutable" not in response.headers["Cache-Control"]
+
+    derivados_service.generar_variantes(clave)
+    response = client.get(f'/api/propiedades/5/imagenes/0?v={version}&variante=card')
+    assert response.data == almacen.leer_variante(clave, "card")
+    assert response.headers["ETag"] == f'"{version}-card"'
+    assert "immutable" in response.headers["Cache-Control"]
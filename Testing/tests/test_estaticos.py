@@ -0,0 +1,66 @@
+import gzip
+import os
+from flask import render_template, url_for
+from app import app
+from utils.estaticos import ManifiestoEstaticos
+
+
+# Prueba 1: url_for('static', ...) agrega la huella del contenido; con esa huella el archivo
+# se guarda un año (immutable) y, si el navegador acepta gzip, llega comprimido.
+def test_estatico_con_huella_y_gzip(client):
+    with app.test_request_context():
+        url = url_for('static', filename='js/loader.js')
+    huella = app.extensions["estaticos"].huella('js/loader.js')
+    assert url == f'/static/js/loader.js?v={huella}'
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["Content-Encoding"] == "gzip"
+    assert "immutable" in response.headers["Cache-Control"]
+    assert "max-age=31536000" in response.headers["Cache-Control"]
+    with open(app.static_folder + '/js/loader.js', 'rb') as f:
+        assert gzip.decompress(response.data) == f.read()
+
+    response = client.get(url, headers={"Accept-Encoding": "gzip", "If-None-Match": response.headers["ETag"]})
+    assert response.status_code == 304
+
+
+# Prueba 2: Sin huella (o con una antigua) se revalida; sin gzip llega el archivo tal cual.
+def test_estatico_sin_huella_se_revalida(client):
+    response = client.get('/static/css/loader.css?v=antigua')
+    assert response.status_code == 200
+    assert "Content-Encoding" not in response.headers
+    assert "no-cache" in response.headers["Cache-Control"]
+    assert "immutable" not in response.headers["Cache-Control"]
+    assert client.get('/static/css/no-existe.css').status_code == 404
+
+
+# Prueba 3: Si el archivo cambia en disco, cambia su huella; las rutas fuera de la carpeta no tienen huella.
+def test_huella_cambia_con_el_contenido(tmp_path):
+    archivo = tmp_path / "app.css"
+    archivo.write_text("body { color: red; }")
+    manifiesto = ManifiestoEstaticos(str(tmp_path))
+    antes = manifiesto.precargar()["app.css"]
+
+    archivo.write_text("body { color: blue; }  ")
+    assert manifiesto.huella("app.css") != antes
+    assert manifiesto.huella("../secreto.txt") is None
+
+
+# Prueba 4: Leaflet se sirve desde static/ con huella (y precarga en el <head>); ninguna plantilla usa un CDN.
+def test_leaflet_local_con_precarga(client):
+    with app.test_request_context():
+        cabecera = render_template('_leaflet_head.html')
+    huella = app.extensions["estaticos"].huella('vendor/leaflet/leaflet.js')
+    assert huella
+    assert f'<link rel="preload" href="/static/vendor/leaflet/leaflet.js?v={huella}" as="script">' in cabecera
+    assert 'vendor/leaflet/leaflet.css?v=' in cabecera
+
+    response = client.get(f'/static/vendor/leaflet/leaflet.js?v={huella}')
+    assert response.status_code == 200
+    assert "immutable" in response.headers["Cache-Control"]
+    assert client.get('/static/vendor/leaflet/images/marker-icon.png').status_code == 200
+
+    for nombre in os.listdir(app.template_folder):
+        with open(os.path.join(app.template_folder, nombre), encoding='utf-8') as f:
+            assert 'unpkg.com' not in f.read(), nombre
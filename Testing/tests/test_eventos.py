@@ -0,0 +1,138 @@
+import json
+import time
+import pytest
+from persistencia import base_datos
+from persistencia.indice_catalogo import IndiceCatalogo
+from servicios import eventos_service
+
+
+@pytest.fixture
+def catalogo(monkeypatch):
+    indice = IndiceCatalogo(ttl=60)
+    indice.cargar([{"id": 1, "activo": True}, {"id": 2, "activo": False}, {"id": 3, "activo": True}])
+    monkeypatch.setattr(base_datos, "_obtener_indice", lambda: indice)
+    monkeypatch.setattr(eventos_service, "INTERVALO_LATIDO", 0.05)
+    monkeypatch.setattr(eventos_service, "DURACION_MAXIMA", 0.3)
+    monkeypatch.setattr(eventos_service, "DURACION_PUBLICA", 0.3)
+    return indice
+
+
+def _iniciar_sesion(client, rol="vendedor"):
+    with client.session_transaction() as sesion:
+        sesion["user_id"] = 1
+        sesion["user_role"] = rol
+
+
+def _eventos(texto):
+    eventos = []
+    for bloque in texto.split("\n\n"):
+        campos = dict(linea.split(": ", 1) for linea in bloque.splitlines() if ": " in linea and linea[0] != ":")
+        if "event" in campos:
+            eventos.append((campos["event"], campos["id"], json.loads(campos["data"])))
+    return eventos
+
+
+# Prueba 1: Tras una escritura llega un evento 'cambios' con la versión como 'id'.
+# Compradores y visitantes no ven propiedades inactivas (les llegan como eliminadas); el admin ve todas.
+def test_eventos_filtrados_por_rol(catalogo):
+    desde = base_datos.version_catalogo()["version"]
+    version = base_datos._nueva_version_catalogo([1, 2], [3])
+
+    comprador = eventos_service.abrir_flujo_eventos("comprador", desde)
+    visitante = eventos_service.abrir_flujo_eventos(None, desde)
+    admin = eventos_service.abrir_flujo_eventos("admin", desde)
+    try:
+        for flujo in (comprador, visitante):
+            assert _eventos(flujo.siguiente_evento()) == [
+                ("cambios", version, {"version": version, "actualizadas": [1], "eliminadas": [2, 3]})
+            ]
+        assert _eventos(admin.siguiente_evento()) == [
+            ("cambios", version, {"version": version, "actualizadas": [1, 2], "eliminadas": [3]})
+        ]
+        # Una propiedad inactiva editada le llega al comprador como eliminada (si la tenía, la quita)
+        version = base_datos._nueva_version_catalogo([2])
+        assert _eventos(comprador.siguiente_evento())[0][2] == {"version": version, "actualizadas": [], "eliminadas": [2]}
+        # Sin cambios posteriores no hay evento
+        assert admin.siguiente_evento() is not None and admin.siguiente_evento() is None
+    finally:
+        comprador.close()
+        visitante.close()
+        admin.close()
+
+
+# Prueba 2: El endpoint continúa desde Last-Event-ID, envía latidos sin cambios y se cierra solo;
+# una versión que no se puede continuar produce 'reiniciar'. Al cerrar se libera el cupo de la conexión.
+def test_endpoint_sse_reanuda_y_libera_cupo(client, catalogo):
+    desde = base_datos.version_catalogo()["version"]
+    version = base_datos._nueva_version_catalogo([3])
+
+    response = client.get('/api/eventos', headers={"Last-Event-ID": desde})
+    assert response.mimetype == "text/event-stream"
+    assert "no-store" in response.headers["Cache-Control"]
+    texto = response.get_data(as_text=True)
+    assert texto.startswith("retry: ")
+    assert ": latido" in texto
+    assert _eventos(texto) == [("cambios", version, {"version": version, "actualizadas": [3], "eliminadas": []})]
+    assert eventos_service._conexiones == 1
+    response.close()  # lo que hace el servidor WSGI al terminar (o si el navegador se desconecta)
+    assert eventos_service._conexiones == 0
+
+    with client.get('/api/eventos?desde=otro.5') as response:
+        assert [tipo for tipo, _, _ in _eventos(response.get_data(as_text=True))] == ["reiniciar"]
+    assert eventos_service._conexiones == 0
+
+
+# Prueba 3: Sobre el máximo de conexiones abiertas se responde 503 con Retry-After.
+# Compradores y visitantes tienen su propio cupo: llenarlo no deja sin conexión a los paneles.
+def test_maximo_de_conexiones(client, catalogo, monkeypatch):
+    monkeypatch.setattr(eventos_service, "MAX_CONEXIONES", 2)
+    monkeypatch.setattr(eventos_service, "MAX_CONEXIONES_PUBLICAS", 1)
+    publica = eventos_service.abrir_flujo_eventos(None)
+    try:
+        response = client.get('/api/eventos')
+        assert response.status_code == 503
+        assert response.headers["Retry-After"] == "3"
+        assert eventos_service.abrir_flujo_eventos("comprador") is None
+
+        panel = eventos_service.abrir_flujo_eventos("vendedor")
+        assert panel is not None
+        _iniciar_sesion(client, "admin")
+        assert client.get('/api/eventos').status_code == 503
+        panel.close()
+    finally:
+        publica.close()
+    nueva = eventos_service.abrir_flujo_eventos("comprador")
+    assert nueva is not None
+    nueva.close()
+    nueva.close()
+    assert (eventos_service._conexiones, eventos_service._conexiones_publicas) == (0, 0)
+
+
+# Prueba 4: Los latidos se siguen enviando aunque el flujo despierte seguido por cambios que no producen evento.
+def test_latido_con_despertares_sin_evento(catalogo, monkeypatch):
+    def despertar(desde, espera):
+        time.sleep(0.005)
+        return True
+
+    monkeypatch.setattr(eventos_service, "esperar_cambios_catalogo", despertar)
+    monkeypatch.setattr(eventos_service, "ids_cambiados_desde", lambda desde: ([], [], desde))
+    flujo = eventos_service.abrir_flujo_eventos("admin")
+    try:
+        texto = "".join(flujo)
+    finally:
+        flujo.close()
+    assert texto.count(": latido") >= 3
+    assert _eventos(texto) == []
+
+
+# Prueba 5: La conexión de un comprador o visitante se cierra tras DURACION_PUBLICA (más corta que la de los paneles).
+def test_conexion_publica_dura_menos(catalogo, monkeypatch):
+    monkeypatch.setattr(eventos_service, "DURACION_MAXIMA", 5)
+    monkeypatch.setattr(eventos_service, "DURACION_PUBLICA", 0.1)
+    flujo = eventos_service.abrir_flujo_eventos(None)
+    inicio = time.monotonic()
+    try:
+        "".join(flujo)
+    finally:
+        flujo.close()
+    assert time.monotonic() - inicio < 1
@@ -0,0 +1,114 @@
+import base64
+import hashlib
+import io
+import pytest
+from persistencia import blobs
+from servicios.imagen_service import huella_fuente
+
+JPEG_FALSO = b"\xff\xd8\xff\xe0" + b"0123456789" * 20
+IMG_BASE64 = base64.b64encode(JPEG_FALSO).decode()
+
+
+@pytest.fixture
+def propiedad_con_imagen(monkeypatch):
+    propiedad = {"id": 5, "nombre": "Casa", "activo": True, "img": IMG_BASE64}
+    monkeypatch.setattr(
+        "controladores.propiedad_controller.obtener_propiedad_por_id",
+        lambda propiedad_id, perfil="full", obsoleto=False: propiedad if propiedad_id == 5 else None
+    )
+    return propiedad
+
+
+# Prueba 1: La imagen se sirve decodificada, con ETag y caché público (no 'no-store').
+def test_imagen_se_sirve_como_bytes(client, propiedad_con_imagen):
+    response = client.get('/api/propiedades/5/imagenes/0')
+
+    assert response.status_code == 200
+    assert response.data == JPEG_FALSO
+    assert response.mimetype == "image/jpeg"
+    assert response.headers["ETag"] == f'"{huella_fuente(IMG_BASE64)}"'
+    assert "no-store" not in response.headers["Cache-Control"]
+
+
+# Prueba 2: GET condicional (304) y peticiones parciales (Range -> 206).
+def test_imagen_get_condicional_y_range(client, propiedad_con_imagen):
+    etag = huella_fuente(IMG_BASE64)
+
+    response = client.get('/api/propiedades/5/imagenes/0', headers={"If-None-Match": f'"{etag}"'})
+    assert response.status_code == 304
+    assert response.data == b""
+
+    response = client.get('/api/propiedades/5/imagenes/0', headers={"Range": "bytes=0-3"})
+    assert response.status_code == 206
+    assert response.data == JPEG_FALSO[:4]
+
+
+# Prueba 3: Con '?v=' igual a la huella la respuesta es inmutable; sin imagen, 404.
+def test_imagen_versionada_inmutable(client, propiedad_con_imagen):
+    etag = huella_fuente(IMG_BASE64)
+
+    response = client.get(f'/api/propiedades/5/imagenes/0?v={etag}')
+    assert "immutable" in response.headers["Cache-Control"]
+    assert "max-age=31536000" in response.headers["Cache-Control"]
+
+    assert client.get('/api/propiedades/5/imagenes/1').status_code == 404
+    assert client.get('/api/propiedades/6/imagenes/0').status_code == 404
+
+
+@pytest.fixture
+def vendedor(client, tmp_path):
+    almacen = blobs.AlmacenLocal(tmp_path)
+    blobs.configurar_almacen(almacen)
+    with client.session_transaction() as sesion:
+        sesion['user_id'] = 1
+        sesion['user_role'] = 'vendedor'
+    yield almacen
+    blobs.configurar_almacen(None)
+
+
+# Prueba 4: La subida multipart guarda el archivo en el almacén y retorna su referencia;
+# un archivo que no es imagen se rechaza con 400.
+def test_subir_imagen_multipart(client, vendedor):
+    response = client.post('/api/imagenes', data={"imagen": (io.BytesIO(JPEG_FALSO), "casa.jpg")},
+                           content_type='multipart/form-data', headers={"Accept": "application/json"})
+
+    assert response.status_code == 201
+    clave = hashlib.sha256(JPEG_FALSO).hexdigest()
+    assert response.get_json() == {"referencia": f"blob:{clave}"}
+    assert vendedor.leer(clave) == JPEG_FALSO
+
+    response = client.post('/api/imagenes', data={"imagen": (io.BytesIO(b"hola"), "nota.txt")},
+                           content_type='multipart/form-data', headers={"Accept": "application/json"})
+    assert response.status_code == 400
+
+
+# Prueba 5: Una subida sobre MAX_CONTENT_LENGTH responde 413 en JSON y no deja nada en el almacén.
+def test_subir_imagen_supera_limite(app, client, vendedor, tmp_path, monkeypatch):
+    monkeypatch.setitem(app.config, 'MAX_CONTENT_LENGTH', 1024)
+    grande = JPEG_FALSO + b"0" * 4096
+
+    response = client.post('/api/imagenes', data={"imagen": (io.BytesIO(grande), "casa.jpg")},
+                           content_type='multipart/form-data', headers={"Accept": "application/json"})
+
+    assert response.status_code == 413
+    assert "error" in response.get_json()
+    assert not any(tmp_path.rglob("*"))
+
+
+# Prueba 6: La portada de cada tarjeta sale de 'galeria' con '?v=' (sin consultar a Supabase);
+# solo las filas antiguas sin 'galeria' se consultan, y 'galeria' no queda en la propiedad.
+def test_portadas_con_huella_desde_la_galeria(app, monkeypatch):
+    from controladores import vista_controller
+    consultados = []
+    monkeypatch.setattr(vista_controller, "obtener_ids_con_imagen", lambda ids: consultados.extend(ids) or {11})
+    referencia = "blob:" + "a" * 64
+    propiedades = [{"id": 10, "galeria": [referencia]}, {"id": 11}, {"id": 12, "galeria": []}]
+
+    with app.test_request_context():
+        vista_controller._asignar_portadas(propiedades)
+
+    assert f"v={huella_fuente(referencia)}" in propiedades[0]["imagen_portada"]
+    assert propiedades[1]["imagen_portada"].startswith("/api/propiedades/11/imagenes/0")
+    assert propiedades[2]["imagen_portada"] is None
+    assert consultados == [11]
+    assert not any("galeria" in propiedad for propiedad in propiedades)
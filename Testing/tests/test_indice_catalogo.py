@@ -0,0 +1,187 @@
+import pytest
+from persistencia.indice_catalogo import IndiceCatalogo
+
+PROPIEDADES = [
+    {"id": 1, "nombre": "Casa en Curicó", "localizacion": "Curicó", "descripcion": "Amplia, con patio",
+     "tipo": "Casa", "estado": "venta", "precio": 90000000},
+    {"id": 2, "nombre": "Depto céntrico", "localizacion": "Talca", "descripcion": "Cerca de la plaza",
+     "tipo": "Departamento", "estado": "arriendo", "precio": 450000},
+    {"id": 3, "nombre": "Casa de campo", "localizacion": "Molina", "descripcion": "Con piscina y patio",
+     "tipo": "Casa", "estado": "venta", "precio": 120000000},
+]
+
+
+def _indice():
+    indice = IndiceCatalogo(ttl=60)
+    indice.cargar(PROPIEDADES)
+    return indice
+
+
+# Prueba 1: La búsqueda no distingue tildes ni mayúsculas, acepta comienzos de palabra
+# y con varias palabras exige que estén todas (intersección).
+def test_busqueda_texto_plegada_e_intersectada():
+    indice = _indice()
+
+    assert indice.consultar({"q": "curico"}) == [1]
+    assert indice.consultar({"q": "CÉNTRICO"}) == [2]
+    assert indice.consultar({"q": "pati"}) == [1, 3]
+    assert indice.consultar({"q": "casa patio piscina"}) == [3]
+    assert indice.consultar({"q": "casa talca"}) == []
+
+
+# Prueba 2: El texto se combina con los demás filtros del catálogo.
+def test_texto_combinado_con_filtros():
+    indice = _indice()
+
+    assert indice.consultar({"q": "casa", "tipo": "casa", "estado": "venta", "max_precio": 100000000}) == [1]
+    assert indice.consultar({"tipo": "departamento"}) == [2]
+    assert indice.consultar({}) == [1, 2, 3]
+
+
+# Prueba 3: Altas, ediciones y bajas actualizan el índice sin recargarlo.
+def test_actualizacion_incremental():
+    indice = _indice()
+
+    indice.guardar({"id": 4, "nombre": "Parcela", "localizacion": "Curicó", "descripcion": "",
+                    "tipo": "Parcela", "estado": "venta", "precio": 30000000})
+    indice.guardar({"id": 1, "localizacion": "Rauco"})
+    indice.eliminar(3)
+
+    assert indice.consultar({"q": "curico"}) == [1, 4]
+    assert indice.consultar({"q": "rauco"}) == [1]
+    assert indice.consultar({"q": "piscina"}) == []
+    assert indice.consultar({"q": "molina"}) == []
+    assert not indice.vencido()
+
+
+# Prueba 4: Filtros de rango (min_/max_) sobre los arreglos ordenados de cada campo numérico,
+# combinados entre sí y con el texto; se mantienen al editar y eliminar.
+def test_filtros_de_rango_numericos():
+    indice = IndiceCatalogo(ttl=60)
+    indice.cargar([
+        dict(PROPIEDADES[0], dormitorios=3, **{"baños": 2}, area=120),
+        dict(PROPIEDADES[1], dormitorios=1, **{"baños": 1}, area=45),
+        dict(PROPIEDADES[2], dormitorios=4, **{"baños": 3}, area=300),
+    ])
+
+    assert indice.consultar({"min_precio": 450000, "max_precio": 90000000}) == [1, 2]
+    assert indice.consultar({"min_dormitorios": 3, "max_area": 200}) == [1]
+    assert indice.consultar({"q": "casa", "min_baños": 3}) == [3]
+    assert indice.ids_en_rango("area", None, 45) == {2}
+
+    indice.guardar({"id": 2, "area": 500})
+    indice.eliminar(3)
+    assert indice.consultar({"min_area": 200}) == [2]
+
+
+# Prueba 5: La grilla espacial retorna solo las propiedades activas dentro del rectángulo
+# (con lat/lng ya numéricas), combinadas con los filtros, y se mantiene al mover o desactivar.
+def test_marcadores_en_rectangulo():
+    indice = IndiceCatalogo(ttl=60)
+    indice.cargar([
+        dict(PROPIEDADES[0], coordenadas="-34.9850, -71.2390", activo=True, propietario=7),
+        dict(PROPIEDADES[1], coordenadas="-35.4264,-71.6554", activo=True),
+        dict(PROPIEDADES[2], coordenadas="-35.1140,-71.2830", activo=False),
+        {"id": 4, "nombre": "Sin coordenadas", "coordenadas": "sin dato", "activo": True},
+    ])
+    caja_curico = (-35.2, -71.4, -34.9, -71.1)
+
+    marcadores = indice.marcadores(caja_curico)
+    assert [m["id"] for m in marcadores] == [1]
+    assert marcadores[0]["lat"] == -34.985 and marcadores[0]["lng"] == -71.239
+    assert marcadores[0]["propietario"] == 7
+    assert [m["id"] for m in indice.marcadores((-36, -72, -34, -71))] == [1, 2]
+    assert indice.marcadores((-36, -72, -34, -71), {"estado": "arriendo"})[0]["id"] == 2
+
+    indice.guardar({"id": 3, "activo": True})
+    indice.guardar({"id": 1, "coordenadas": "-33.45,-70.66"})
+    assert [m["id"] for m in indice.marcadores(caja_curico)] == [3]
+
+
+# Prueba 6: Los clusters se mantienen al agregar, mover (o cambiar de precio) y desactivar propiedades.
+def test_clusters_incrementales():
+    indice = IndiceCatalogo(ttl=60)
+    indice.cargar([
+        {"id": 1, "coordenadas": "-34.98,-71.23", "precio": 100, "activo": True},
+        {"id": 2, "coordenadas": "-34.99,-71.24", "precio": 300, "activo": True},
+    ])
+    caja = (-36, -72, -34, -71)
+
+    clusters, sueltos = indice.clusters(caja, 8)
+    assert [(c["cantidad"], c["precio_min"], c["precio_max"]) for c in clusters] == [(2, 100, 300)]
+    assert sueltos == []
+
+    indice.guardar({"id": 3, "coordenadas": "-34.97,-71.22", "precio": 50, "activo": True})
+    indice.guardar({"id": 2, "precio": 500})
+    clusters, _ = indice.clusters(caja, 8)
+    assert [(c["cantidad"], c["precio_min"], c["precio_max"]) for c in clusters] == [(3, 50, 500)]
+
+    indice.guardar({"id": 3, "activo": False})
+    indice.guardar({"id": 2, "coordenadas": "-35.43,-71.66"})
+    clusters, sueltos = indice.clusters(caja, 8)
+    assert clusters == []
+    assert [m["id"] for m in sueltos] == [1, 2]
+
+
+# Prueba 7: Filtro por radio (haversine) y orden por distancia; con límite usa la búsqueda de k-vecinos
+# y da el mismo resultado que ordenar todo. Las propiedades sin coordenadas no entran al ordenar por distancia.
+def test_radio_y_orden_por_distancia():
+    indice = IndiceCatalogo(ttl=60)
+    indice.cargar([
+        {"id": 1, "coordenadas": "-35.00,-71.00", "tipo": "Casa", "activo": True},
+        {"id": 2, "coordenadas": "-35.01,-71.00", "tipo": "Casa", "activo": True},
+        {"id": 3, "coordenadas": "-35.05,-71.00", "tipo": "Departamento", "activo": True},
+        {"id": 4, "coordenadas": "-36.00,-71.00", "tipo": "Casa", "activo": True},
+        {"id": 5, "coordenadas": "sin dato", "tipo": "Casa", "activo": True},
+    ])
+    cerca = {"lat": -35.02, "lng": -71.0}
+
+    assert indice.consultar({**cerca, "radio_km": 2.5}) == [1, 2]
+    assert indice.consultar({**cerca, "radio_km": 5, "tipo": "casa"}) == [1, 2]
+    assert indice.consultar({**cerca, "orden": "distancia"}) == [2, 1, 3, 4]
+    assert indice.consultar({**cerca, "orden": "distancia"}, limite=2) == [2, 1]
+    assert indice.consultar({**cerca, "orden": "distancia", "tipo": "casa"}, limite=3) == [2, 1, 4]
+    assert indice.contar({**cerca, "orden": "distancia"}) == 4
+    assert indice.consultar({"radio_km": 1}) == [1, 2, 3, 4, 5]
+
+    distancias = indice.distancias_km([1, 4], -35.0, -71.0)
+    assert distancias[1] == 0
+    assert distancias[4] == pytest.approx(111.19, abs=0.01)
+
+
+# Prueba 8: El índice de coordenadas compara la forma normalizada e incluye propiedades inactivas;
+# se mantiene al mover y eliminar.
+def test_indice_de_coordenadas():
+    indice = IndiceCatalogo(ttl=60)
+    indice.cargar([
+        {"id": 1, "coordenadas": "-35.0,-71.2", "activo": True},
+        {"id": 2, "coordenadas": "-35.1,-71.3", "activo": False},
+    ])
+
+    assert indice.ids_con_coordenadas(" -35.000, -71.20 ") == {1}
+    assert indice.ids_con_coordenadas("-35.1,-71.3") == {2}
+    assert indice.ids_con_coordenadas("") == set()
+
+    indice.guardar({"id": 1, "coordenadas": "-34.0,-71.0"})
+    indice.eliminar(2)
+    assert indice.ids_con_coordenadas("-35.0,-71.2") == set()
+    assert indice.ids_con_coordenadas("-35.1,-71.3") == set()
+    assert indice.ids_con_coordenadas("-34,-71") == {1}
+
+
+# Prueba 9: Paginación por cursor (IDs mayores que el cursor, de a 'limite'), con y sin filtros;
+# la lista ordenada de IDs se mantiene al agregar y eliminar. También se filtra por propietario.
+def test_paginacion_por_cursor():
+    indice = IndiceCatalogo(ttl=60)
+    indice.cargar([dict(p, propietario=7 if p["id"] != 2 else 8) for p in reversed(PROPIEDADES)])
+
+    assert indice.consultar_despues_de({}, None, 2) == [1, 2]
+    assert indice.consultar_despues_de({}, 2, 2) == [3]
+    assert indice.consultar_despues_de({}, 3, 2) == []
+    assert indice.consultar_despues_de({"tipo": "casa"}, 1, 5) == [3]
+    assert indice.consultar({"propietario": "7"}) == [1, 3]
+
+    indice.guardar({"id": 10, "nombre": "Nueva", "tipo": "Casa"})
+    indice.eliminar(2)
+    assert indice.consultar_despues_de({}, 1, 5) == [3, 10]
+    assert indice.consultar_despues_de({"tipo": "casa"}, None, 2) == [1, 3]
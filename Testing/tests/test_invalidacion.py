@@ -0,0 +1,152 @@
+import time
+import pytest
+from persistencia import base_datos
+from persistencia.cache import CacheTTL
+from persistencia.indice_catalogo import IndiceCatalogo
+from persistencia.invalidacion import FuenteFalsa, FuenteRealtime, InvalidadorCache
+
+
+@pytest.fixture
+def proceso(monkeypatch):
+    indice = IndiceCatalogo(ttl=60)
+    indice.cargar([{"id": 1, "nombre": "Casa", "propietario": 7}, {"id": 2, "nombre": "Depto", "propietario": 8}])
+    monkeypatch.setattr(base_datos, "_indice_catalogo", indice)
+    monkeypatch.setattr(base_datos, "_cache_propiedades", CacheTTL(60, 100))
+    monkeypatch.setattr(base_datos, "_cache_usuarios", CacheTTL(60, 100))
+    monkeypatch.setattr(base_datos, "_cambios_compartidos", False)
+    fuente = FuenteFalsa()
+    invalidador = InvalidadorCache(fuente, base_datos.aplicar_cambio_externo, lambda: None, intervalo_sondeo=0)
+    invalidador.iniciar()
+    return fuente, indice
+
+
+# Prueba 1: Un cambio de propiedad hecho en otro proceso descarta esa propiedad y las listas del caché
+# (no las demás propiedades), actualiza el índice y queda en el registro de cambios.
+# El eco de una escritura que el índice ya tiene no sube la versión.
+def test_cambio_externo_de_propiedad(proceso):
+    fuente, indice = proceso
+    cache = base_datos._cache_propiedades
+    cache.guardar(("id", 1, "full"), {"id": 1})
+    cache.guardar(("id", 2, "full"), {"id": 2})
+    cache.guardar(("todas", "card"), [{"id": 1}, {"id": 2}])
+    desde = base_datos.version_catalogo()["version"]
+
+    fuente.emitir(base_datos.PROPIEDADES_TABLE, "UPDATE", {"id": 1, "nombre": "Casa Grande", "propietario": 7})
+    fuente.emitir(base_datos.PROPIEDADES_TABLE, "INSERT", {"id": 3, "nombre": "Parcela", "propietario": 7})
+    fuente.emitir(base_datos.PROPIEDADES_TABLE, "DELETE", anterior={"id": 2})
+
+    assert cache.obtener(("id", 1, "full")) == (False, None)
+    assert cache.obtener(("todas", "card")) == (False, None)
+    assert cache.obtener(("id", 2, "full")) == (False, None)
+    assert indice.consultar({"q": "grande"}) == [1]
+    assert indice.consultar({}) == [1, 3]
+    assert base_datos.ids_cambiados_desde(desde)[:2] == ([1, 3], [2])
+
+    version = base_datos.version_catalogo()["version"]
+    fuente.emitir(base_datos.PROPIEDADES_TABLE, "UPDATE", {"id": 1, "nombre": "Casa Grande", "propietario": 7})
+    fuente.emitir(base_datos.PROPIEDADES_TABLE, "DELETE", anterior={"id": 2})
+    assert base_datos.version_catalogo()["version"] == version
+
+
+# Prueba 2: Un cambio de usuario descarta solo sus entradas del caché; si cambió su nombre
+# (el que muestran las listas) marca sus propiedades.
+def test_cambio_externo_de_usuario(proceso):
+    fuente, _ = proceso
+    cache = base_datos._cache_usuarios
+    cache.guardar(("id", 7, "full"), {"id": 7})
+    cache.guardar(("email", "ana@x.cl", "auth"), {"id": 7})
+    cache.guardar(("ids", (7, 8), "owner-name"), [{"id": 7}, {"id": 8}])
+    cache.guardar(("id", 8, "full"), {"id": 8})
+    cache.guardar(("email", "beto@x.cl", "auth"), {"id": 8})
+    desde = base_datos.version_catalogo()["version"]
+
+    fuente.emitir(base_datos.USERS_TABLE, "UPDATE", {"id": 7, "email": "Ana@x.cl", "nombre": "Ana María"},
+                  {"id": 7, "email": "ana@x.cl", "nombre": "Ana"})
+
+    assert cache.obtener(("id", 7, "full")) == (False, None)
+    assert cache.obtener(("email", "ana@x.cl", "auth")) == (False, None)
+    assert cache.obtener(("ids", (7, 8), "owner-name")) == (False, None)
+    assert cache.obtener(("id", 8, "full"))[0]
+    assert cache.obtener(("email", "beto@x.cl", "auth"))[0]
+    assert base_datos.ids_cambiados_desde(desde)[:2] == ([1], [])
+
+    version = base_datos.version_catalogo()["version"]
+    fuente.emitir(base_datos.USERS_TABLE, "UPDATE", {"id": 8, "email": "beto@x.cl"}, {"id": 8})
+    assert cache.obtener(("id", 8, "full")) == (False, None)
+    assert base_datos.version_catalogo()["version"] == version
+
+
+# Prueba 3: Con el canal caído se sondea (y una vez más al reconectarse); conectado, no.
+# Sin tabla de cambios el sondeo recarga el índice, anota y descarta del caché solo las propiedades que cambiaron
+# (el caché de usuarios se mantiene); con tabla de cambios solo la lee, sin recargar el índice.
+def test_sondeo_mientras_el_canal_no_esta_conectado(proceso, monkeypatch):
+    fuente, _ = proceso
+    sondeos = []
+    invalidador = InvalidadorCache(fuente, lambda evento: None, lambda: sondeos.append(1), intervalo_sondeo=0)
+    assert invalidador.revisar() is False
+
+    fuente.conectada = False
+    assert fuente.emitir(base_datos.PROPIEDADES_TABLE, "DELETE", anterior={"id": 1}) is False
+    assert invalidador.revisar() is True
+    assert invalidador.estado()["modo"] == "sondeo"
+    fuente.conectada = True
+    assert invalidador.revisar() is True
+    assert invalidador.revisar() is False
+    assert len(sondeos) == 2
+
+    monkeypatch.setattr(base_datos, "_recargar_indice", lambda: ([], [1]))
+    base_datos._cache_propiedades.guardar(("id", 1, "full"), {"id": 1})
+    base_datos._cache_propiedades.guardar(("id", 2, "full"), {"id": 2})
+    base_datos._cache_usuarios.guardar(("id", 7, "full"), {"id": 7})
+    desde = base_datos.version_catalogo()["version"]
+    assert base_datos.sondear_cambios_externos() == ([], [1])
+    assert base_datos.ids_cambiados_desde(desde)[:2] == ([], [1])
+    assert base_datos._cache_propiedades.obtener(("id", 1, "full")) == (False, None)
+    assert base_datos._cache_propiedades.obtener(("id", 2, "full"))[0]
+    assert base_datos._cache_usuarios.obtener(("id", 7, "full"))[0]
+
+    sincronizaciones = []
+    monkeypatch.setattr(base_datos, "_cambios_compartidos", True)
+    monkeypatch.setattr(base_datos, "sincronizar_cambios", lambda: sincronizaciones.append(1))
+    monkeypatch.setattr(base_datos, "_recargar_indice", lambda: pytest.fail("no debe recargar el índice"))
+    assert base_datos.sondear_cambios_externos() == ([], [])
+    assert sincronizaciones == [1]
+
+
+# Prueba 4: El hilo de sondeo solo corre mientras la fuente está desconectada: se inicia al caerse,
+# hace un último sondeo al reconectarse y termina.
+def test_hilo_de_sondeo_solo_sin_conexion():
+    fuente = FuenteFalsa()
+    invalidador = InvalidadorCache(fuente, lambda evento: None, lambda: None, intervalo_sondeo=0.01)
+    invalidador.iniciar()
+    time.sleep(0.1)
+    assert invalidador.sondeos == 0 and not invalidador._sondeando
+
+    fuente.conectada = False
+    assert _esperar(lambda: invalidador.sondeos >= 2)
+    fuente.conectada = True
+    assert _esperar(lambda: not invalidador._sondeando)
+    sondeos = invalidador.sondeos
+    time.sleep(0.1)
+    assert invalidador.sondeos == sondeos
+    invalidador.detener()
+
+
+def _esperar(condicion, plazo=2.0):
+    limite = time.time() + plazo
+    while time.time() < limite:
+        if condicion():
+            return True
+        time.sleep(0.01)
+    return False
+
+
+# Prueba 5: Los payloads de Supabase Realtime se traducen al formato de evento del módulo.
+def test_payload_realtime_a_evento():
+    eventos = []
+    fuente = FuenteRealtime("https://proyecto.supabase.co", "clave", ["propiedades"])
+    fuente._receptor = eventos.append
+    fuente._al_cambiar({"data": {"table": "propiedades", "type": "DELETE", "record": {}, "old_record": {"id": 4}}})
+
+    assert eventos == [{"tabla": "propiedades", "tipo": "DELETE", "nuevo": None, "anterior": {"id": 4}}]
+    assert fuente.conectada is False
@@ -0,0 +1,99 @@
+import pytest
+from persistencia import base_datos
+from persistencia.indice_catalogo import IndiceCatalogo
+from servicios import propiedad_service
+
+PROPIEDADES = [
+    {"id": 1, "nombre": "Casa en Curicó", "tipo": "Casa", "estado": "venta", "precio": 90000000,
+     "activo": True, "coordenadas": "-34.985,-71.239", "propietario": 7},
+    {"id": 2, "nombre": "Depto en Curicó", "tipo": "Departamento", "estado": "arriendo", "precio": 450000,
+     "activo": True, "coordenadas": "-34.980,-71.230", "propietario": 7},
+    {"id": 3, "nombre": "Casa en Talca", "tipo": "Casa", "estado": "venta", "precio": 70000000,
+     "activo": True, "coordenadas": "-35.426,-71.655", "propietario": 8},
+]
+
+
+@pytest.fixture
+def indice(monkeypatch):
+    indice = IndiceCatalogo(ttl=60)
+    indice.cargar(PROPIEDADES)
+    monkeypatch.setattr(base_datos, "_obtener_indice", lambda: indice)
+    monkeypatch.setattr(base_datos, "adjuntar_nombre_propietario", _adjuntar_nombre_falso)
+    return indice
+
+
+def _adjuntar_nombre_falso(marcadores):
+    for marcador in marcadores:
+        marcador["propietario_nombre"] = f"Dueño {marcador['propietario']}"
+    return marcadores
+
+
+# Prueba 1: El endpoint retorna solo los marcadores de la vista, con los filtros del catálogo aplicados.
+def test_mapa_retorna_marcadores_de_la_vista(client, indice):
+    response = client.get('/api/propiedades/mapa?bbox=-35.0,-71.3,-34.9,-71.2&zoom=16')
+    assert response.status_code == 200
+    datos = response.get_json()
+    assert [m["id"] for m in datos["marcadores"]] == [1, 2]
+    assert datos["marcadores"][0]["lat"] == -34.985
+    assert datos["marcadores"][0]["propietario_nombre"] == "Dueño 7"
+    assert datos["total"] == 2 and datos["truncado"] is False and datos["zoom"] == 16
+
+    response = client.get('/api/propiedades/mapa?bbox=-35.0,-71.3,-34.9,-71.2&estado=venta')
+    assert [m["id"] for m in response.get_json()["marcadores"]] == [1]
+
+
+# Prueba 2: Si hay más marcadores que el máximo, se cortan y se marca 'truncado'.
+def test_mapa_trunca_marcadores(client, indice, monkeypatch):
+    monkeypatch.setattr(propiedad_service, "MAX_MARCADORES_MAPA", 1)
+
+    datos = client.get('/api/propiedades/mapa?bbox=-36,-72,-34,-71').get_json()
+    assert [m["id"] for m in datos["marcadores"]] == [1]
+    assert datos["total"] == 3 and datos["truncado"] is True
+
+
+# Prueba 3: Con zoom alejado las propiedades cercanas llegan como un cluster (cantidad, centroide,
+# precio mínimo/máximo) y las que quedan solas como marcadores; con filtros se agrupa solo lo que cumple.
+def test_mapa_agrupa_en_clusters_con_zoom_alejado(client, indice):
+    datos = client.get('/api/propiedades/mapa?bbox=-36,-72,-34,-71&zoom=8').get_json()
+    assert datos["clusters"] == [{
+        "cantidad": 2, "lat": pytest.approx(-34.9825), "lng": pytest.approx(-71.2345),
+        "precio_min": 450000, "precio_max": 90000000,
+    }]
+    assert [m["id"] for m in datos["marcadores"]] == [3]
+    assert datos["total"] == 3
+
+    datos = client.get('/api/propiedades/mapa?bbox=-36,-72,-34,-71&zoom=8&estado=venta').get_json()
+    assert datos["clusters"] == []
+    assert [m["id"] for m in datos["marcadores"]] == [1, 3]
+
+
+# Prueba 4: 'bbox' y 'zoom' inválidos retornan 400.
+@pytest.mark.parametrize("consulta", [
+    "",
+    "bbox=1,2,3",
+    "bbox=a,b,c,d",
+    "bbox=-34,-71,-35,-70",
+    "bbox=-35,-71,-34,-70&zoom=30",
+    "bbox=-35,-71,-34,-70&zoom=lejos",
+])
+def test_mapa_parametros_invalidos(client, indice, consulta):
+    response = client.get(f'/api/propiedades/mapa?{consulta}')
+    assert response.status_code == 400
+    assert "error" in response.get_json()
+
+
+# Prueba 5: La API JSON acepta lat/lng/radio_km/orden=distancia y cada propiedad trae 'distancia_km'.
+def test_api_propiedades_por_distancia(client, indice, monkeypatch):
+    monkeypatch.setattr(
+        base_datos, "_obtener_propiedades_en_orden",
+        lambda ids, columnas: [{"id": i, "propietario": 7} for i in ids]
+    )
+    base_datos._cache_propiedades.invalidar()
+
+    response = client.get('/api/propiedades?lat=-35.43&lng=-71.66&orden=distancia&radio_km=100')
+    assert response.status_code == 200
+    datos = response.get_json()
+    propiedades = datos["propiedades"]
+    assert [p["id"] for p in propiedades] == [3, 1, 2]
+    assert datos["next_cursor"] is None
+    assert propiedades[0]["distancia_km"] < 1 < propiedades[1]["distancia_km"] < 100
@@ -0,0 +1,91 @@
+import json
+import httpx
+import pytest
+from persistencia import base_datos
+from persistencia.cache import CacheTTL
+from persistencia.indice_catalogo import IndiceCatalogo
+
+PROPIEDADES = [
+    {"id": 1, "nombre": "Casa", "precio": 1000, "activo": True, "propietario": 7},
+    {"id": 2, "nombre": "Depto", "precio": 2000, "activo": True, "propietario": 7},
+]
+
+
+@pytest.fixture
+def supabase(monkeypatch, tmp_path):
+    estado = {"caido": False}
+
+    def sin_respuesta():
+        raise httpx.ConnectTimeout("Supabase no respondió")
+
+    def recargar_indice_falso():
+        if estado["caido"]:
+            sin_respuesta()
+        return base_datos._indice_catalogo.cargar(PROPIEDADES)
+
+    def obtener_en_orden_falso(ids, columnas):
+        if estado["caido"]:
+            sin_respuesta()
+        por_id = {p["id"]: p for p in PROPIEDADES}
+        return [{c: por_id[i].get(c) for c in columnas.split(",")} for i in ids]
+
+    archivo_propiedades = tmp_path / "propiedades.json"
+    archivo_propiedades.write_text(json.dumps([{"id": 9, "nombre": "Casa Local", "activo": True, "propietario": 7}]))
+    archivo_usuarios = tmp_path / "users.json"
+    archivo_usuarios.write_text(json.dumps([{"id": 7, "nombre": "Ana", "apellido": "Soto", "password": "hash"}]))
+
+    monkeypatch.setattr(base_datos, "_get_client", sin_respuesta)
+    monkeypatch.setattr(base_datos, "_get_client_lectura", sin_respuesta)
+    monkeypatch.setattr(base_datos, "_recargar_indice", recargar_indice_falso)
+    monkeypatch.setattr(base_datos, "_obtener_propiedades_en_orden", obtener_en_orden_falso)
+    monkeypatch.setattr(base_datos, "_indice_catalogo", IndiceCatalogo(ttl=60))
+    monkeypatch.setattr(base_datos, "_indice_degradado", None)
+    for nombre in ("_cache_propiedades", "_cache_usuarios"):
+        monkeypatch.setattr(base_datos, nombre, CacheTTL(60, 100, errores_upstream=base_datos.ERRORES_UPSTREAM))
+    monkeypatch.setattr(base_datos, "PROPIEDADES_JSON", archivo_propiedades)
+    monkeypatch.setattr(base_datos, "USERS_JSON", archivo_usuarios)
+    monkeypatch.setattr(base_datos, "_datos_locales", {})
+    monkeypatch.setattr(base_datos, "_catalogo_local", None)
+    return estado
+
+
+# Prueba 1: Si Supabase deja de responder después de haber cargado el catálogo, la API responde con
+# la última copia buena (índice anterior incluido), con 'X-Modo-Degradado: cache' y sin ETag ni caché público.
+# El índice no se vuelve a pedir en cada consulta; cuando Supabase vuelve, las respuestas dejan de ser degradadas.
+def test_api_responde_con_la_ultima_copia_si_supabase_no_responde(client, supabase):
+    response = client.get('/api/propiedades?fields=id,nombre')
+    assert response.status_code == 200
+    assert "X-Modo-Degradado" not in response.headers
+    assert "ETag" in response.headers
+
+    supabase["caido"] = True
+    base_datos._cache_propiedades.invalidar()
+    base_datos._indice_catalogo.invalidar()
+    response = client.get('/api/propiedades?fields=id,nombre')
+    assert response.status_code == 200
+    assert [p["nombre"] for p in response.get_json()["propiedades"]] == ["Casa", "Depto"]
+    assert response.headers["X-Modo-Degradado"] == "cache"
+    assert "ETag" not in response.headers
+    assert "no-store" in response.headers["Cache-Control"]
+    assert not base_datos._indice_catalogo.vencido()
+
+    supabase["caido"] = False
+    base_datos._indice_catalogo.invalidar()
+    response = client.get('/api/propiedades?fields=id,nombre')
+    assert "X-Modo-Degradado" not in response.headers
+
+
+# Prueba 2: Sin ninguna copia previa, el catálogo y los nombres de los dueños salen de datos/*.json
+# (solo con las columnas pedidas) en vez de un 504. Las validaciones de dueño (escrituras) no usan el respaldo.
+def test_sin_copia_previa_se_usan_los_archivos_locales(client, supabase):
+    supabase["caido"] = True
+    response = client.get('/api/propiedades')
+    assert response.status_code == 200
+    assert response.headers["X-Modo-Degradado"] == "archivo"
+    propiedad = response.get_json()["propiedades"][0]
+    assert (propiedad["id"], propiedad["nombre"], propiedad["propietario_nombre"]) == (9, "Casa Local", "Ana Soto")
+
+    assert base_datos.obtener_propiedad_por_id(9, perfil="card", obsoleto=True)["nombre"] == "Casa Local"
+    with pytest.raises(httpx.ConnectTimeout):
+        base_datos.obtener_propiedad_por_id(9, perfil="owner")
+    assert base_datos.obtener_usuarios_por_ids([7]) == {7: {"id": 7, "nombre": "Ana", "apellido": "Soto"}}
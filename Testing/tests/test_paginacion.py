@@ -0,0 +1,82 @@
+import pytest
+from persistencia import base_datos
+from persistencia.indice_catalogo import IndiceCatalogo
+
+PROPIEDADES = [
+    {"id": i, "nombre": f"Casa {i}", "tipo": "Casa" if i % 2 else "Departamento", "precio": i * 1000,
+     "activo": True, "coordenadas": f"-35.{i:02d},-71.0", "propietario": 7 if i < 4 else 8}
+    for i in range(1, 6)
+]
+
+
+@pytest.fixture
+def catalogo(monkeypatch):
+    indice = IndiceCatalogo(ttl=60)
+    indice.cargar(PROPIEDADES)
+    pedidas = []
+
+    def obtener_en_orden_falso(ids, columnas):
+        pedidas.append((list(ids), columnas))
+        por_id = {p["id"]: p for p in PROPIEDADES}
+        return [{c: por_id[i].get(c) for c in columnas.split(",")} for i in ids]
+
+    def adjuntar_nombre_falso(propiedades):
+        for propiedad in propiedades:
+            propiedad["propietario_nombre"] = f"Dueño {propiedad['propietario']}"
+        return propiedades
+
+    monkeypatch.setattr(base_datos, "_obtener_indice", lambda: indice)
+    monkeypatch.setattr(base_datos, "_obtener_propiedades_en_orden", obtener_en_orden_falso)
+    monkeypatch.setattr(base_datos, "adjuntar_nombre_propietario", adjuntar_nombre_falso)
+    base_datos._cache_propiedades.invalidar()
+    yield pedidas
+    base_datos._cache_propiedades.invalidar()
+
+
+# Prueba 1: Se recorre el catálogo con limit/cursor hasta que 'next_cursor' es null;
+# 'total' cuenta todas las que cumplen los filtros y solo se piden a Supabase las filas de cada página.
+def test_api_recorre_paginas_con_cursor(client, catalogo):
+    datos = client.get('/api/propiedades?limit=2').get_json()
+    assert [p["id"] for p in datos["propiedades"]] == [1, 2]
+    assert datos["total"] == 5 and datos["limit"] == 2 and datos["next_cursor"] == "2"
+    assert datos["propiedades"][0]["propietario_nombre"] == "Dueño 7"
+
+    datos = client.get('/api/propiedades?limit=2&cursor=4').get_json()
+    assert [p["id"] for p in datos["propiedades"]] == [5]
+    assert datos["next_cursor"] is None
+
+    datos = client.get('/api/propiedades?limit=2&tipo=casa&propietario=7').get_json()
+    assert [p["id"] for p in datos["propiedades"]] == [1, 3]
+    assert datos["total"] == 2 and datos["next_cursor"] is None
+    assert [ids for ids, _ in catalogo] == [[1, 2], [5], [1, 3]]
+
+
+# Prueba 2: Sin 'limit' se retorna una página acotada; 'fields' pide solo esas columnas;
+# limit=0 retorna solo el total sin consultar filas.
+def test_api_pagina_por_defecto_y_campos(client, catalogo, monkeypatch):
+    monkeypatch.setattr("servicios.propiedad_service.LIMITE_PAGINA_API", 3)
+
+    datos = client.get('/api/propiedades').get_json()
+    assert len(datos["propiedades"]) == 3 and datos["next_cursor"] == "3"
+
+    datos = client.get('/api/propiedades?fields=nombre,propietario_nombre&limit=1').get_json()
+    assert datos["propiedades"] == [{"id": 1, "nombre": "Casa 1", "propietario_nombre": "Dueño 7"}]
+    assert catalogo[-1][1] == "id,nombre,propietario"
+
+    pedidas = len(catalogo)
+    assert client.get('/api/propiedades?limit=0').get_json() == {
+        "propiedades": [], "total": 5, "limit": 0, "next_cursor": None,
+        "version": base_datos.version_catalogo()["version"]
+    }
+    assert client.get('/api/propiedades?limit=100000').get_json()["limit"] == 200
+    assert len(catalogo) == pedidas + 1
+
+
+# Prueba 3: Parámetros inválidos retornan 400.
+@pytest.mark.parametrize("consulta", [
+    "limit=-1", "limit=abc", "cursor=x", "fields=img", "cursor=2&orden=distancia&lat=-35&lng=-71",
+])
+def test_api_parametros_invalidos(client, catalogo, consulta):
+    response = client.get(f'/api/propiedades?{consulta}')
+    assert response.status_code == 400
+    assert "error" in response.get_json()
@@ -0,0 +1,71 @@
+import pytest
+from servicios import propiedad_service
+
+
+# Prueba 1: Los filtros se normalizan antes de enviarse a la consulta en Supabase
+# y solo se pide el rango de filas de la página solicitada.
+def test_leer_propiedades_pide_solo_la_pagina(monkeypatch):
+    llamadas = []
+
+    def consultar_falso(filtros, inicio=None, fin=None, perfil="full", con_propietario=False):
+        llamadas.append((filtros, inicio, fin))
+        return {"propiedades": [{"id": 10}, {"id": 11}], "total": 20}
+
+    monkeypatch.setattr(propiedad_service, "consultar_propiedades", consultar_falso)
+
+    filtros = {"q": "  Curicó ", "tipo": "Casa", "min_precio": "abc", "max_precio": "5000"}
+    resultado = propiedad_service.leer_propiedades(filtros=filtros, pagina=2, por_pagina=9)
+
+    assert llamadas == [(
+        {
+            "q": "curicó", "tipo": "casa", "estado": "", "propietario": "", "min_precio": 0, "max_precio": 5000,
+            "min_dormitorios": 0, "max_dormitorios": 0, "min_baños": 0, "max_baños": 0,
+            "min_area": 0, "max_area": 0, "lat": None, "lng": None, "radio_km": 0, "orden": "",
+        },
+        9,
+        17,
+    )]
+    assert resultado == {
+        "propiedades": [{"id": 10}, {"id": 11}],
+        "total": 20,
+        "paginas": 3,
+        "actual": 2,
+    }
+
+
+# Prueba 2: Si la página pedida no existe, se vuelve a consultar la última página válida.
+def test_leer_propiedades_ajusta_pagina_fuera_de_rango(monkeypatch):
+    rangos = []
+
+    def consultar_falso(filtros, inicio=None, fin=None, perfil="full", con_propietario=False):
+        rangos.append((inicio, fin))
+        return {"propiedades": [], "total": 10}
+
+    monkeypatch.setattr(propiedad_service, "consultar_propiedades", consultar_falso)
+
+    resultado = propiedad_service.leer_propiedades(filtros={}, pagina=7, por_pagina=9)
+
+    assert rangos == [(54, 62), (9, 17)]
+    assert resultado["actual"] == 2
+    assert resultado["paginas"] == 2
+
+
+# Prueba 3: La unicidad de 'coordenadas' se consulta al índice (excluyendo la propiedad que se edita)
+# y solo cuando el payload trae coordenadas.
+def test_unicidad_de_coordenadas(monkeypatch):
+    consultas = []
+
+    def en_uso_falso(coordenadas, excluir_id=None):
+        consultas.append((coordenadas, excluir_id))
+        return coordenadas == "-35.0,-71.0"
+
+    monkeypatch.setattr(propiedad_service, "coordenadas_en_uso", en_uso_falso)
+    validar = propiedad_service._validar_y_normalizar_propiedad
+
+    assert validar({"nombre": "Casa"}, parcial=True, propiedad_actual={"id": 4}) == {"nombre": "Casa"}
+    assert validar({"coordenadas": " -34.9,-71.2 "}, parcial=True, propiedad_actual={"id": 4}) == {
+        "coordenadas": "-34.9,-71.2"
+    }
+    with pytest.raises(ValueError, match="Las coordenadas ya existen en otra propiedad."):
+        validar({"coordenadas": "-35.0,-71.0"}, parcial=True, propiedad_actual={"id": 4})
+    assert consultas == [("-34.9,-71.2", 4), ("-35.0,-71.0", 4)]
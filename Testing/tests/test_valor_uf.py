@@ -0,0 +1,112 @@
+import json
+import threading
+from datetime import datetime
+from utils.valor_uf import ProveedorUF
+
+
+# Fuente local falsa: retorna los valores indicados en orden, o lanza la excepción si es una.
+class _FuenteFalsa:
+    def __init__(self, *respuestas):
+        self.respuestas = list(respuestas)
+        self.llamadas = 0
+
+    def __call__(self):
+        self.llamadas += 1
+        respuesta = self.respuestas.pop(0)
+        if isinstance(respuesta, Exception):
+            raise respuesta
+        return respuesta
+
+
+def _proveedor(fuente, ruta, ahora, tareas):
+    return ProveedorUF(fuente, ruta_cache=ruta, reloj=lambda: ahora, ejecutar=tareas.append)
+
+
+# Prueba 1: El valor se guarda por día: la segunda lectura no vuelve a llamar a la fuente
+# y el último valor bueno queda persistido en disco.
+def test_uf_cache_diario_y_persistencia(tmp_path):
+    ruta = tmp_path / "valor_uf.json"
+    fuente = _FuenteFalsa(39000.5)
+    tareas = []
+    proveedor = _proveedor(fuente, ruta, datetime(2026, 10, 18, 10, 0), tareas)
+
+    assert proveedor.valor() == 39000.5
+    assert proveedor.valor() == 39000.5
+    assert fuente.llamadas == 1
+    assert tareas == []
+    assert json.loads(ruta.read_text()) == {"valor": 39000.5, "fecha": "2026-10-18"}
+
+
+# Prueba 2: Al reiniciar se usa el valor del disco sin bloquear; si es de ayer se refresca
+# en segundo plano, y si la fuente está caída se sigue sirviendo el valor anterior.
+def test_uf_reinicio_y_caida_de_la_fuente(tmp_path):
+    ruta = tmp_path / "valor_uf.json"
+    ruta.write_text(json.dumps({"valor": 38000.0, "fecha": "2026-10-17"}))
+    fuente = _FuenteFalsa(RuntimeError("mindicador caído"))
+    tareas = []
+    proveedor = _proveedor(fuente, ruta, datetime(2026, 10, 18, 10, 0), tareas)
+
+    assert proveedor.valor() == 38000.0
+    assert fuente.llamadas == 0
+    assert len(tareas) == 1
+
+    tareas.pop()()
+    assert proveedor.valor() == 38000.0
+    # Tras un fallo no se reintenta de inmediato
+    assert tareas == []
+
+
+# Prueba 3: Cerca de medianoche se refresca en segundo plano antes de que el valor expire.
+def test_uf_refresco_anticipado(tmp_path):
+    fuente = _FuenteFalsa(39000.0, 39010.0)
+    tareas = []
+    ahora = datetime(2026, 10, 18, 23, 30)
+    proveedor = _proveedor(fuente, tmp_path / "valor_uf.json", ahora, tareas)
+
+    assert proveedor.valor() == 39000.0
+    assert len(tareas) == 0
+    # Simula que el valor se obtuvo hace rato (fuera de la ventana de espera)
+    proveedor._ultimo_refresco = None
+    assert proveedor.valor() == 39000.0
+    assert len(tareas) == 1
+    tareas.pop()()
+    assert proveedor.valor() == 39010.0
+    # Ya refrescado: no se vuelve a refrescar en cada petición hasta medianoche
+    assert tareas == []
+
+
+# Prueba 4: En un arranque en frío (sin disco) con varias peticiones a la vez, solo una
+# consulta la fuente y las demás esperan su resultado en vez de llamar cada una a la API.
+def test_uf_primera_carga_una_sola_consulta(tmp_path):
+    liberar = threading.Event()
+    fuente = _FuenteFalsa(39000.0)
+
+    def fuente_lenta():
+        liberar.wait(5)
+        return fuente()
+
+    proveedor = _proveedor(fuente_lenta, tmp_path / "valor_uf.json", datetime(2026, 10, 18, 10, 0), [])
+    resultados = []
+    hilos = [threading.Thread(target=lambda: resultados.append(proveedor.valor())) for _ in range(5)]
+    for hilo in hilos:
+        hilo.start()
+    # Espera a que la primera petición esté consultando antes de liberar la fuente
+    while not proveedor._refrescando:
+        pass
+    liberar.set()
+    for hilo in hilos:
+        hilo.join(5)
+
+    assert fuente.llamadas == 1
+    assert resultados == [39000.0] * 5
+
+
+# Prueba 5: Si la primera carga falla, las peticiones que esperaban reciben el respaldo
+# y no se reintenta hasta que pase 'espera_reintento'.
+def test_uf_primera_carga_fallida_usa_respaldo(tmp_path):
+    fuente = _FuenteFalsa(RuntimeError("mindicador caído"))
+    proveedor = _proveedor(fuente, tmp_path / "valor_uf.json", datetime(2026, 10, 18, 10, 0), [])
+
+    assert proveedor.valor() == proveedor.respaldo
+    assert proveedor.valor() == proveedor.respaldo
+    assert fuente.llamadas == 1
@@ -0,0 +1,46 @@
+import hashlib
+from datetime import datetime, timezone
+from flask import request, make_response
+from persistencia.base_datos import version_catalogo
+from persistencia.cache import modo_degradado
+
+
+# Funcionamiento: Arma una respuesta pública del catálogo con GET condicional (ETag).
+# 'generar' es la función que arma la respuesta.
+# 'extras' son otros datos de los que depende la respuesta además del catálogo y la URL (ej. el valor UF).
+# Con la versión compartida del catálogo (tabla de cambios, igual en todos los procesos y solo sube cuando
+# cambian los datos): ETag = hash(versión, ruta con sus parámetros, extras) y Last-Modified = última escritura;
+# si el cliente envía un If-None-Match vigente, retorna 304 sin generar nada.
+# Sin ella, cada proceso lleva su propia versión: el ETag es el hash del contenido generado (igual en todos
+# los procesos mientras los datos no cambien) y el 304 solo ahorra el envío.
+# Las respuestas 200 salen con 'Cache-Control: public, no-cache' (se guardan, pero se revalidan siempre);
+# los errores y las respuestas degradadas (datos antiguos porque Supabase no respondió) quedan con el
+# 'no-store' que pone app.harden_cache_headers: no llevan ETag.
+def respuesta_catalogo(generar, *extras):
+    version = version_catalogo()
+    etag = None
+    if version["compartida"]:
+        partes = [version["version"], request.full_path, *(str(extra) for extra in extras)]
+        etag = _huella("|".join(partes).encode("utf-8"))
+
+    if etag is not None and request.if_none_match.contains_weak(etag):
+        response = make_response("", 304)
+    else:
+        response = make_response(generar())
+        if response.status_code != 200 or modo_degradado():
+            return response
+        if etag is None:
+            etag = _huella(response.get_data())
+            if request.if_none_match.contains_weak(etag):
+                response = make_response("", 304)
+
+    response.set_etag(etag, weak=True)
+    if version["compartida"]:
+        response.last_modified = datetime.fromtimestamp(version["modificado"], tz=timezone.utc)
+    response.cache_control.public = True
+    response.cache_control.no_cache = True
+    return response
+
+
+def _huella(datos):
+    return hashlib.sha256(datos).hexdigest()[:32]
@@ -0,0 +1,131 @@
+import gzip
+import hashlib
+import mimetypes
+import os
+import threading
+from typing import Dict, Optional, Tuple
+from flask import Response, current_app, request
+from werkzeug.security import safe_join
+
+# ARCHIVOS ESTÁTICOS CON HUELLA (fingerprint)
+#
+# Cada archivo de static/ tiene una huella (primeros caracteres del SHA-256 de su contenido) que
+# se agrega a su URL: url_for('static', filename='css/x.css') -> /static/css/x.css?v=<huella>.
+# Como la URL cambia cuando cambia el contenido, esas respuestas se pueden guardar en el navegador
+# por un año sin volver a preguntar (immutable). Los textos (CSS/JS/SVG...) se comprimen con gzip
+# una sola vez y se entregan así a los navegadores que lo aceptan.
+
+UN_ANO = 31536000
+LARGO_HUELLA = 12
+EXTENSIONES_COMPRIMIBLES = {".css", ".js", ".mjs", ".svg", ".json", ".map", ".txt"}
+
+
+class ManifiestoEstaticos:
+    # Funcionamiento: 'carpeta' = carpeta de archivos estáticos (app.static_folder).
+    # Guarda por archivo (firma, huella, bytes_gzip); la firma (mtime, tamaño) permite notar si el archivo
+    # cambió en disco (ej. en desarrollo) y recalcular solo ese.
+    def __init__(self, carpeta: str):
+        self.carpeta = carpeta
+        self._entradas: Dict[str, Tuple[Tuple[int, int], str, Optional[bytes]]] = {}
+        self._lock = threading.Lock()
+
+    # Funcionamiento: Calcula la huella (y el gzip) de todos los archivos de la carpeta.
+    # Retorna el manifiesto {ruta relativa: huella}.
+    def precargar(self) -> Dict[str, str]:
+        manifiesto = {}
+        for raiz, _, archivos in os.walk(self.carpeta):
+            for nombre in archivos:
+                relativa = os.path.relpath(os.path.join(raiz, nombre), self.carpeta).replace(os.sep, "/")
+                huella = self.huella(relativa)
+                if huella:
+                    manifiesto[relativa] = huella
+        return manifiesto
+
+    # Funcionamiento: Retorna la huella del archivo 'archivo' (ruta relativa a la carpeta),
+    # o None si no existe (o si la ruta intenta salir de la carpeta).
+    def huella(self, archivo: str) -> Optional[str]:
+        entrada = self._entrada(archivo)
+        return entrada[1] if entrada else None
+
+    # Funcionamiento: Retorna el contenido comprimido con gzip, o None si el tipo de archivo
+    # no se comprime (imágenes ya comprimidas) o si comprimido no queda más chico.
+    def gzip(self, archivo: str) -> Optional[bytes]:
+        entrada = self._entrada(archivo)
+        return entrada[2] if entrada else None
+
+    def _entrada(self, archivo: str) -> Optional[Tuple[Tuple[int, int], str, Optional[bytes]]]:
+        ruta = safe_join(self.carpeta, archivo)
+        if ruta is None:
+            return None
+        try:
+            estado = os.stat(ruta)
+        except OSError:
+            return None
+        firma = (estado.st_mtime_ns, estado.st_size)
+        with self._lock:
+            entrada = self._entradas.get(archivo)
+        if entrada is not None and entrada[0] == firma:
+            return entrada
+
+        with open(ruta, "rb") as f:
+            datos = f.read()
+        huella = hashlib.sha256(datos).hexdigest()[:LARGO_HUELLA]
+        comprimido = None
+        if os.path.splitext(archivo)[1].lower() in EXTENSIONES_COMPRIMIBLES:
+            # mtime=0: el mismo contenido produce siempre los mismos bytes comprimidos
+            comprimido = gzip.compress(datos, compresslevel=9, mtime=0)
+            if len(comprimido) >= len(datos):
+                comprimido = None
+        entrada = (firma, huella, comprimido)
+        with self._lock:
+            self._entradas[archivo] = entrada
+        return entrada
+
+
+# Funcionamiento: Reemplaza la vista de /static/<filename> de Flask.
+# Si el navegador acepta gzip y hay versión comprimida, entrega esa (Content-Encoding: gzip).
+# Si la URL trae la huella vigente (?v=...), la respuesta se guarda un año sin revalidar (immutable);
+# sin huella (o con una antigua) se puede guardar, pero se revalida con ETag (304).
+def servir_estatico(filename):
+    manifiesto = current_app.extensions["estaticos"]
+    huella = manifiesto.huella(filename)
+    if huella is None:
+        return current_app.send_static_file(filename)
+
+    comprimido = manifiesto.gzip(filename) if "gzip" in request.accept_encodings else None
+    if comprimido is not None:
+        response = Response(comprimido, mimetype=mimetypes.guess_type(filename)[0] or "application/octet-stream")
+        response.headers["Content-Encoding"] = "gzip"
+        response.set_etag(f"{huella}-gz")
+        response.make_conditional(request)
+    else:
+        response = current_app.send_static_file(filename)
+    if os.path.splitext(filename)[1].lower() in EXTENSIONES_COMPRIMIBLES:
+        response.vary.add("Accept-Encoding")
+
+    response.cache_control.public = True
+    if request.args.get("v") == huella:
+        response.cache_control.max_age = UN_ANO
+        response.cache_control.immutable = True
+    else:
+        response.cache_control.no_cache = True
+    return response
+
+
+# Funcionamiento: Activa las URLs con huella en la 'app':
+# crea el manifiesto (calculando todas las huellas al iniciar), reemplaza la vista 'static'
+# y hace que todo url_for('static', filename=...) (plantillas incluidas) agregue '?v=<huella>'.
+def registrar_estaticos(app) -> ManifiestoEstaticos:
+    manifiesto = ManifiestoEstaticos(app.static_folder)
+    manifiesto.precargar()
+    app.extensions["estaticos"] = manifiesto
+    app.view_functions["static"] = servir_estatico
+
+    @app.url_defaults
+    def agregar_huella_estatico(endpoint, values):
+        if endpoint == "static" and "filename" in values and "v" not in values:
+            huella = manifiesto.huella(values["filename"])
+            if huella:
+                values["v"] = huella
+
+    return manifiesto
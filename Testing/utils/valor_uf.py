@@ -0,0 +1,202 @@
+import json
+import os
+import threading
+import time
+from datetime import datetime, timedelta
+from pathlib import Path
+import httpx
+
+# Proveedor del valor de la UF con caché diario.
+# La UF cambia una vez al día, así que el valor se guarda en memoria (y en disco) hasta medianoche.
+# Antes de que expire se refresca en segundo plano; si mindicador.cl no responde se sigue usando
+# el último valor bueno. Solo se bloquea cuando no existe ningún valor previo, y en ese caso una única
+# petición consulta la fuente mientras las demás esperan su resultado.
+
+URL_MINDICADOR_UF = 'https://mindicador.cl/api/uf'
+VALOR_UF_RESPALDO = 37500.0
+RUTA_CACHE_UF = Path(os.environ.get(
+    'UF_CACHE_PATH', Path(__file__).resolve().parents[1] / 'datos' / 'valor_uf.json'
+))
+
+
+# Funcionamiento: Fuente por defecto del valor UF (API de Mindicador.cl).
+# Reutiliza un único cliente httpx (pool de conexiones) en vez de abrir una conexión por petición.
+# Retorna el valor como float; lanza una excepción si la API falla.
+class FuenteMindicador:
+    def __init__(self, url=URL_MINDICADOR_UF, timeout=5.0):
+        self.url = url
+        self._cliente = httpx.Client(timeout=timeout)
+
+    def __call__(self):
+        r = self._cliente.get(self.url)
+        r.raise_for_status()
+        return float(r.json()['serie'][0]['valor'])
+
+
+# Funcionamiento: Función interna (helper).
+# Lanza 'tarea' en un hilo daemon (para que no impida cerrar el servidor).
+def _en_hilo(tarea):
+    threading.Thread(target=tarea, name='refresco-uf', daemon=True).start()
+
+
+class ProveedorUF:
+    # Funcionamiento: Recibe la 'fuente' (cualquier función sin argumentos que retorne el valor),
+    # la ruta del archivo donde se persiste el último valor bueno y cuánto antes de medianoche
+    # se empieza a refrescar. 'espera_primera_carga' es lo máximo que una petición espera a otra que
+    # ya está consultando la fuente. 'reloj' y 'ejecutar' se pueden reemplazar en las pruebas.
+    def __init__(self, fuente, ruta_cache=RUTA_CACHE_UF, respaldo=VALOR_UF_RESPALDO,
+                 margen_refresco=timedelta(hours=1), espera_reintento=300.0,
+                 espera_primera_carga=10.0, reloj=datetime.now, ejecutar=_en_hilo):
+        self.fuente = fuente
+        self.ruta_cache = Path(ruta_cache) if ruta_cache else None
+        self.respaldo = respaldo
+        self.margen_refresco = margen_refresco
+        self.espera_reintento = espera_reintento
+        self.espera_primera_carga = espera_primera_carga
+        self.reloj = reloj
+        self.ejecutar = ejecutar
+        self._lock = threading.Lock()
+        self._listo = threading.Condition(self._lock)
+        self._valor = None
+        self._fecha = None
+        self._refrescando = False
+        self._ultimo_fallo = None
+        self._ultimo_refresco = None
+        self._cargado_de_disco = False
+
+    # Funcionamiento: Retorna el valor UF a usar en esta petición.
+    # 1. Si no hay valor en memoria, intenta leer el último guardado en disco.
+    # 2. Si tampoco existe, consulta la fuente de forma bloqueante (ver _primera_carga).
+    # 3. Si el valor es de otro día o se acerca la medianoche, lanza un refresco en segundo plano
+    #    y mientras tanto responde con el valor que ya tiene.
+    def valor(self):
+        with self._lock:
+            if not self._cargado_de_disco:
+                self._cargado_de_disco = True
+                self._leer_disco()
+            valor_actual = self._valor
+
+        if valor_actual is None:
+            return self._primera_carga()
+
+        if self._debe_refrescar():
+            self._lanzar_refresco()
+        return valor_actual
+
+    # Funcionamiento: Consulta bloqueante cuando no hay ningún valor (ni en memoria ni en disco).
+    # Solo una petición llama a la fuente; las que llegan mientras tanto esperan su resultado
+    # (a lo más 'espera_primera_carga' segundos) y, si no lo hay, responden con el respaldo.
+    # Tras un fallo reciente se responde con el respaldo sin volver a consultar.
+    def _primera_carga(self):
+        with self._lock:
+            if self._valor is not None:
+                return self._valor
+            if self._refrescando:
+                self._listo.wait_for(lambda: not self._refrescando, timeout=self.espera_primera_carga)
+                return self._valor if self._valor is not None else self.respaldo
+            if self._ultimo_fallo is not None and time.monotonic() - self._ultimo_fallo < self.espera_reintento:
+                return self.respaldo
+            self._refrescando = True
+        return self._refrescar() or self.respaldo
+
+    # Funcionamiento: Indica si el valor en memoria expiró (es de otro día)
+    # o si falta menos de 'margen_refresco' para la medianoche (en ese caso, a lo más
+    # un refresco cada 'espera_reintento' segundos).
+    def _debe_refrescar(self):
+        ahora = self.reloj()
+        if self._fecha != ahora.date():
+            return True
+        medianoche = datetime.combine(ahora.date() + timedelta(days=1), datetime.min.time())
+        if medianoche - ahora.replace(tzinfo=None) > self.margen_refresco:
+            return False
+        with self._lock:
+            ultimo = self._ultimo_refresco
+        return ultimo is None or time.monotonic() - ultimo >= self.espera_reintento
+
+    # Funcionamiento: Lanza un único refresco en segundo plano a la vez.
+    # Después de un fallo espera 'espera_reintento' segundos antes de volver a intentar.
+    def _lanzar_refresco(self):
+        if self._fallo_reciente():
+            return
+        with self._lock:
+            if self._refrescando:
+                return
+            self._refrescando = True
+        self.ejecutar(self._refrescar)
+
+    # Funcionamiento: Indica si la fuente falló hace menos de 'espera_reintento' segundos.
+    def _fallo_reciente(self):
+        with self._lock:
+            return self._ultimo_fallo is not None and time.monotonic() - self._ultimo_fallo < self.espera_reintento
+
+    # Funcionamiento: Consulta la fuente y, si responde bien, actualiza memoria y disco.
+    # Si falla, registra una advertencia y conserva el valor anterior.
+    # En ambos casos despierta a las peticiones que esperaban la primera carga.
+    # Retorna el valor nuevo o None si no se pudo obtener.
+    def _refrescar(self):
+        try:
+            valor = float(self.fuente())
+        except Exception as e:
+            print(f"ADVERTENCIA: No se pudo obtener el valor de la UF. Usando el último valor conocido. Error: {e}")
+            with self._lock:
+                self._ultimo_fallo = time.monotonic()
+                self._refrescando = False
+                self._listo.notify_all()
+            return None
+
+        fecha = self.reloj().date()
+        with self._lock:
+            self._valor = valor
+            self._fecha = fecha
+            self._ultimo_fallo = None
+            self._ultimo_refresco = time.monotonic()
+            self._refrescando = False
+            self._listo.notify_all()
+        self._guardar_disco(valor, fecha)
+        return valor
+
+    # Funcionamiento: Carga el último valor bueno guardado en disco (si existe y es legible).
+    def _leer_disco(self):
+        if not self.ruta_cache or not self.ruta_cache.exists():
+            return
+        try:
+            with open(self.ruta_cache, 'r', encoding='utf-8') as f:
+                datos = json.load(f)
+            self._valor = float(datos['valor'])
+            self._fecha = datetime.strptime(datos['fecha'], '%Y-%m-%d').date()
+        except Exception as e:
+            print(f"ADVERTENCIA: No se pudo leer {self.ruta_cache.name}: {e}")
+
+    # Funcionamiento: Guarda el valor en disco (escribe un temporal y lo renombra, para no dejar
+    # un archivo a medio escribir si el proceso se corta).
+    def _guardar_disco(self, valor, fecha):
+        if not self.ruta_cache:
+            return
+        try:
+            self.ruta_cache.parent.mkdir(parents=True, exist_ok=True)
+            temporal = self.ruta_cache.with_suffix('.tmp')
+            with open(temporal, 'w', encoding='utf-8') as f:
+                json.dump({'valor': valor, 'fecha': fecha.isoformat()}, f)
+            os.replace(temporal, self.ruta_cache)
+        except Exception as e:
+            print(f"ADVERTENCIA: No se pudo guardar {self.ruta_cache.name}: {e}")
+
+
+_proveedor = None
+_proveedor_lock = threading.Lock()
+
+
+# Funcionamiento: Retorna el proveedor UF compartido por toda la app (se crea la primera vez).
+def obtener_proveedor_uf():
+    global _proveedor
+    with _proveedor_lock:
+        if _proveedor is None:
+            _proveedor = ProveedorUF(FuenteMindicador())
+        return _proveedor
+
+
+# Funcionamiento: Reemplaza el proveedor compartido (ej. en pruebas, con una fuente local falsa).
+def configurar_proveedor_uf(proveedor):
+    global _proveedor
+    with _proveedor_lock:
+        _proveedor = proveedor
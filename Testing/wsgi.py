@@ -3,6 +3,10 @@
 # El 'if __name__ == "__main__":' se usa solo si ejecutas este archivo directamente (ej. 'python wsgi.py'), iniciando el servidor en modo debug.
 
 from app import app
+from persistencia.base_datos import iniciar_invalidacion
+
+# Cada proceso del servidor escucha los cambios hechos por los demás (cachés e índice al día)
+iniciar_invalidacion()
 
 if __name__ == "__main__":
     app.run(debug=False) # "debug=True" permite que cualquier cambio en el codigo, el servidor se reinicie solo para aplicar los cambios
\ No newline at end of file
@@ -0,0 +1,98 @@
+-- MIGRACIONES DE LA BASE DE DATOS (Supabase / PostgreSQL)
+--
+-- Ejecutar en el editor SQL de Supabase (o con psql) antes de desplegar. Cada bloque se puede volver
+-- a ejecutar sin efecto si ya está aplicado. Si cambiaste los nombres de las tablas en el .env
+-- (SUPABASE_USERS_TABLE, SUPABASE_PROPIEDADES_TABLE, SUPABASE_CAMBIOS_TABLE), ajústalos aquí también.
+
+
+-- REGISTRO DE CAMBIOS DEL CATÁLOGO (ver persistencia/registro_cambios.py)
+--
+-- Cada alta, edición o baja de una propiedad agrega una fila con un número de secuencia ('seq').
+-- Ese número es la versión del catálogo que ven los clientes (ETag, /api/propiedades/cambios y
+-- /api/eventos), igual en todos los procesos de la app. Los cambios de nombre de un usuario anotan
+-- sus propiedades (cambia el 'propietario_nombre' que muestran las listas).
+-- Las filas viejas se pueden borrar cuando se quiera (ej. las de más de 7 días): los clientes con
+-- una versión anterior a las que quedan simplemente recargan la lista completa.
+--   delete from propiedades_cambios where creado < now() - interval '7 days';
+
+create table if not exists propiedades_cambios (
+    seq bigint generated always as identity primary key,
+    propiedad_id bigint not null,
+    eliminada boolean not null default false,
+    creado timestamptz not null default now()
+);
+
+create or replace function registrar_cambio_propiedad() returns trigger
+language plpgsql as $$
+begin
+    if tg_op = 'DELETE' then
+        insert into propiedades_cambios (propiedad_id, eliminada) values (old.id, true);
+    elsif tg_op = 'INSERT' or new is distinct from old then
+        insert into propiedades_cambios (propiedad_id) values (new.id);
+    end if;
+    return null;
+end $$;
+
+drop trigger if exists propiedades_registrar_cambio on propiedades;
+create trigger propiedades_registrar_cambio
+    after insert or update or delete on propiedades
+    for each row execute function registrar_cambio_propiedad();
+
+create or replace function registrar_cambio_propietario() returns trigger
+language plpgsql as $$
+begin
+    if tg_op = 'DELETE' or new.nombre is distinct from old.nombre or new.apellido is distinct from old.apellido then
+        insert into propiedades_cambios (propiedad_id)
+        select id from propiedades where propietario::text = old.id::text;
+    end if;
+    return null;
+end $$;
+
+drop trigger if exists users_registrar_cambio on users;
+create trigger users_registrar_cambio
+    after update or delete on users
+    for each row execute function registrar_cambio_propietario();
+
+
+-- GALERÍA DE IMÁGENES (ver persistencia/blobs.py, extraer_imagenes)
+--
+-- Lista canónica de imágenes de cada propiedad ('img' es la primera, la portada). Sin esta columna la app
+-- guarda solo la portada. Después de crearla, las filas antiguas se normalizan con:
+--   python -m persistencia.base_datos normalizar-imagenes
+
+alter table propiedades add column if not exists galeria jsonb;
+
+
+-- COORDENADAS ÚNICAS (ver coordenadas_en_uso y _ejecutar_escritura_propiedad en persistencia/base_datos.py)
+--
+-- La app revisa las coordenadas con su índice en memoria, pero el de otro proceso puede estar atrasado:
+-- este índice único es lo que impide que dos procesos guarden las mismas coordenadas (el error 23505 se
+-- responde como 400). Se indexa la forma normalizada, igual que clave_coordenadas (persistencia/indice_geo.py):
+-- "-35.0,-71.2" y "-35.0, -71.20" son la misma ("-35.000000,-71.200000"); lo que no son dos números válidos
+-- se compara sin espacios a los lados y en minúsculas. Si ya hay repetidas, el índice no se crea; se ven con:
+--   select clave_coordenadas(coordenadas), array_agg(id) from propiedades
+--   group by 1 having count(*) > 1;
+
+create or replace function clave_coordenadas(valor text) returns text
+language plpgsql immutable as $$
+declare
+    partes text[] := string_to_array(valor, ',');
+    lat double precision;
+    lng double precision;
+begin
+    if array_length(partes, 1) = 2 then
+        begin
+            lat := trim(partes[1])::double precision;
+            lng := trim(partes[2])::double precision;
+            if lat between -90 and 90 and lng between -180 and 180 then
+                return round(lat::numeric, 6)::text || ',' || round(lng::numeric, 6)::text;
+            end if;
+        exception when invalid_text_representation or numeric_value_out_of_range then
+            null;
+        end;
+    end if;
+    return nullif(lower(trim(valor)), '');
+end $$;
+
+drop index if exists propiedades_coordenadas_key;
+create unique index propiedades_coordenadas_key on propiedades (clave_coordenadas(coordenadas));